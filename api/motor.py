@@ -1,53 +1,147 @@
-import serial
+import logging
+import threading
+import time
+
 from PySide6.QtCore import QEventLoop, QTimer
 
+try:
+    from api.serial_metrics import METRICS
+    from api.transport import open_transport
+except Exception:
+    from serial_metrics import METRICS
+    from transport import open_transport
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Bits of the status byte that follows the address in every reply
+READY_BIT: int = 0x20
+ERROR_MASK: int = 0x0F
+
+ERROR_CODES: dict[int, str] = {
+    0: "No error",
+    1: "Initialization error",
+    2: "Bad command",
+    3: "Operand out of range",
+    5: "Communications error",
+    7: "Not initialized",
+    9: "Overload error",
+    11: "Move not allowed",
+    15: "Command overflow",
+}
+
+
+class MotorReply:
+    """A reply from the controller: /<address><status><payload><ETX>."""
+
+    __slots__ = ("address", "status", "payload")
+
+    def __init__(self, address: int, status: int, payload: bytes) -> None:
+        self.address: int = address
+        self.status: int = status
+        self.payload: bytes = payload
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.status & READY_BIT)
+
+    @property
+    def error_code(self) -> int:
+        return self.status & ERROR_MASK
+
+    def __repr__(self) -> str:
+        return (
+            f"MotorReply(address={self.address}, status={self.status:#04x}, "
+            f"payload={self.payload!r})"
+        )
+
+
+def parse_reply(raw_response: bytes) -> MotorReply | None:
+    """
+    Parse a raw reply in one pass over the bytes.
+
+    :return: the address, status byte and payload, or None when the reply is
+        empty, truncated or garbled
+    """
+    start: int = raw_response.find(b"/")
+    end: int = raw_response.find(b"\x03", start + 3)
+    if start < 0 or end < 0:
+        return None
+    return MotorReply(
+        raw_response[start + 1] - 48,  # ASCII digit
+        raw_response[start + 2],
+        raw_response[start + 3 : end],
+    )
+
 
 class MotorController:
-    def __init__(self, port, baud_rate=9600, address=1) -> None:
+    BAUD_RATES: tuple[int, ...] = (9600, 19200, 38400)
+
+    def __init__(
+        self, port, baud_rate=9600, address=1, transport=None, response_delay=0
+    ) -> None:
         """
         Initialize the Motor Controller.
 
-        :param port: COM port for the serial connection (e.g., '3' or 3).
+        :param port: COM port for the serial connection (e.g., '3' or 3), or
+            'tcp://host:port' of a serial device server.
         :type port: str or int
         :param baud_rate: Baud rate for the communication (default is 9600).
         :param address: Motor controller address (default is 1).
+        :param transport: Already open serial-like object to use instead of
+            opening the port (e.g. a PlaybackSerial).
+        :param response_delay: Extra seconds to wait before reading a reply.
+            The reply is read up to its line end within the port timeout, so
+            no delay is needed for the controller to respond.
         """
         self.port = port
         self.baud_rate = baud_rate
         self.address = address
-        self.serial = serial.Serial(port, baud_rate, timeout=1)
+        self.response_delay = response_delay
+        self.serial = transport or open_transport(port, baud_rate, timeout=1)
+        # Serialises command/reply exchanges between the GUI and polling
+        # threads. Reentrant so a caller can hold it across several commands;
+        # it is never held across a nested event loop, in which a GUI handler
+        # on the same thread could start a second exchange.
+        self.lock = threading.RLock()
+        self.last_reply: MotorReply | None = None
+        self.busy: bool = False
+        self.last_error: int = 0
         self.start_character = "/"
         self.end_character = "R"
         self.carriage_return = "\r"
 
     @staticmethod
     def pause(seconds: float) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            time.sleep(seconds)
+            return
         loop = QEventLoop()
         QTimer.singleShot(int(seconds * 1000), loop.quit)
         loop.exec()
 
+    @staticmethod
+    def _command_label(command: str) -> str:
+        """Return the command letter (and query number) without its operand."""
+        return command[:2] if command.startswith("?") else command[:1]
+
     def _decode_response(self, raw_response: bytes) -> str:
-        """Decode the raw response and extract the relevant part."""
-        # Decode and clean up the raw response
-        decoded_response: str = raw_response.decode(errors="ignore").strip()
-        # print(f'{decoded_response = }')
-
-        # Define split characters to try
-        split_chars: tuple[str, ...] = ("`", "@", "?", "c", "O", "b")
-
-        # Attempt to split the response using each character
-        for char in split_chars:
-            try:
-                result: str = decoded_response.split(char)[1][:-1]
-                return result
-            except IndexError:
-                continue  # Move to the next character if split fails
-            except Exception as e:
-                print(f'Error decoding response with "{char}": {e}')
-
-        # Log and return empty string if no split is successful
-        print("Could not decode response.")
-        return ""
+        """Parse the raw response, keep its status and return the payload."""
+        reply: MotorReply | None = parse_reply(raw_response)
+        self.last_reply = reply
+        if reply is None:
+            logger.warning("Could not decode response %r", raw_response)
+            if METRICS.enabled:
+                METRICS.count_decode_failure("motor", "reply")
+            return ""
+        self.busy = not reply.ready
+        self.last_error = reply.error_code
+        if reply.error_code:
+            logger.warning(
+                "Motor controller error %d: %s",
+                reply.error_code,
+                ERROR_CODES.get(reply.error_code, "Unknown error"),
+            )
+        return reply.payload.decode(errors="ignore")
 
     def send_command(self, command) -> str:
         """
@@ -58,14 +152,31 @@ class MotorController:
         """
         full_command = f"{self.start_character}{self.address}{command}{self.end_character}{self.carriage_return}"
         # print(f'{full_command = }')
-        self.serial.write(full_command.encode())
-        self.pause(0.1)  # Give the controller some time to respond
-        raw_response: bytes = self.serial.readline()
-        # print(f'{raw_response = }')
-        text: str = self._decode_response(raw_response)
+        with self.lock:
+            start: float = time.perf_counter() if METRICS.enabled else 0.0
+            self.serial.write(full_command.encode())
+            if self.response_delay:
+                time.sleep(self.response_delay)
+            # Blocks until the reply's line end or the port timeout
+            raw_response: bytes = self.serial.readline()
+            if METRICS.enabled:
+                label: str = self._command_label(command)
+                METRICS.observe("motor", label, time.perf_counter() - start)
+                if not raw_response.endswith(b"\n"):
+                    METRICS.count_timeout("motor", label)
+            # print(f'{raw_response = }')
+            text: str = self._decode_response(raw_response)
         # print(f'{text = }\n')
         return text
 
+    def is_busy(self) -> bool:
+        """
+        Query the controller status and return True while a command, such as
+        a move, is still executing.
+        """
+        self.send_command("Q")
+        return self.busy
+
     def set_current(self, running_current, holding_current) -> None:
         """
         Set the running and holding current.
@@ -120,7 +231,8 @@ class MotorController:
 
     def query_position(self) -> str:
         """
-        Query the current motor position.
+        Query the current motor position. The ready bit of the reply updates
+        self.busy, so polling loops need no separate status query.
 
         :return: Motor position.
         """
@@ -179,6 +291,32 @@ class MotorController:
         # print("Stop Command".upper())
         self.send_command("T")
 
+    def set_baud_rate(self, baud_rate: int) -> None:
+        """
+        Switch the controller and then the serial port to a new baud rate.
+        The controller acknowledges at the old rate.
+
+        :param baud_rate: One of BAUD_RATES.
+        """
+        if baud_rate not in self.BAUD_RATES:
+            raise ValueError(
+                f"{baud_rate} is not an acceptable value. Acceptable values: {self.BAUD_RATES}"
+            )
+        self.send_command(f"b{baud_rate}")
+        self.serial.baudrate = baud_rate
+        self.baud_rate = baud_rate
+
+    def check_link(self) -> bool:
+        """
+        Return True if the controller answers a position query with a well
+        formed reply.
+        """
+        try:
+            self.send_command("?0")
+        except (IOError, ValueError):
+            return False
+        return self.last_reply is not None
+
     def close_port(self) -> None:
         """
         Close the serial connection.
@@ -186,7 +324,7 @@ class MotorController:
         # print("Close Port Command".upper())
         self.serial.close()
         if self.serial.is_open is not True:
-            print("Motor serial port closed.")
+            logger.info("Motor serial port closed.")
 
 
 # Example usage in main.py:
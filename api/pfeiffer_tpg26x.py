@@ -5,9 +5,10 @@ Vacuum:
     Unit for Compact Gauges
 """
 
-import time
-
-import serial
+try:
+    from api.pressure_gauge import EnqGauge, GaugeCapabilities, register_gauge
+except Exception:
+    from pressure_gauge import EnqGauge, GaugeCapabilities, register_gauge
 
 # Code translations constants
 MEASUREMENT_STATUS = {
@@ -33,10 +34,10 @@ GAUGE_IDS = {
 PRESSURE_UNITS = {0: "mbar", 1: "Torr", 2: "Pascal"}
 
 
-class TPG26x(object):
+class TPG26x(EnqGauge):
     """Abstract class that implements the common driver for the TPG 261 and
     TPG 262 dual channel measurement and control unit. The driver implements
-    the following 6 commands out the 39 in the specification:
+    the following 8 commands out the 39 in the specification:
 
     * PNR: Program number (firmware version)
     * PR[1,2]: Pressure measurement (measurement data) gauge [1, 2]
@@ -44,26 +45,22 @@ class TPG26x(object):
     * TID: Transmitter identification (gauge identification)
     * UNI: Pressure unit
     * RST: RS232 test
+    * BAU: Transmission rate
+    * COM: Continuous mode
 
-    This class also contains the following class variables, for the specific
-    characters that are used in the communication:
-
-    :var ETX: End text (Ctrl-c), chr(3), \\x03
-    :var CR: Carriage return, chr(13), \\r
-    :var LF: Line feed, chr(10), \\n
-    :var ENQ: Enquiry, chr(5), \\x05
-    :var ACK: Acknowledge, chr(6), \\x06
-    :var NAK: Negative acknowledge, chr(21), \\x15
+    The command/ACK/ENQ framing and the communication characters ETX, CR, LF,
+    ENQ, ACK and NAK are inherited from EnqGauge.
     """
 
-    ETX = chr(3)  # \x03
-    CR = chr(13)  # \r
-    LF = chr(10)  # \n
-    ENQ = chr(5)  # \x05
-    ACK = chr(6)  # \x06
-    NAK = chr(21)  # \x15
+    BAUD_RATES = (9600, 19200, 38400)
+    METRICS_LABEL = "tpg26x"
+    MEASUREMENT_STATUS = MEASUREMENT_STATUS
+    # In continuous mode the unit sends both readings every 100 ms
+    capabilities = GaugeCapabilities(
+        streaming=True, dual_channel=True, unit_query=True, max_sample_rate=10
+    )
 
-    def __init__(self, port="/dev/ttyUSB0", baudrate=9600):
+    def __init__(self, port="/dev/ttyUSB0", baudrate=9600, transport=None):
         """Initialize internal variables and serial connection
 
         :param port: The COM port to open. See the documentation for
@@ -72,63 +69,11 @@ class TPG26x(object):
         :type port: str or int
         :param baudrate: 9600, 19200, 38400 where 9600 is the default
         :type baudrate: int
+        :param transport: Already open serial-like object to use instead of
+            opening the port (e.g. a PlaybackSerial)
         """
-        # The serial connection should be setup with the following parameters:
-        # 1 start bit, 8 data bits, No parity bit, 1 stop bit, no hardware
-        # handshake. These are all default for Serial and therefore not input
-        # below
-        self.serial = serial.Serial(port=port, baudrate=baudrate, timeout=1)
-
-    def _cr_lf(self, string):
-        """Pad carriage return and line feed to a string
-
-        :param string: String to pad
-        :type string: str
-        :returns: the padded string
-        :rtype: str
-        """
-        return string + self.CR + self.LF  # return '{string}\r\n'
-
-    def _send_command(self, command):
-        """Send a command and check if it is positively acknowledged
-
-        :param command: The command to send
-        :type command: str
-        :raises IOError: if the negative acknowledged or a unknown response
-            is returned
-        """
-        self.serial.write(
-            bytes(self._cr_lf(command), "utf-8")
-        )  # serial.write(b'{command}\r\n')
-        response = self.serial.readline().decode()
-        if response == self._cr_lf(self.NAK):  # if response == '\x15\r\n'
-            message = "Serial communication returned negative acknowledge"
-            raise IOError(message)
-        elif response != self._cr_lf(self.ACK):  # if response != '\x06\r\n'
-            message = "Serial communication returned unknown response:\n{}".format(
-                repr(response)
-            )
-            raise IOError(message)
-
-    def _get_data(self):
-        """Get the data that is ready on the device
-
-        :returns: the raw data
-        :rtype:str
-        """
-        self.serial.write(bytes(self.ENQ, "utf-8"))  # serial.write(b'\x05')
-        data = self.serial.readline().decode()
-        return data.rstrip(self.LF).rstrip(self.CR)
-
-    def _clear_output_buffer(self):
-        """Clear the output buffer"""
-        time.sleep(0.1)
-        just_read = "start value"
-        out = ""
-        while just_read != "":
-            just_read = self.serial.read().decode()
-            out += just_read
-        return out
+        super(TPG26x, self).__init__(port=port, baudrate=baudrate, transport=transport)
+        self.streaming = False
 
     def program_number(self):
         """Return the firmware version
@@ -140,7 +85,8 @@ class TPG26x(object):
         return self._get_data()
 
     def pressure_gauge(self, gauge=1):
-        """Return the pressure measured by gauge X
+        """Return the pressure measured by gauge X. In continuous mode this is
+        the newest reading the unit has sent.
 
         :param gauge: The gauge number, 1 or 2
         :type gauge: int
@@ -151,13 +97,48 @@ class TPG26x(object):
         if gauge not in [1, 2]:
             message = "The input gauge number can only be 1 or 2"
             raise ValueError(message)
-        self._send_command(
-            "PR" + str(gauge)
-        )  # serial.write(b'PR1\r\n') OR serial.write(b'PR2\r\n')
-        reply = self._get_data()
-        status_code = int(reply.split(",")[0])
-        value = float(reply.split(",")[1])
-        return value, (status_code, MEASUREMENT_STATUS[status_code])
+        with self.lock:
+            if self.streaming:
+                return self._parse_reading(self._read_stream(), gauge - 1)
+            self._send_command(
+                "PR" + str(gauge)
+            )  # serial.write(b'PR1\r\n') OR serial.write(b'PR2\r\n')
+            reply = self._get_data()
+        return self._parse_reading(reply)
+
+    def start_streaming(self):
+        """Switch to continuous mode, in which the unit sends the readings of
+        both gauges every 100 ms without being asked
+        """
+        with self.lock:
+            self._send_command("COM,0")  # serial.write(b'COM,0\r\n')
+            self.streaming = True
+
+    def stop_streaming(self):
+        """Leave continuous mode. Any command ends it; the readings still in
+        flight are discarded
+        """
+        with self.lock:
+            self.streaming = False
+            self.serial.write(bytes(self._cr_lf("PR1"), "utf-8"))
+            self._clear_output_buffer()
+
+    def _read_stream(self):
+        """Return the newest complete line of continuous mode
+
+        :raises IOError: if no reading arrives within the port timeout
+        :rtype: str
+        """
+        reply = self.serial.readline().decode()
+        # Readings queue up between calls, keep only the newest
+        while getattr(self.serial, "in_waiting", 0):
+            newer = self.serial.readline().decode()
+            if newer.endswith(self.LF):
+                reply = newer
+        if not reply.endswith(self.LF):
+            message = "No reading received in continuous mode"
+            raise IOError(message)
+        return reply.rstrip(self.LF).rstrip(self.CR)
 
     def pressure_gauges(self):
         """Return the pressures measured by the gauges
@@ -169,16 +150,7 @@ class TPG26x(object):
         self._send_command("PRX")  # serial.write(b'PRX\r\n')
         reply = self._get_data()
         # The reply is on the form: x,sx.xxxxEsxx,y,sy.yyyyEsyy
-        status_code1 = int(reply.split(",")[0])
-        value1 = float(reply.split(",")[1])
-        status_code2 = int(reply.split(",")[2])
-        value2 = float(reply.split(",")[3])
-        return (
-            value1,
-            (status_code1, MEASUREMENT_STATUS[status_code1]),
-            value2,
-            (status_code2, MEASUREMENT_STATUS[status_code2]),
-        )
+        return self._parse_reading(reply) + self._parse_reading(reply, 1)
 
     def gauge_identification(self):
         """Return the gauge identication
@@ -192,14 +164,16 @@ class TPG26x(object):
         return id1, GAUGE_IDS[id1], id2, GAUGE_IDS[id2]
 
     def pressure_unit(self):
-        """Return the pressure unit
+        """Return the pressure unit and keep it in self.unit
 
         :return: the pressure unit
         :rtype: str
         """
-        self._send_command("UNI")  # serial.write(b'UNI\r\n')
-        unit_code = int(self._get_data())
-        return PRESSURE_UNITS[unit_code]
+        with self.lock:
+            self._send_command("UNI")  # serial.write(b'UNI\r\n')
+            unit_code = int(self._get_data())
+        self.unit = PRESSURE_UNITS[unit_code]
+        return self.unit
 
     def rs232_communication_test(self):
         """RS232 communication test
@@ -217,6 +191,38 @@ class TPG26x(object):
         self._send_command(self.ETX)  # serial.write(b'\x03\r\n')
         return test_string_out == "a1"
 
+    def set_baud_rate(self, baudrate):
+        """Switch the controller and then the serial port to a new baud rate.
+        The controller acknowledges the command at the old rate.
+
+        :param baudrate: 9600, 19200 or 38400
+        :type baudrate: int
+        :raises ValueError: if the baud rate is not supported
+        """
+        if baudrate not in self.BAUD_RATES:
+            message = "The baud rate can only be one of {}".format(self.BAUD_RATES)
+            raise ValueError(message)
+        self._send_command(
+            "BAU," + str(self.BAUD_RATES.index(baudrate))
+        )  # serial.write(b'BAU,2\r\n')
+        self.serial.baudrate = baudrate
+        self._clear_output_buffer()
+
+    def check_link(self):
+        """Run the RS232 communication test without raising. In continuous
+        mode, which the test would end, check that readings arrive instead
+
+        :return: True if the test string came back unchanged
+        :rtype: bool
+        """
+        try:
+            if self.streaming:
+                self.pressure_gauge()
+                return True
+            return self.rs232_communication_test()
+        except (IOError, ValueError, KeyError, IndexError, UnicodeDecodeError):
+            return False
+
     def open_port(self):
         """Open the serial COM port
 
@@ -240,10 +246,11 @@ class TPG26x(object):
         return com_status
 
 
+@register_gauge("TPG262")
 class TPG262(TPG26x):
     """Driver for the TPG 262 dual channel measurement and control unit"""
 
-    def __init__(self, port="/dev/ttyUSB0", baudrate=9600):
+    def __init__(self, port="/dev/ttyUSB0", baudrate=9600, transport=None):
         """Initialize internal variables and serial connection
 
         :param port: The COM port to open. See the documentation for
@@ -252,14 +259,21 @@ class TPG262(TPG26x):
         :type port: str or int
         :param baudrate: 9600, 19200, 38400 where 9600 is the default
         :type baudrate: int
+        :param transport: Already open serial-like object to use instead of
+            opening the port (e.g. a PlaybackSerial)
         """
-        super(TPG262, self).__init__(port=port, baudrate=baudrate)
+        super(TPG262, self).__init__(port=port, baudrate=baudrate, transport=transport)
 
 
+@register_gauge("pfeiffer")
 class TPG261(TPG26x):
-    """Driver for the TPG 261 dual channel measurement and control unit"""
+    """Driver for the TPG 261 single channel measurement and control unit"""
+
+    capabilities = GaugeCapabilities(
+        streaming=True, dual_channel=False, unit_query=True, max_sample_rate=10
+    )
 
-    def __init__(self, port="/dev/ttyUSB0", baudrate=9600):
+    def __init__(self, port="/dev/ttyUSB0", baudrate=9600, transport=None):
         """Initialize internal variables and serial connection
 
         :param port: The COM port to open. See the documentation for
@@ -268,5 +282,7 @@ class TPG261(TPG26x):
         :type port: str or int
         :param baudrate: 9600, 19200, 38400 where 9600 is the default
         :type baudrate: int
+        :param transport: Already open serial-like object to use instead of
+            opening the port (e.g. a PlaybackSerial)
         """
-        super(TPG261, self).__init__(port=port, baudrate=baudrate)
+        super(TPG261, self).__init__(port=port, baudrate=baudrate, transport=transport)
@@ -0,0 +1,282 @@
+"""Common interface of the pressure gauge controllers.
+
+Every gauge ValveTest can read is a PressureSource and declares what it can do
+in a GaugeCapabilities, so the test picks its acquisition path from the
+capabilities instead of the driver class. EnqGauge implements the
+command/ACK/ENQ framing shared by the Pfeiffer TPG26x and the AGC-100, and
+drivers register a controller name with register_gauge so create_gauge can
+open them from the INI file setting.
+"""
+
+import logging
+import threading
+import time
+from typing import Protocol
+
+try:
+    from api.serial_metrics import METRICS
+    from api.transport import open_transport
+except Exception:
+    from serial_metrics import METRICS
+    from transport import open_transport
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class GaugeCapabilities:
+    """
+    What a gauge controller supports.
+
+    :param streaming: can send readings continuously after start_streaming()
+    :param dual_channel: has a second gauge on channel 2
+    :param unit_query: can report the unit its readings are in
+    :param max_sample_rate: new readings per second the controller produces
+    """
+
+    __slots__ = ("streaming", "dual_channel", "unit_query", "max_sample_rate")
+
+    def __init__(
+        self,
+        streaming: bool = False,
+        dual_channel: bool = False,
+        unit_query: bool = False,
+        max_sample_rate: float = float("inf"),
+    ) -> None:
+        self.streaming: bool = streaming
+        self.dual_channel: bool = dual_channel
+        self.unit_query: bool = unit_query
+        self.max_sample_rate: float = max_sample_rate
+
+    def __repr__(self) -> str:
+        return (
+            f"GaugeCapabilities(streaming={self.streaming}, "
+            f"dual_channel={self.dual_channel}, unit_query={self.unit_query}, "
+            f"max_sample_rate={self.max_sample_rate})"
+        )
+
+
+class PressureSource(Protocol):
+    """
+    What ValveTest and the safety monitor need from a gauge. Sources with
+    capabilities.streaming also have start_streaming() and stop_streaming();
+    pressure_gauge() then returns the newest streamed reading.
+    """
+
+    capabilities: GaugeCapabilities
+    unit: str
+    lock: threading.RLock
+
+    def pressure_gauge(self, gauge: int = 1) -> tuple[float, tuple[int, str]]: ...
+
+    def pressure_unit(self) -> str: ...
+
+    def check_link(self) -> bool: ...
+
+    def close_port(self) -> None: ...
+
+
+# Controller name in the INI file -> driver class
+GAUGE_CONTROLLERS: dict[str, type] = {}
+
+
+def register_gauge(name: str):
+    """Class decorator that makes a driver available to create_gauge."""
+
+    def register(cls: type) -> type:
+        GAUGE_CONTROLLERS[name] = cls
+        return cls
+
+    return register
+
+
+def create_gauge(controller: str, port: str, baudrate: int = 9600) -> PressureSource:
+    """
+    Open the gauge controller registered under controller.
+
+    :raises ValueError: if no driver is registered under that name
+    """
+    # Importing the drivers registers them
+    from api import agc100, pfeiffer_tpg26x  # noqa: F401
+
+    if controller not in GAUGE_CONTROLLERS:
+        raise ValueError(
+            f"Unsupported controller type: {controller}. "
+            f"Supported: {', '.join(GAUGE_CONTROLLERS)}"
+        )
+    return GAUGE_CONTROLLERS[controller](port=port, baudrate=baudrate)
+
+
+class EnqGauge:
+    """
+    Framing of the controllers that acknowledge a mnemonic with ACK or NAK and
+    send its data on an ENQ. Subclasses set METRICS_LABEL, MEASUREMENT_STATUS,
+    BAUD_RATES and capabilities.
+    """
+
+    ETX: str = chr(3)  # \x03
+    CR: str = chr(13)  # \r
+    LF: str = chr(10)  # \n
+    ENQ: str = chr(5)  # \x05
+    ACK: str = chr(6)  # \x06
+    NAK: str = chr(21)  # \x15
+    BAUD_RATES: tuple[int, ...] = (9600,)
+    METRICS_LABEL: str = "gauge"
+    MEASUREMENT_STATUS: dict[int, str] = {}
+    capabilities: GaugeCapabilities = GaugeCapabilities()
+
+    def __init__(
+        self, port: str = "/dev/ttyUSB0", baudrate: int = 9600, transport=None
+    ) -> None:
+        """
+        :param port: Device name such as 'COM1' or '/dev/ttyUSB0', or
+            'tcp://host:port' of a device server or Ethernet controller.
+        :param baudrate: One of BAUD_RATES.
+        :param transport: Already open serial-like object to use instead of
+            opening the port (e.g. a PlaybackSerial).
+        """
+        # The serial connection should be setup with the following parameters:
+        # 1 start bit, 8 data bits, No parity bit, 1 stop bit, no hardware
+        # handshake. These are all default for Serial and therefore not input
+        # below
+        self.serial = transport or open_transport(port, baudrate, timeout=1)
+        # Keeps a command and its data request together when several threads
+        # read the gauge
+        self.lock = threading.RLock()
+        # Unit of the readings, updated by pressure_unit() where supported
+        self.unit: str = "mbar"
+
+    def _cr_lf(self, string: str) -> str:
+        """
+        Pad carriage return and line feed to a string
+
+        :param string: String to pad
+        :type string: str
+        :returns: the padded string
+        :rtype: str
+        """
+        return string + self.CR + self.LF  # return '{string}\r\n'
+
+    def _send_command(self, command: str) -> None:
+        """
+        Send a command and check if it is positively acknowledged
+
+        :param command: The command to send
+        :type command: str
+        :raises IOError: if the negative acknowledged or a unknown response
+            is returned
+        """
+        start: float = time.perf_counter() if METRICS.enabled else 0.0
+        self.serial.write(
+            bytes(self._cr_lf(command), "utf-8")
+        )  # serial.write(b'{command}\r\n')
+        response: str = self.serial.readline().decode()
+        if METRICS.enabled:
+            METRICS.observe(self.METRICS_LABEL, command, time.perf_counter() - start)
+            if not response.endswith(self.LF):
+                METRICS.count_timeout(self.METRICS_LABEL, command)
+            elif response == self._cr_lf(self.NAK):
+                METRICS.count_nak(self.METRICS_LABEL, command)
+            elif response != self._cr_lf(self.ACK):
+                METRICS.count_decode_failure(self.METRICS_LABEL, command)
+        if response == self._cr_lf(self.NAK):  # if response == '\x15\r\n'
+            message = "Serial communication returned negative acknowledge"
+            raise IOError(message)
+        elif response != self._cr_lf(self.ACK):  # if response != '\x06\r\n'
+            message = "Serial communication returned unknown response:\n{}".format(
+                repr(response)
+            )
+            raise IOError(message)
+
+    def _get_data(self) -> str:
+        """
+        Get the data that is ready on the device
+
+        :returns: the raw data
+        :rtype:str
+        """
+        start: float = time.perf_counter() if METRICS.enabled else 0.0
+        self.serial.write(bytes(self.ENQ, "utf-8"))  # serial.write(b'\x05')
+        data: str = self.serial.readline().decode()
+        if METRICS.enabled:
+            METRICS.observe(self.METRICS_LABEL, "ENQ", time.perf_counter() - start)
+            if not data.endswith(self.LF):
+                METRICS.count_timeout(self.METRICS_LABEL, "ENQ")
+        return data.rstrip(self.LF).rstrip(self.CR)
+
+    def _clear_output_buffer(self) -> str:
+        """Clear the output buffer"""
+        time.sleep(0.1)
+        just_read = "start value"
+        out = ""
+        while just_read != "":
+            just_read = self.serial.read().decode()
+            out += just_read
+        return out
+
+    def _parse_reading(
+        self, reply: str, index: int = 0
+    ) -> tuple[float, tuple[int, str]]:
+        """
+        Parse the index-th status,value pair of a reply such as
+        '0,1.2340E-07'.
+        """
+        fields: list[str] = reply.split(",")
+        status_code = int(fields[2 * index])
+        value = float(fields[2 * index + 1])
+        return value, (status_code, self.MEASUREMENT_STATUS[status_code])
+
+    def pressure_gauge(self, gauge: int = 1) -> tuple[float, tuple[int, str]]:
+        """
+        Return the pressure measured by gauge X
+
+        :param gauge: The gauge number, 1 or 2
+        :type gauge: int
+        :raises ValueError: if gauge is not 1 or 2
+        :return: (value, (status_code, status_message))
+        :rtype: tuple
+        """
+        if gauge not in [1, 2]:
+            message = "The input gauge number can only be 1 or 2"
+            raise ValueError(message)
+        with self.lock:
+            self._send_command(
+                "PR" + str(gauge)
+            )  # serial.write(b'PR1\r\n') OR serial.write(b'PR2\r\n')
+            reply = self._get_data()
+        return self._parse_reading(reply)
+
+    def pressure_unit(self) -> str:
+        """
+        Return the pressure unit of the readings.
+        """
+        return self.unit
+
+    def set_baud_rate(self, baudrate: int) -> None:
+        """
+        Only set the serial port; controllers that can change their own rate
+        override this.
+
+        :raises ValueError: if the baud rate is not supported
+        """
+        if baudrate not in self.BAUD_RATES:
+            message = f"The baud rate can only be one of {self.BAUD_RATES}"
+            raise ValueError(message)
+        self.serial.baudrate = baudrate
+
+    def check_link(self) -> bool:
+        """
+        Return True if the controller answers a pressure reading.
+        """
+        try:
+            self.pressure_gauge()
+        except (IOError, ValueError, KeyError, IndexError, UnicodeDecodeError):
+            return False
+        return True
+
+    def close_port(self) -> None:
+        """
+        Close the serial connection.
+        """
+        self.serial.close()
+        if self.serial.is_open is not True:
+            logger.info("Pressure gauge serial port closed.")
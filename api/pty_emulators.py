@@ -0,0 +1,560 @@
+"""Byte level emulators of the motor controller and pressure gauges on
+pseudo-terminals or local TCP ports.
+
+StepperProtocol speaks the EZStepper "/1<command>R\\r" protocol and
+GaugeProtocol the command/ACK/ENQ protocol shared by the TPG26x and AGC100,
+including the continuous mode of the TPG26x.
+Both answer from the simulated test stand of api.simulator running in real
+time, so the gauge reads a pressure that follows the emulated valve. The
+protocols only turn request bytes into reply bytes; PtyEmulator carries those
+bytes over a pseudo-terminal, or a TCP port like a serial device server, and
+injects response latency, jitter and dropped bytes, so the unmodified drivers
+open the slave end like a COM port, or the tcp:// address like a network
+device.
+
+Usage:
+    python -m api.pty_emulators serve [OPTIONS]
+    python -m api.pty_emulators stress motor|tpg26x|agc100 [COUNT] [OPTIONS]
+
+Options:
+    --latency SECONDS   delay before each reply (default 0.005)
+    --jitter SECONDS    extra random delay of up to this much (default 0)
+    --drop PROBABILITY  chance that each reply byte is lost (default 0)
+    --nak PROBABILITY   chance that the gauge refuses a command (default 0)
+    --seed N            seed of the fault injection
+    --tcp PORT          serve the motor on this TCP port and the gauge on the
+                        next one instead of on pseudo-terminals (0: any free)
+"""
+
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import tty
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+try:
+    from api.simulator import SimulatedGauge, SimulatedMotor, VacuumSystem
+except Exception:
+    from simulator import SimulatedGauge, SimulatedMotor, VacuumSystem
+
+ETX: bytes = b"\x03"
+ENQ: bytes = b"\x05"
+ACK: bytes = b"\x06"
+NAK: bytes = b"\x15"
+CR_LF: bytes = b"\r\n"
+
+# Status byte of a stepper reply before the ready bit and error code are set
+STEPPER_STATUS_BASE: int = 0x40
+BAD_COMMAND: int = 2
+
+GAUGE_MNEMONICS: tuple[str, ...] = (
+    "PR1",
+    "PR2",
+    "PRX",
+    "UNI",
+    "PNR",
+    "TID",
+    "RST",
+    "BAU",
+    "COM",
+)
+# Continuous mode setting -> seconds between readings
+STREAM_INTERVALS: dict[str, float] = {"0": 0.1, "1": 1.0, "2": 60.0}
+
+
+class WallClock:
+    """Clock for the simulated devices when they answer in real time."""
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def pause(seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class StepperProtocol:
+    """
+    Turns EZStepper commands into the controller's replies:
+    0xFF /0 <status> <payload> ETX CR LF. Commands to other addresses are
+    ignored, like on a shared bus.
+    """
+
+    def __init__(self, motor: SimulatedMotor, address: int = 1) -> None:
+        self.motor: SimulatedMotor = motor
+        self.address: str = str(address)
+        self.buffer: bytes = b""
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Take received bytes and return the replies they complete."""
+        self.buffer += data
+        replies: list[bytes] = []
+        while b"\r" in self.buffer:
+            line, _, self.buffer = self.buffer.partition(b"\r")
+            start: int = line.find(b"/")
+            if start < 0 or not line.endswith(b"R"):
+                continue
+            text: str = line[start + 1 : -1].decode(errors="ignore")
+            if text[:1] not in (self.address, "_"):
+                continue
+            replies.append(self._execute(text[1:]))
+        return replies
+
+    def poll(self) -> list[bytes]:
+        """The controller only speaks when spoken to."""
+        return []
+
+    def _execute(self, command: str) -> bytes:
+        letter, operand = command[:1], command[1:]
+        payload: str = ""
+        error_code: int = 0
+        try:
+            if command == "?0":
+                payload = self.motor.query_position()
+            elif command == "?6":
+                payload = "1"
+                self.motor.send_command(command)
+            elif letter == "A":
+                self.motor.move_absolute(int(operand))
+            elif letter == "P":
+                self.motor.move_relative(int(operand))
+            elif letter == "D":
+                self.motor.move_relative(-int(operand))
+            elif letter == "T":
+                self.motor.stop()
+            elif letter == "z":
+                self.motor.set_zero()
+            elif letter == "V":
+                self.motor.set_velocity_and_acceleration(
+                    int(operand), self.motor.acceleration
+                )
+            elif letter == "L":
+                self.motor.set_velocity_and_acceleration(
+                    self.motor.velocity, int(operand)
+                )
+            elif letter in ("Q", "m", "h", "F", "j", "b"):
+                self.motor.send_command(command)
+            else:
+                error_code = BAD_COMMAND
+        except ValueError:
+            error_code = BAD_COMMAND
+        reply = self.motor.last_reply
+        status: int = STEPPER_STATUS_BASE | (reply.status if reply is not None else 0)
+        if error_code:
+            status = (status & ~0x0F) | error_code
+        return b"\xff/0" + bytes([status]) + payload.encode() + ETX + CR_LF
+
+
+class GaugeProtocol:
+    """
+    Turns TPG26x and AGC100 mnemonics into ACK or NAK, and an ENQ into the
+    data of the last acknowledged command. RST enters the RS232 test mode, in
+    which every byte is echoed until ETX. COM,n starts continuous mode, in
+    which readings are sent every 100 ms, 1 s or 1 min until the next command.
+
+    :param nak_rate: probability of refusing a valid command with NAK
+    """
+
+    def __init__(
+        self,
+        gauge: SimulatedGauge,
+        nak_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.gauge: SimulatedGauge = gauge
+        self.nak_rate: float = nak_rate
+        self.rng = np.random.default_rng(seed)
+        self.buffer: bytes = b""
+        self.command: str = ""
+        self.test_mode: bool = False
+        # Seconds between readings in continuous mode, None when off
+        self.stream_interval: float | None = None
+        self.next_stream_time: float = 0.0
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Take received bytes and return the replies they complete."""
+        replies: list[bytes] = []
+        for byte in data:
+            char: bytes = bytes([byte])
+            if self.test_mode:
+                if char == ETX:
+                    self.test_mode = False
+                    self.buffer = ETX
+                else:
+                    replies.append(char)
+            elif char == ENQ:
+                self.buffer = b""
+                replies.append(self._data() + CR_LF)
+            elif char == b"\n":
+                line: str = self.buffer.rstrip(b"\r").decode(errors="ignore")
+                self.buffer = b""
+                replies.append(self._acknowledge(line) + CR_LF)
+            else:
+                self.buffer += char
+        return replies
+
+    def poll(self) -> list[bytes]:
+        """Return the readings of continuous mode that are due."""
+        if self.stream_interval is None:
+            return []
+        now: float = self.gauge.clock.now()
+        if now < self.next_stream_time:
+            return []
+        self.next_stream_time = now + self.stream_interval
+        return [f"{self._reading()},{self._reading()}".encode() + CR_LF]
+
+    def _acknowledge(self, line: str) -> bytes:
+        # Any command ends continuous mode
+        self.stream_interval = None
+        if line == ETX.decode():
+            return ACK
+        mnemonic: str = line.split(",")[0]
+        if mnemonic not in GAUGE_MNEMONICS:
+            return NAK
+        if self.rng.random() < self.nak_rate:
+            return NAK
+        self.command = line
+        self.test_mode = mnemonic == "RST"
+        if mnemonic == "COM":
+            self.stream_interval = STREAM_INTERVALS.get(line.split(",")[-1], 1.0)
+            self.next_stream_time = 0.0
+        return ACK
+
+    def _reading(self) -> str:
+        value, (status_code, _) = self.gauge.pressure_gauge()
+        return f"{status_code},{value:.4E}"
+
+    def _data(self) -> bytes:
+        mnemonic: str = self.command.split(",")[0]
+        if mnemonic in ("PR1", "PR2"):
+            data: str = self._reading()
+        elif mnemonic == "PRX":
+            data = f"{self._reading()},{self._reading()}"
+        elif mnemonic == "UNI":
+            data = "0"
+        elif mnemonic == "PNR":
+            data = "302-000-A"
+        elif mnemonic == "TID":
+            data = "PKR,noSEn"
+        elif mnemonic == "BAU":
+            data = self.command.split(",")[-1]
+        else:
+            return NAK
+        return data.encode()
+
+
+class Emulator(ABC):
+    """
+    Serves a protocol from a background thread over a byte channel that
+    subclasses open, injecting response latency, jitter and lost bytes.
+
+    :param latency: seconds before each reply
+    :param jitter: up to this many seconds added to the latency at random
+    :param drop_rate: probability that each reply byte is lost
+    """
+
+    def __init__(
+        self,
+        protocol: StepperProtocol | GaugeProtocol,
+        latency: float = 0.005,
+        jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.protocol: StepperProtocol | GaugeProtocol = protocol
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.drop_rate: float = drop_rate
+        self.rng = np.random.default_rng(seed)
+        self.running: bool = False
+        self.thread: threading.Thread | None = None
+
+    @property
+    @abstractmethod
+    def port(self) -> str:
+        """Port setting the drivers open to talk to the emulator."""
+
+    def start(self) -> None:
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._close()
+
+    def _run(self) -> None:
+        while self.running:
+            data: bytes | None = self._receive(0.01)
+            replies: list[bytes] = self.protocol.poll()
+            if data:
+                replies.extend(self.protocol.feed(data))
+            for reply in replies:
+                self._send(reply)
+
+    def _send(self, reply: bytes) -> None:
+        delay: float = self.latency + self.jitter * self.rng.random()
+        if delay > 0:
+            time.sleep(delay)
+        if self.drop_rate:
+            kept: np.ndarray = self.rng.random(len(reply)) >= self.drop_rate
+            reply = bytes(byte for byte, keep in zip(reply, kept) if keep)
+        if reply:
+            self._write(reply)
+
+    @abstractmethod
+    def _receive(self, timeout: float) -> bytes | None:
+        """Return the bytes received within timeout seconds, if any."""
+
+    @abstractmethod
+    def _write(self, data: bytes) -> None:
+        """Send data to the driver."""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """Release the channel."""
+
+
+class PtyEmulator(Emulator):
+    """
+    Serves a protocol on a pseudo-terminal. Open slave_path with
+    serial.Serial to talk to it.
+    """
+
+    def __init__(
+        self,
+        protocol: StepperProtocol | GaugeProtocol,
+        latency: float = 0.005,
+        jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        super().__init__(protocol, latency, jitter, drop_rate, seed)
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.slave_path: str = os.ttyname(self.slave_fd)
+
+    @property
+    def port(self) -> str:
+        return self.slave_path
+
+    def _receive(self, timeout: float) -> bytes | None:
+        readable, _, _ = select.select([self.master_fd], [], [], timeout)
+        if not readable:
+            return None
+        try:
+            return os.read(self.master_fd, 1024)
+        except OSError:
+            return None
+
+    def _write(self, data: bytes) -> None:
+        os.write(self.master_fd, data)
+
+    def _close(self) -> None:
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+
+class TcpEmulator(Emulator):
+    """
+    Serves a protocol on a local TCP port like a serial device server, one
+    client at a time. Drivers open ``tcp://127.0.0.1:<tcp_port>``.
+
+    :param tcp_port: port to listen on, 0 for any free port
+    """
+
+    def __init__(
+        self,
+        protocol: StepperProtocol | GaugeProtocol,
+        latency: float = 0.005,
+        jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int | None = None,
+        tcp_port: int = 0,
+    ) -> None:
+        super().__init__(protocol, latency, jitter, drop_rate, seed)
+        self.server: socket.socket = socket.create_server(("127.0.0.1", tcp_port))
+        self.tcp_port: int = self.server.getsockname()[1]
+        self.client: socket.socket | None = None
+
+    @property
+    def port(self) -> str:
+        return f"tcp://127.0.0.1:{self.tcp_port}"
+
+    def disconnect(self) -> None:
+        """Drop the client connection, like a restarting device server."""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def _receive(self, timeout: float) -> bytes | None:
+        channel: socket.socket = self.client or self.server
+        readable, _, _ = select.select([channel], [], [], timeout)
+        if not readable:
+            return None
+        if self.client is None:
+            self.client, _ = self.server.accept()
+            return None
+        try:
+            data: bytes = self.client.recv(1024)
+        except OSError:
+            data = b""
+        if not data:
+            self.disconnect()
+        return data
+
+    def _write(self, data: bytes) -> None:
+        if self.client is None:
+            return
+        try:
+            self.client.sendall(data)
+        except OSError:
+            self.disconnect()
+
+    def _close(self) -> None:
+        self.disconnect()
+        self.server.close()
+
+
+def create_emulators(
+    latency: float = 0.005,
+    jitter: float = 0.0,
+    drop_rate: float = 0.0,
+    nak_rate: float = 0.0,
+    seed: int | None = None,
+    tcp_port: int | None = None,
+) -> tuple[Emulator, Emulator]:
+    """
+    Build a motor and a gauge emulator that share one simulated test stand.
+
+    :param tcp_port: serve the motor on this TCP port and the gauge on the
+        next one instead of on pseudo-terminals; 0 picks free ports
+    :return: (motor emulator, gauge emulator), not started
+    """
+    clock = WallClock()
+    motor = SimulatedMotor(clock, command_time=0)  # type: ignore
+    system = VacuumSystem(motor)
+    gauge = SimulatedGauge(clock, system, command_time=0, seed=seed)  # type: ignore
+    motor_protocol = StepperProtocol(motor)
+    gauge_protocol = GaugeProtocol(gauge, nak_rate, seed)
+    if tcp_port is None:
+        return (
+            PtyEmulator(motor_protocol, latency, jitter, drop_rate, seed),
+            PtyEmulator(gauge_protocol, latency, jitter, drop_rate, seed),
+        )
+    return (
+        TcpEmulator(motor_protocol, latency, jitter, drop_rate, seed, tcp_port),
+        TcpEmulator(
+            gauge_protocol,
+            latency,
+            jitter,
+            drop_rate,
+            seed,
+            tcp_port + 1 if tcp_port else 0,
+        ),
+    )
+
+
+def stress(device: str, port: str, count: int) -> None:
+    """
+    Run count readings through the unmodified driver and print how many
+    failed and how long the good ones took.
+    """
+    if device == "motor":
+        from api.motor import MotorController
+
+        driver = MotorController(port, response_delay=0)
+        operation = driver.query_position
+    elif device in ("tpg26x", "agc100"):
+        if device == "tpg26x":
+            from api.pfeiffer_tpg26x import TPG26x as Gauge
+        else:
+            from api.agc100 import AGC100 as Gauge
+
+        driver = Gauge(port)
+        operation = driver.pressure_gauge
+    else:
+        raise ValueError(f"Unsupported device: {device}")
+    durations: list[float] = []
+    failures: dict[str, int] = {}
+    for _ in range(count):
+        start: float = time.perf_counter()
+        try:
+            operation()
+        except (IOError, ValueError, KeyError, IndexError, UnicodeDecodeError) as e:
+            failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+            continue
+        durations.append(time.perf_counter() - start)
+    driver.close_port()
+    print(f"{device}: {len(durations)} of {count} readings succeeded")
+    for name, number in sorted(failures.items()):
+        print(f"  {name}: {number}")
+    if durations:
+        milliseconds: np.ndarray = np.array(durations) * 1000
+        print(
+            f"  median {np.median(milliseconds):.2f} ms, "
+            f"95th percentile {np.percentile(milliseconds, 95):.2f} ms, "
+            f"max {milliseconds.max():.2f} ms"
+        )
+
+
+def _parse_options(args: list[str]) -> tuple[list[str], dict[str, float]]:
+    positional: list[str] = []
+    options: dict[str, float] = {}
+    while args:
+        arg: str = args.pop(0)
+        if arg.startswith("--") and args:
+            options[arg[2:]] = float(args.pop(0))
+        else:
+            positional.append(arg)
+    return positional, options
+
+
+def main() -> None:
+    positional, options = _parse_options(sys.argv[1:])
+    if not positional or positional[0] not in ("serve", "stress"):
+        print(__doc__)
+        return
+    seed: float | None = options.get("seed")
+    tcp_port: float | None = options.get("tcp")
+    motor_emulator, gauge_emulator = create_emulators(
+        latency=options.get("latency", 0.005),
+        jitter=options.get("jitter", 0.0),
+        drop_rate=options.get("drop", 0.0),
+        nak_rate=options.get("nak", 0.0),
+        seed=int(seed) if seed is not None else None,
+        tcp_port=int(tcp_port) if tcp_port is not None else None,
+    )
+    motor_emulator.start()
+    gauge_emulator.start()
+    try:
+        if positional[0] == "serve":
+            print(f"Motor: {motor_emulator.port}")
+            print(f"Pressure gauge: {gauge_emulator.port}")
+            print("Press Ctrl+C to stop.")
+            while True:
+                time.sleep(1)
+        else:
+            device: str = positional[1] if len(positional) > 1 else "motor"
+            count: int = int(positional[2]) if len(positional) > 2 else 1000
+            emulator: Emulator = motor_emulator if device == "motor" else gauge_emulator
+            stress(device, emulator.port, count)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        motor_emulator.stop()
+        gauge_emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
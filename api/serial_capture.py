@@ -0,0 +1,242 @@
+"""Byte level recorder and player for the serial traffic of the device drivers.
+
+RecordingSerial wraps an open ``serial.Serial`` and appends every write and
+read, with a timestamp, to a capture file. PlaybackSerial reads a capture file
+and answers the driver's reads with the recorded bytes, so MotorController,
+TPG26x and AGC100 can be run against real world traffic, including partial
+and garbled replies, without hardware.
+
+Capture file layout: the MAGIC header, then one record per transfer made of a
+RECORD header (timestamp in seconds since the start of the capture, kind
+b"W" or b"R", payload length) followed by the payload bytes. A read that timed
+out is recorded with whatever bytes arrived, possibly none. Every record is
+flushed to disk as it is made, so a crash loses at most the record being
+written.
+
+Usage:
+    python -m api.serial_capture dump CAPTURE_FILE
+    python -m api.serial_capture replay CAPTURE_FILE motor|tpg26x|agc100
+"""
+
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+MAGIC: bytes = b"VTCAP1\n"
+RECORD: struct.Struct = struct.Struct("<dcI")
+WRITE: bytes = b"W"
+READ: bytes = b"R"
+
+
+class RecordingSerial:
+    """
+    Transparent wrapper around a serial port that records every transfer.
+    Attributes that are not transfers (baudrate, is_open, ...) are passed
+    through to the wrapped port.
+    """
+
+    def __init__(self, port, capture_path: Path) -> None:
+        self._port = port
+        capture_path.parent.mkdir(parents=True, exist_ok=True)
+        self._capture = open(capture_path, mode="wb")
+        self._capture.write(MAGIC)
+        self._start: float = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self._port, name)
+
+    @property
+    def baudrate(self) -> int:
+        return self._port.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate: int) -> None:
+        self._port.baudrate = baudrate
+
+    def _record(self, kind: bytes, payload: bytes) -> None:
+        header: bytes = RECORD.pack(
+            time.perf_counter() - self._start, kind, len(payload)
+        )
+        with self._lock:
+            self._capture.write(header + payload)
+            # Keep the capture on disk if the application crashes or is killed
+            self._capture.flush()
+
+    def write(self, data: bytes) -> int | None:
+        self._record(WRITE, bytes(data))
+        return self._port.write(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data: bytes = self._port.read(size)
+        self._record(READ, data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        data: bytes = self._port.readline(size)
+        self._record(READ, data)
+        return data
+
+    def reopen(self) -> None:
+        """Reopen the wrapped port and keep recording to the same file."""
+        try:
+            self._port.close()
+        except OSError:
+            pass
+        self._port.open()
+
+    def close(self) -> None:
+        self._port.close()
+        with self._lock:
+            if not self._capture.closed:
+                self._capture.close()
+
+
+def load_capture(capture_path: Path) -> list[tuple[float, bytes, bytes]]:
+    """
+    Load a capture file.
+
+    :return: (timestamp, kind, payload) per transfer
+    :rtype: list
+    """
+    data: bytes = capture_path.read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{capture_path} is not a serial capture file")
+    events: list[tuple[float, bytes, bytes]] = []
+    offset: int = len(MAGIC)
+    while offset + RECORD.size <= len(data):
+        timestamp, kind, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break  # the last record of a capture cut short by a crash
+        events.append((timestamp, kind, data[offset : offset + length]))
+        offset += length
+    return events
+
+
+class PlaybackSerial:
+    """
+    Serial port stand-in that answers reads from a capture file. Reads return
+    the recorded bytes in order; when the capture is exhausted they return
+    b"" like a timed out port.
+
+    :param strict: raise IOError when the driver writes something other than
+        what was recorded
+    """
+
+    def __init__(
+        self,
+        capture_path: Path,
+        strict: bool = False,
+        baudrate: int = 9600,
+        timeout: float = 1,
+    ) -> None:
+        self.events: list[tuple[float, bytes, bytes]] = load_capture(capture_path)
+        self.position: int = 0
+        self.strict: bool = strict
+        self.baudrate: int = baudrate
+        self.timeout: float = timeout
+        self.is_open: bool = True
+
+    def _next(self, kind: bytes) -> bytes | None:
+        # Skip transfers of the other kind that the driver did not repeat
+        while self.position < len(self.events):
+            _, event_kind, payload = self.events[self.position]
+            self.position += 1
+            if event_kind == kind:
+                return payload
+            if self.strict:
+                raise IOError(
+                    f"Capture expected a {event_kind.decode()} at transfer "
+                    f"{self.position - 1}, got a {kind.decode()}"
+                )
+        return None
+
+    def write(self, data: bytes) -> int:
+        recorded: bytes | None = self._next(WRITE)
+        if self.strict and recorded != bytes(data):
+            raise IOError(f"Capture expected write {recorded!r}, got {bytes(data)!r}")
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        payload: bytes | None = self._next(READ)
+        return payload[:size] if payload is not None else b""
+
+    def readline(self, size: int = -1) -> bytes:
+        payload: bytes | None = self._next(READ)
+        return payload if payload is not None else b""
+
+    def reset_input_buffer(self) -> None:
+        pass
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def rewind(self) -> None:
+        self.position = 0
+
+
+def replay_capture(capture_path: Path, device: str) -> list:
+    """
+    Feed a capture back through an unmodified driver by repeating each
+    recorded command with the driver's own send and parse methods.
+
+    :param device: 'motor', 'tpg26x' or 'agc100'
+    :return: the parsed reply, or the exception raised, of every command
+    """
+    transport = PlaybackSerial(capture_path)
+    writes: list[bytes] = [
+        payload for _, kind, payload in transport.events if kind == WRITE
+    ]
+    results: list = []
+    if device == "motor":
+        from api.motor import MotorController
+
+        motor = MotorController("capture", transport=transport, response_delay=0)
+        for payload in writes:
+            command: str = payload.decode(errors="ignore").strip()[2:-1]
+            results.append(_call(motor.send_command, command))
+    elif device in ("tpg26x", "agc100"):
+        if device == "tpg26x":
+            from api.pfeiffer_tpg26x import TPG26x as Gauge
+        else:
+            from api.agc100 import AGC100 as Gauge
+
+        gauge = Gauge("capture", transport=transport)
+        for payload in writes:
+            if payload == Gauge.ENQ.encode():
+                results.append(_call(gauge._get_data))
+            else:
+                results.append(_call(gauge._send_command, payload.decode().strip()))
+    else:
+        raise ValueError(f"Unsupported device: {device}")
+    return results
+
+
+def _call(function, *args):
+    try:
+        return function(*args)
+    except Exception as e:
+        return e
+
+
+def main() -> None:
+    if len(sys.argv) < 3 or sys.argv[1] not in ("dump", "replay"):
+        print(__doc__)
+        return
+    capture_path: Path = Path(sys.argv[2])
+    if sys.argv[1] == "dump":
+        for timestamp, kind, payload in load_capture(capture_path):
+            print(f"{timestamp:10.4f} {kind.decode()} {payload!r}")
+    else:
+        for result in replay_capture(capture_path, sys.argv[3]):
+            print(repr(result))
+
+
+if __name__ == "__main__":
+    main()
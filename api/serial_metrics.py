@@ -0,0 +1,192 @@
+"""Low overhead latency and error counters for the serial device drivers.
+
+Every driver checks ``METRICS.enabled`` before it reads the clock, so setting
+it to False at runtime turns the instrumentation off at the cost of one
+attribute lookup per command.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.15,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+class LatencyHistogram:
+    """Fixed bucket latency histogram for one device command."""
+
+    __slots__ = ("bucket_counts", "count", "total", "maximum")
+
+    def __init__(self) -> None:
+        # The last bucket counts the observations above LATENCY_BUCKETS[-1]
+        self.bucket_counts: list[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.maximum: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket that holds quantile q."""
+        if self.count == 0:
+            return 0.0
+        rank: float = q * self.count
+        cumulative: int = 0
+        for upper_bound, bucket_count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return upper_bound
+        return self.maximum
+
+
+class SerialMetrics:
+    """
+    Per device and command latency histograms plus timeout, negative
+    acknowledge and decode failure counters.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = True
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple[str, str], LatencyHistogram] = {}
+        self.timeouts: dict[tuple[str, str], int] = {}
+        self.naks: dict[tuple[str, str], int] = {}
+        self.decode_failures: dict[tuple[str, str], int] = {}
+
+    def observe(self, device: str, command: str, seconds: float) -> None:
+        key: tuple[str, str] = (device, command)
+        with self._lock:
+            histogram: LatencyHistogram | None = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def _increment(
+        self, counter: dict[tuple[str, str], int], device: str, command: str
+    ) -> None:
+        key: tuple[str, str] = (device, command)
+        with self._lock:
+            counter[key] = counter.get(key, 0) + 1
+
+    def count_timeout(self, device: str, command: str) -> None:
+        self._increment(self.timeouts, device, command)
+
+    def count_nak(self, device: str, command: str) -> None:
+        self._increment(self.naks, device, command)
+
+    def count_decode_failure(self, device: str, command: str) -> None:
+        self._increment(self.decode_failures, device, command)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.timeouts.clear()
+            self.naks.clear()
+            self.decode_failures.clear()
+
+    def summary(self) -> str:
+        """Return a table with one row per device command."""
+        with self._lock:
+            keys: list[tuple[str, str]] = sorted(
+                set(self.histograms)
+                | set(self.timeouts)
+                | set(self.naks)
+                | set(self.decode_failures)
+            )
+            lines: list[str] = [
+                f"{'device':<8} {'command':<8} {'count':>6} {'mean ms':>8} "
+                f"{'p95 ms':>7} {'max ms':>7} {'timeout':>7} {'NAK':>4} {'decode':>6}"
+            ]
+            for device, command in keys:
+                histogram: LatencyHistogram = self.histograms.get(
+                    (device, command), LatencyHistogram()
+                )
+                mean: float = (
+                    histogram.total / histogram.count if histogram.count else 0
+                )
+                lines.append(
+                    f"{device:<8} {command:<8} {histogram.count:>6} "
+                    f"{mean * 1000:>8.1f} {histogram.quantile(0.95) * 1000:>7.0f} "
+                    f"{histogram.maximum * 1000:>7.1f} "
+                    f"{self.timeouts.get((device, command), 0):>7} "
+                    f"{self.naks.get((device, command), 0):>4} "
+                    f"{self.decode_failures.get((device, command), 0):>6}"
+                )
+        return "\n".join(lines)
+
+    def _exposition(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        lines: list[str] = [
+            "# HELP valve_test_serial_latency_seconds Serial command round trip time.",
+            "# TYPE valve_test_serial_latency_seconds histogram",
+        ]
+        with self._lock:
+            for (device, command), histogram in sorted(self.histograms.items()):
+                labels: str = f'device="{device}",command="{_escape(command)}"'
+                cumulative: int = 0
+                for upper_bound, bucket_count in zip(
+                    LATENCY_BUCKETS, histogram.bucket_counts
+                ):
+                    cumulative += bucket_count
+                    lines.append(
+                        f"valve_test_serial_latency_seconds_bucket"
+                        f'{{{labels},le="{upper_bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f"valve_test_serial_latency_seconds_bucket"
+                    f'{{{labels},le="+Inf"}} {histogram.count}'
+                )
+                lines.append(
+                    f"valve_test_serial_latency_seconds_sum{{{labels}}} {histogram.total}"
+                )
+                lines.append(
+                    f"valve_test_serial_latency_seconds_count{{{labels}}} {histogram.count}"
+                )
+            for name, counter in (
+                ("timeouts", self.timeouts),
+                ("naks", self.naks),
+                ("decode_failures", self.decode_failures),
+            ):
+                lines.append(f"# TYPE valve_test_serial_{name}_total counter")
+                for (device, command), count in sorted(counter.items()):
+                    lines.append(
+                        f"valve_test_serial_{name}_total"
+                        f'{{device="{device}",command="{_escape(command)}"}} {count}'
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write_metrics_file(self, file_path: Path) -> None:
+        """
+        Write the metrics as a text file that monitoring can scrape. The file
+        is replaced atomically so a scrape never sees a partial file.
+        """
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path: Path = file_path.with_suffix(file_path.suffix + ".tmp")
+        with open(temp_path, mode="w", newline="\n") as file:
+            file.write(self._exposition())
+        os.replace(temp_path, file_path)
+
+
+def _escape(label_value: str) -> str:
+    return label_value.encode("unicode_escape").decode().replace('"', '\\"')
+
+
+METRICS = SerialMetrics()
@@ -0,0 +1,430 @@
+"""In-process simulation of the valve test stand.
+
+VacuumSystem models a chamber pumped at a fixed speed and fed from a gas
+source through the valve under test. The valve conductance grows by a decade
+every turns_per_decade turns past the cracking point, and backlash in the
+valve stem makes the opening and closing curves differ. The gauge reading
+follows the chamber pressure with its own response time and carries
+multiplicative noise.
+
+SimulatedMotor and SimulatedGauge stand in for MotorController and the
+pressure gauge drivers. Both run on a clock, normally a VirtualClock, so a
+full valve test runs as fast as the code allows.
+
+Usage:
+    python -m api.simulator
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+try:
+    from api.motor import ERROR_CODES, READY_BIT, MotorReply
+    from api.pressure_gauge import GaugeCapabilities
+    from helpers.clock import VirtualClock
+    from helpers.constants import (
+        MICROSTEPS_PER_REV,
+        MOTOR_ACCELERATION,
+        MOTOR_VELOCITY,
+    )
+except Exception:
+    from clock import VirtualClock  # type: ignore
+    from constants import (  # type: ignore
+        MICROSTEPS_PER_REV,
+        MOTOR_ACCELERATION,
+        MOTOR_VELOCITY,
+    )
+    from motor import ERROR_CODES, READY_BIT, MotorReply
+    from pressure_gauge import GaugeCapabilities
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+OPERAND_OUT_OF_RANGE: int = 3
+
+# Longest integration step of the chamber model in seconds
+MAX_TIME_STEP: float = 0.1
+
+
+class SimulatedMotor:
+    """
+    Stand-in for MotorController. Moves follow a trapezoidal velocity profile
+    and every command takes command_time seconds of clock time, like the
+    serial round trip of the real controller. Positions below zero are outside
+    the travel of the valve and are rejected with error 3, as the controller
+    does.
+    """
+
+    BAUD_RATES: tuple[int, ...] = (9600, 19200, 38400)
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        address: int = 1,
+        command_time: float = 0.1,
+        velocity: int = MOTOR_VELOCITY,
+        acceleration: int = MOTOR_ACCELERATION,
+    ) -> None:
+        self.clock: VirtualClock = clock
+        self.address: int = address
+        self.command_time: float = command_time
+        self.velocity: int = velocity
+        self.acceleration: int = acceleration
+        self.baud_rate: int = 9600
+        self.lock = threading.RLock()
+        self.last_reply: MotorReply | None = None
+        self.busy: bool = False
+        self.last_error: int = 0
+        # (start time, start position, target position, velocity, acceleration)
+        # of the moves the chamber model has not integrated past yet
+        self.moves: list[tuple[float, int, int, int, int]] = [
+            (clock.now(), 0, 0, velocity, acceleration)
+        ]
+
+    @staticmethod
+    def _travelled(
+        elapsed: float, distance: int, velocity: int, acceleration: int
+    ) -> float:
+        """Distance covered after elapsed seconds of a trapezoidal move."""
+        if elapsed <= 0 or distance == 0:
+            return 0.0
+        ramp_time: float = velocity / acceleration
+        ramp_distance: float = velocity * ramp_time / 2
+        if 2 * ramp_distance > distance:
+            # Triangular profile: the move ends before reaching velocity
+            ramp_time = np.sqrt(distance / acceleration)
+            ramp_distance = distance / 2
+            velocity = acceleration * ramp_time
+        cruise_time: float = (distance - 2 * ramp_distance) / velocity
+        if elapsed < ramp_time:
+            return acceleration * elapsed**2 / 2
+        if elapsed < ramp_time + cruise_time:
+            return ramp_distance + velocity * (elapsed - ramp_time)
+        remaining: float = max(2 * ramp_time + cruise_time - elapsed, 0.0)
+        return distance - acceleration * remaining**2 / 2
+
+    def position_at(self, time: float) -> float:
+        """Return the motor position, in microsteps, at a clock time."""
+        move: tuple[float, int, int, int, int] = self.moves[0]
+        for move in reversed(self.moves):
+            if move[0] <= time:
+                break
+        start_time, start, target, velocity, acceleration = move
+        distance: int = abs(target - start)
+        travelled: float = self._travelled(
+            time - start_time, distance, velocity, acceleration
+        )
+        return start + float(np.sign(target - start)) * travelled
+
+    def discard_moves_before(self, time: float) -> None:
+        """Forget the moves that ended before time, keeping the current one."""
+        while len(self.moves) > 1 and self.moves[1][0] <= time:
+            self.moves.pop(0)
+
+    def _position(self) -> int:
+        return int(round(self.position_at(self.clock.now())))
+
+    def _reply(self, error_code: int = 0, payload: str = "") -> str:
+        target: int = self.moves[-1][2]
+        moving: bool = self._position() != target
+        status: int = (0 if moving else READY_BIT) | error_code
+        self.last_reply = MotorReply(self.address, status, payload.encode())
+        self.busy = moving
+        self.last_error = error_code
+        if error_code:
+            logger.warning(
+                "Motor controller error %d: %s",
+                error_code,
+                ERROR_CODES.get(error_code, "Unknown error"),
+            )
+        return payload
+
+    def _command(self) -> None:
+        self.clock.pause(self.command_time)
+
+    def _start_move(self, target: int) -> str:
+        with self.lock:
+            self._command()
+            if target < 0:
+                return self._reply(OPERAND_OUT_OF_RANGE)
+            self.moves.append(
+                (
+                    self.clock.now(),
+                    self._position(),
+                    target,
+                    self.velocity,
+                    self.acceleration,
+                )
+            )
+            return self._reply()
+
+    def send_command(self, command: str) -> str:
+        """
+        Accept the status and query commands the drivers and GUI send
+        directly.
+        """
+        with self.lock:
+            if command == "?0":
+                self._command()
+                return self._reply(payload=str(self._position()))
+            self._command()
+            return self._reply()
+
+    def is_busy(self) -> bool:
+        self.send_command("Q")
+        return self.busy
+
+    def set_current(self, running_current, holding_current) -> None:
+        self.send_command(f"m{running_current}")
+        self.send_command(f"h{holding_current}")
+
+    def set_velocity_and_acceleration(self, velocity, acceleration) -> None:
+        self.send_command(f"V{velocity}")
+        self.send_command(f"L{acceleration}")
+        self.velocity = int(velocity)
+        self.acceleration = int(acceleration)
+
+    def move_absolute(self, position) -> None:
+        self._start_move(int(position))
+
+    def move_relative(self, steps) -> None:
+        self._start_move(self._position() + int(steps))
+
+    def home_motor(self) -> None:
+        self._start_move(0)
+
+    def query_position(self) -> str:
+        return self.send_command("?0")
+
+    def set_zero(self) -> None:
+        with self.lock:
+            self._command()
+            self.moves = [(self.clock.now(), 0, 0, self.velocity, self.acceleration)]
+            self._reply()
+
+    def set_rotation_direction(self, direction: str = "normal") -> None:
+        self.send_command("F0" if direction == "normal" else "F1")
+
+    def set_microsteps_per_step(self, microsteps_per_step: int = 256) -> None:
+        self.send_command(f"j{microsteps_per_step}")
+
+    def stop(self) -> None:
+        with self.lock:
+            self._command()
+            position: int = self._position()
+            self.moves.append(
+                (self.clock.now(), position, position, self.velocity, self.acceleration)
+            )
+            self._reply()
+
+    def set_baud_rate(self, baud_rate: int) -> None:
+        if baud_rate not in self.BAUD_RATES:
+            raise ValueError(
+                f"{baud_rate} is not an acceptable value. Acceptable values: {self.BAUD_RATES}"
+            )
+        self.send_command(f"b{baud_rate}")
+        self.baud_rate = baud_rate
+
+    def check_link(self) -> bool:
+        self.send_command("?0")
+        return True
+
+    def close_port(self) -> None:
+        pass
+
+
+class VacuumSystem:
+    """
+    Chamber pressure as a function of the valve position over time.
+
+    The chamber of volume V (L) is pumped at speed S (L/s) and has a base gas
+    load that gives base_pressure. The valve admits gas from a source at
+    source_pressure through conductance C, so the chamber relaxes towards
+    (base_pressure * S + C * source_pressure) / (S + C) with time constant
+    V / (S + C). All pressures are in mbar.
+
+    :param crack_turns: valve turns at which the valve starts to conduct
+    :param crack_pressure: pressure rise over base at the cracking point
+    :param turns_per_decade: turns that raise the conductance tenfold
+    :param backlash_turns: play in the valve stem; the valve seat only follows
+        the motor once the play has been taken up in the direction of travel
+    :param gauge_time_constant: response time of the gauge in seconds
+    """
+
+    def __init__(
+        self,
+        motor: SimulatedMotor,
+        base_pressure: float = 5e-8,
+        source_pressure: float = 1000.0,
+        pumping_speed: float = 50.0,
+        chamber_volume: float = 100.0,
+        crack_turns: float = 0.5,
+        crack_pressure: float = 1e-7,
+        turns_per_decade: float = 1.0,
+        backlash_turns: float = 0.05,
+        gauge_time_constant: float = 1.0,
+    ) -> None:
+        self.motor: SimulatedMotor = motor
+        self.base_pressure: float = base_pressure
+        self.source_pressure: float = source_pressure
+        self.pumping_speed: float = pumping_speed
+        self.chamber_volume: float = chamber_volume
+        self.crack_turns: float = crack_turns
+        self.crack_conductance: float = crack_pressure * pumping_speed / source_pressure
+        self.turns_per_decade: float = turns_per_decade
+        self.backlash_turns: float = backlash_turns
+        self.gauge_time_constant: float = gauge_time_constant
+
+        self.time: float = motor.clock.now()
+        self.seat_turns: float = motor.position_at(self.time) / MICROSTEPS_PER_REV
+        self.pressure: float = self.steady_state_pressure(self.seat_turns)
+        self.reading: float = self.pressure
+
+    def conductance(self, seat_turns: float) -> float:
+        """Valve conductance in L/s."""
+        if seat_turns <= self.crack_turns:
+            return 0.0
+        return self.crack_conductance * 10 ** (
+            (seat_turns - self.crack_turns) / self.turns_per_decade
+        )
+
+    def steady_state_pressure(self, seat_turns: float) -> float:
+        conductance: float = self.conductance(seat_turns)
+        return (
+            self.base_pressure * self.pumping_speed + conductance * self.source_pressure
+        ) / (self.pumping_speed + conductance)
+
+    def _follow_motor(self, motor_turns: float) -> None:
+        half_play: float = self.backlash_turns / 2
+        if motor_turns > self.seat_turns + half_play:
+            self.seat_turns = motor_turns - half_play
+        elif motor_turns < self.seat_turns - half_play:
+            self.seat_turns = motor_turns + half_play
+
+    def advance_to(self, time: float) -> None:
+        """Integrate the chamber and gauge up to a clock time."""
+        while self.time < time:
+            time_step: float = min(MAX_TIME_STEP, time - self.time)
+            self._follow_motor(
+                self.motor.position_at(self.time + time_step / 2) / MICROSTEPS_PER_REV
+            )
+            conductance: float = self.conductance(self.seat_turns)
+            target: float = self.steady_state_pressure(self.seat_turns)
+            self.pressure += (target - self.pressure) * -np.expm1(
+                -time_step * (self.pumping_speed + conductance) / self.chamber_volume
+            )
+            self.reading += (self.pressure - self.reading) * -np.expm1(
+                -time_step / self.gauge_time_constant
+            )
+            self.time += time_step
+        self.motor.discard_moves_before(self.time)
+
+    def steady_state_curves(
+        self, max_turns: float, resolution: float = 0.01
+    ) -> tuple[list[float], list[float], list[float], list[float]]:
+        """
+        Return the noise free settled opening and closing curves up to
+        max_turns, in the (turns_up, pressure_up, turns_down, pressure_down)
+        form of test csv files.
+        """
+        turns: np.ndarray = np.arange(0, max_turns + resolution / 2, resolution)
+        half_play: float = self.backlash_turns / 2
+        up: list[float] = [
+            self.steady_state_pressure(max(t - half_play, 0.0)) for t in turns
+        ]
+        down: list[float] = [self.steady_state_pressure(t + half_play) for t in turns]
+        return list(turns), up, list(turns[::-1]), down[::-1]
+
+
+class SimulatedGauge:
+    """
+    Stand-in for TPG261 and AGC100. Readings carry relative Gaussian noise
+    of standard deviation noise and are reported as underrange or overrange,
+    with the status codes of the real controllers, outside measuring_range.
+    """
+
+    BAUD_RATES: tuple[int, ...] = (9600, 19200, 38400)
+    MEASUREMENT_STATUS: dict[int, str] = {
+        0: "Measurement data okay",
+        1: "Underrange",
+        2: "Overrange",
+    }
+    # Readings are computed on demand, so there is no rate limit
+    capabilities: GaugeCapabilities = GaugeCapabilities(
+        dual_channel=True, unit_query=True
+    )
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        system: VacuumSystem,
+        noise: float = 0.01,
+        measuring_range: tuple[float, float] = (5e-9, 1000.0),
+        command_time: float = 0.05,
+        seed: int | None = None,
+    ) -> None:
+        self.clock: VirtualClock = clock
+        self.system: VacuumSystem = system
+        self.noise: float = noise
+        self.measuring_range: tuple[float, float] = measuring_range
+        self.command_time: float = command_time
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.RLock()
+        self.unit: str = "mbar"
+
+    def pressure_gauge(self, gauge: int = 1) -> tuple[float, tuple[int, str]]:
+        if gauge not in [1, 2]:
+            message = "The input gauge number can only be 1 or 2"
+            raise ValueError(message)
+        with self.lock:
+            self.clock.pause(self.command_time)
+            self.system.advance_to(self.clock.now())
+            value: float = self.system.reading * (1 + self.noise * self.rng.normal())
+        lower, upper = self.measuring_range
+        status_code: int = 1 if value < lower else 2 if value > upper else 0
+        value = min(max(value, lower), upper)
+        return value, (status_code, self.MEASUREMENT_STATUS[status_code])
+
+    def pressure_unit(self) -> str:
+        return self.unit
+
+    def set_baud_rate(self, baudrate: int) -> None:
+        if baudrate not in self.BAUD_RATES:
+            message = f"The baud rate can only be one of {self.BAUD_RATES}"
+            raise ValueError(message)
+
+    def check_link(self) -> bool:
+        return True
+
+    def close_port(self) -> None:
+        pass
+
+
+def create_simulation(
+    seed: int | None = None, noise: float = 0.01, **system_parameters
+) -> tuple[VirtualClock, SimulatedMotor, SimulatedGauge]:
+    """
+    Build a simulated test stand on a fresh VirtualClock.
+
+    :param system_parameters: keyword arguments of VacuumSystem
+    :return: (clock, motor, gauge); the model is gauge.system
+    """
+    clock = VirtualClock()
+    motor = SimulatedMotor(clock)
+    system = VacuumSystem(motor, **system_parameters)
+    gauge = SimulatedGauge(clock, system, noise=noise, seed=seed)
+    return clock, motor, gauge
+
+
+def main() -> None:
+    clock, motor, gauge = create_simulation(seed=0)
+    for turns in (0, 1, 2, 3, 4):
+        motor.move_absolute(turns * MICROSTEPS_PER_REV)
+        clock.pause(60)
+        pressure, (_, status) = gauge.pressure_gauge()
+        print(f"{turns} turns: {pressure:.3e} {gauge.unit} ({status})")
+
+
+if __name__ == "__main__":
+    main()
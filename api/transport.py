@@ -0,0 +1,247 @@
+"""Byte transports of the device drivers.
+
+A port setting is either a local serial port ('COM3', '/dev/ttyUSB0') or the
+address of a serial device server or Ethernet controller written as
+'tcp://host:port'. open_transport returns a ``serial.Serial`` for the first
+and a SocketSerial for the second; both have the write/read/readline
+interface the drivers use, so the framing of every protocol stays the same.
+"""
+
+import select
+import socket
+import time
+
+import serial
+
+TCP_SCHEME: str = "tcp://"
+
+# Seconds to wait for a connection to a device server
+CONNECT_TIMEOUT: float = 3.0
+
+# TCP keepalive: probe an idle connection after KEEPALIVE_IDLE seconds, every
+# KEEPALIVE_INTERVAL seconds, and drop it after KEEPALIVE_COUNT lost probes
+KEEPALIVE_IDLE: int = 10
+KEEPALIVE_INTERVAL: int = 5
+KEEPALIVE_COUNT: int = 3
+
+
+def is_network_port(port) -> bool:
+    return str(port).lower().startswith(TCP_SCHEME)
+
+
+def parse_tcp_url(url: str) -> tuple[str, int]:
+    """
+    Split 'tcp://host:port' into host and port.
+
+    :raises ValueError: if the url is not of that form
+    """
+    if not is_network_port(url):
+        raise ValueError(f"Not a {TCP_SCHEME} address: {url}")
+    host, _, port = url[len(TCP_SCHEME) :].rstrip("/").rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected {TCP_SCHEME}host:port, got {url}")
+    return host.strip("[]"), int(port)
+
+
+def open_transport(port, baudrate: int = 9600, timeout: float = 1):
+    """
+    Open the serial port or TCP connection a port setting names.
+
+    :param port: 'COM3', '/dev/ttyUSB0', 3 or 'tcp://host:port'
+    :param baudrate: rate of a local serial port; the serial side of a device
+        server is configured on the device server itself
+    :param timeout: seconds a read waits for data
+    """
+    if is_network_port(port):
+        host, tcp_port = parse_tcp_url(port)
+        return SocketSerial(host, tcp_port, baudrate=baudrate, timeout=timeout)
+    return serial.Serial(port, baudrate, timeout=timeout)
+
+
+def reopen_transport(transport) -> None:
+    """
+    Close and reopen a serial port or TCP connection with its settings, e.g.
+    after a USB-serial adapter reset.
+
+    :raises serial.SerialException: if it cannot be opened
+    """
+    reopen = getattr(transport, "reopen", None)
+    if reopen is not None:
+        reopen()
+        return
+    try:
+        transport.close()
+    except (OSError, serial.SerialException):
+        pass
+    transport.open()
+
+
+def _enable_keepalive(sock: socket.socket) -> None:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "SIO_KEEPALIVE_VALS"):  # Windows
+        sock.ioctl(  # type: ignore
+            socket.SIO_KEEPALIVE_VALS,  # type: ignore
+            (1, KEEPALIVE_IDLE * 1000, KEEPALIVE_INTERVAL * 1000),
+        )
+        return
+    for option, value in (
+        ("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+        ("TCP_KEEPALIVE", KEEPALIVE_IDLE),  # macOS name of TCP_KEEPIDLE
+        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+    ):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class SocketSerial:
+    """
+    Serial port stand-in that carries the bytes over a persistent TCP
+    connection. Reads follow ``serial.Serial`` timeout semantics: they return
+    what arrived within timeout seconds, possibly b"". A connection the peer
+    closed or keepalive found dead is reopened before the next write, so a
+    restarted device server costs at most the command in flight.
+
+    :param baudrate: kept for the drivers that set it; the serial side of a
+        device server is configured on the device server
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        baudrate: int = 9600,
+        timeout: float = 1,
+        connect_timeout: float = CONNECT_TIMEOUT,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.baudrate: int = baudrate
+        self.timeout: float = timeout
+        self.connect_timeout: float = connect_timeout
+        self.socket: socket.socket | None = None
+        self.buffer: bytearray = bytearray()
+        self.reconnects: int = 0
+        self.is_open: bool = False
+        self.open()
+
+    @property
+    def name(self) -> str:
+        return f"{TCP_SCHEME}{self.host}:{self.port}"
+
+    def open(self) -> None:
+        """
+        Connect to the device server.
+
+        :raises serial.SerialException: if it cannot be reached
+        """
+        try:
+            sock: socket.socket = socket.create_connection(
+                (self.host, self.port), timeout=self.connect_timeout
+            )
+        except OSError as e:
+            raise serial.SerialException(f"Could not connect to {self.name}: {e}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _enable_keepalive(sock)
+        self.socket = sock
+        self.buffer.clear()
+        self.is_open = True
+
+    def close(self) -> None:
+        self._disconnect()
+        self.is_open = False
+
+    def _disconnect(self) -> None:
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+
+    def _reconnect(self) -> None:
+        self._disconnect()
+        self.open()
+        self.reconnects += 1
+
+    def _peer_closed(self) -> bool:
+        """Return True if the peer closed the connection while it was idle."""
+        if self.socket is None:
+            return True
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+            if not readable:
+                return False
+            data: bytes = self.socket.recv(4096)
+        except OSError:
+            return True
+        if not data:
+            return True
+        # Bytes that arrived unasked stay readable
+        self.buffer.extend(data)
+        return False
+
+    def write(self, data: bytes) -> int:
+        """
+        Send data, reconnecting once if the connection was lost.
+
+        :raises serial.SerialException: if the device server cannot be reached
+        """
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        if self._peer_closed():
+            self._reconnect()
+        try:
+            self.socket.sendall(data)  # type: ignore
+        except OSError:
+            self._reconnect()
+            self.socket.sendall(data)  # type: ignore
+        return len(data)
+
+    def _receive(self, deadline: float) -> bool:
+        """Wait until deadline for more bytes; return False if none came."""
+        if self.socket is None:
+            return False
+        remaining: float = max(0.0, deadline - time.monotonic())
+        try:
+            readable, _, _ = select.select([self.socket], [], [], remaining)
+            if not readable:
+                return False
+            data: bytes = self.socket.recv(4096)
+        except OSError:
+            data = b""
+        if not data:
+            # Closed by the peer; the next write reconnects
+            self._disconnect()
+            return False
+        self.buffer.extend(data)
+        return True
+
+    def read(self, size: int = 1) -> bytes:
+        deadline: float = time.monotonic() + self.timeout
+        while len(self.buffer) < size and self._receive(deadline):
+            pass
+        data: bytes = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        deadline: float = time.monotonic() + self.timeout
+        while b"\n" not in self.buffer and self._receive(deadline):
+            pass
+        end: int = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        if size >= 0:
+            end = min(end, size)
+        data: bytes = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        self._peer_closed()
+        return len(self.buffer)
+
+    def reset_input_buffer(self) -> None:
+        self.buffer.clear()
+        while self.in_waiting:
+            self.buffer.clear()
@@ -0,0 +1,59 @@
+"""Microbenchmark of the EZStepper reply parser against the old decoder.
+
+Usage:
+    python -m benchmarks.bench_motor_reply [NUMBER]
+"""
+
+import sys
+import timeit
+
+from api.motor import parse_reply
+
+REPLIES: dict[str, bytes] = {
+    "position": b"\xff/0`1234567\x03\r\n",
+    "busy": b"\xff/0@\x03\r\n",
+    "error": b"\xff/0b\x03\r\n",
+    "truncated": b"\xff/0`12",
+    "empty": b"",
+}
+
+
+def split_cascade(raw_response: bytes) -> str:
+    """The decoder used before parse_reply, without its prints."""
+    decoded_response: str = raw_response.decode(errors="ignore").strip()
+    split_chars: tuple[str, ...] = ("`", "@", "?", "c", "O", "b")
+    for char in split_chars:
+        try:
+            return decoded_response.split(char)[1][:-1]
+        except IndexError:
+            continue
+    return ""
+
+
+def bytes_parser(raw_response: bytes) -> str:
+    reply = parse_reply(raw_response)
+    return reply.payload.decode(errors="ignore") if reply is not None else ""
+
+
+def main() -> None:
+    number: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"{'reply':<10} {'split cascade':>15} {'bytes parser':>15} {'speedup':>8}")
+    for name, raw_response in REPLIES.items():
+        old: float = min(
+            timeit.repeat(
+                lambda raw=raw_response: split_cascade(raw), number=number, repeat=5
+            )
+        )
+        new: float = min(
+            timeit.repeat(
+                lambda raw=raw_response: bytes_parser(raw), number=number, repeat=5
+            )
+        )
+        print(
+            f"{name:<10} {old / number * 1e9:>12.0f} ns "
+            f"{new / number * 1e9:>12.0f} ns {old / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Benchmark suite of the drivers, the test loop, plotting and persistence.
+
+Every benchmark is timed with timeit, best of several repeats, and a run is
+saved as JSON under benchmarks/results so runs of different versions can be
+compared.
+
+Usage:
+    python -m benchmarks.suite run [NAME_FILTER ...] [--output FILE]
+    python -m benchmarks.suite compare OLD_JSON NEW_JSON
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from api.motor import MotorController
+from api.pfeiffer_tpg26x import TPG26x
+from api.pty_emulators import GaugeProtocol, StepperProtocol
+from api.simulator import create_simulation
+from helpers.replay import NullLabel, NullPlotWindow, simulate_test
+from helpers.valve_test import ValveTest
+
+RESULTS_DIR: Path = Path(__file__).resolve().parent / "results"
+
+REPEATS: int = 5
+SLOW_REPEATS: int = 3
+
+# A benchmark counts as changed between runs beyond this ratio
+SIGNIFICANT_CHANGE: float = 0.1
+
+
+class LoopbackSerial:
+    """
+    In-process serial port that hands writes to an emulator protocol and
+    answers reads from its replies, so driver code runs without a device or
+    pseudo-terminal.
+    """
+
+    def __init__(self, protocol: StepperProtocol | GaugeProtocol) -> None:
+        self.protocol: StepperProtocol | GaugeProtocol = protocol
+        self.replies: deque[bytes] = deque()
+        self.is_open: bool = True
+
+    def write(self, data: bytes) -> int:
+        self.replies.extend(self.protocol.feed(bytes(data)))
+        return len(data)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self.replies.popleft() if self.replies else b""
+
+    def read(self, size: int = 1) -> bytes:
+        return self.readline()
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+def curves(points: int) -> tuple[list[float], list[float], list[float], list[float]]:
+    """Opening and closing curves with points readings in total."""
+    turns: np.ndarray = np.linspace(0, 10, points // 2)
+    pressure: np.ndarray = 5e-8 + 1e-8 * 10 ** (turns / 2.5)
+    return list(turns), list(pressure), list(turns[::-1]), list(pressure[::-1] * 1.2)
+
+
+def bench_decode_response():
+    motor = MotorController("bench", transport=object(), response_delay=0)
+    raw_response: bytes = b"\xff/0`1234567\x03\r\n"
+    return lambda: motor._decode_response(raw_response)
+
+
+def bench_motor_send_command():
+    _, simulated_motor, _ = create_simulation(seed=0)
+    motor = MotorController(
+        "bench",
+        transport=LoopbackSerial(StepperProtocol(simulated_motor)),
+        response_delay=0,
+    )
+    return motor.query_position
+
+
+def bench_gauge_pressure_reading():
+    _, _, simulated_gauge = create_simulation(seed=0)
+    gauge = TPG26x("bench", transport=LoopbackSerial(GaugeProtocol(simulated_gauge)))
+    return gauge.pressure_gauge
+
+
+def bench_valve_test_simulated():
+    def run() -> None:
+        simulate_test(seed=0)
+
+    return run
+
+
+def bench_live_plot(points: int):
+    def setup():
+        from PySide6.QtWidgets import QApplication
+
+        from gui.live_plot_window import LivePlotWindow
+
+        QApplication.instance() or QApplication([])
+        window = LivePlotWindow("bench", "A", "5e-8")
+        data = curves(points)
+        return lambda: window.update_plot(*data)
+
+    return setup
+
+
+def bench_normalized_plot():
+    from helpers import normalized_data_plotter
+
+    # Keep the saved figures out of the remote data folder
+    normalized_data_plotter.REMOTE_DATA_DIR = Path(tempfile.mkdtemp())
+    data = curves(1000)
+
+    def run() -> None:
+        plot = normalized_data_plotter.NormalizedPlot("bench", "A", "5e-8")
+        plt.close(plot.plot(*data))
+
+    return run
+
+
+def bench_create_csv(points: int):
+    def setup():
+        clock, motor, gauge = create_simulation(seed=0)
+        valve_test = ValveTest(
+            motor,  # type: ignore
+            gauge,
+            "bench",
+            "A",
+            "5e-8",
+            NullLabel(),  # type: ignore
+            NullPlotWindow(),  # type: ignore
+            clock=clock,
+            save_results=False,
+        )
+        (
+            valve_test.turns_up_log,
+            valve_test.pressure_up_log,
+            valve_test.turns_down_log,
+            valve_test.pressure_down_log,
+        ) = curves(points)
+        file_path: Path = Path(tempfile.mkdtemp()) / "bench.csv"
+
+        def run() -> None:
+            valve_test._create_csv(file_path)
+
+        return run
+
+    return setup
+
+
+# name -> (setup returning the callable to time, True if one call is slow)
+BENCHMARKS: dict = {
+    "motor_decode_response": (bench_decode_response, False),
+    "motor_send_command": (bench_motor_send_command, False),
+    "gauge_pressure_reading": (bench_gauge_pressure_reading, False),
+    "valve_test_simulated": (bench_valve_test_simulated, True),
+    "live_plot_update_100": (bench_live_plot(100), True),
+    "live_plot_update_1k": (bench_live_plot(1_000), True),
+    "live_plot_update_10k": (bench_live_plot(10_000), True),
+    "normalized_plot_render_save": (bench_normalized_plot, True),
+    "create_csv_10k": (bench_create_csv(10_000), True),
+    "create_csv_100k": (bench_create_csv(100_000), True),
+}
+
+
+def time_benchmark(function, slow: bool) -> dict[str, float]:
+    """
+    :return: the number of calls per repeat and the best, median and worst
+        time per call in seconds
+    """
+    timer = timeit.Timer(function)
+    # Fast benchmarks repeat the call for at least 0.2 s per repeat
+    number: int = 1 if slow else timer.autorange()[0]
+    times: np.ndarray = (
+        np.array(timer.repeat(repeat=SLOW_REPEATS if slow else REPEATS, number=number))
+        / number
+    )
+    return {
+        "number": number,
+        "best_s": float(times.min()),
+        "median_s": float(np.median(times)),
+        "worst_s": float(times.max()),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(name_filters: list[str]) -> dict:
+    results: dict[str, dict[str, float]] = {}
+    for name, (setup, slow) in BENCHMARKS.items():
+        if name_filters and not any(text in name for text in name_filters):
+            continue
+        results[name] = time_benchmark(setup(), slow)
+        print(f"{name:<30} {results[name]['best_s'] * 1e3:>12.4f} ms")
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> None:
+    print(f"{'benchmark':<30} {old['revision']:>12} {new['revision']:>12} {'ratio':>8}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before: float = old["results"][name]["best_s"]
+        after: float = result["best_s"]
+        ratio: float = after / before
+        flag: str = ""
+        if ratio > 1 + SIGNIFICANT_CHANGE:
+            flag = "slower"
+        elif ratio < 1 - SIGNIFICANT_CHANGE:
+            flag = "faster"
+        print(
+            f"{name:<30} {before * 1e3:>9.4f} ms {after * 1e3:>9.4f} ms "
+            f"{ratio:>7.2f}x {flag}"
+        )
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    if not args or args[0] not in ("run", "compare"):
+        print(__doc__)
+        return
+    if args[0] == "compare":
+        old, new = (json.loads(Path(arg).read_text()) for arg in args[1:3])
+        compare(old, new)
+        return
+    output: Path | None = None
+    if "--output" in args:
+        index: int = args.index("--output")
+        output = Path(args[index + 1])
+        del args[index : index + 2]
+    run: dict = run_suite(args[1:])
+    if output is None:
+        stamp: str = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        output = RESULTS_DIR / f"{stamp}_{run['revision']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2))
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
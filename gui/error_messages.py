@@ -17,3 +17,38 @@ def failed_to_connect_to_pressure_gauge(parent, error, traceback) -> None:
     title = "Error"
     message = f"Failed to connect to pressure gauge.\n\nError: {error}\n\n{traceback}"
     QMessageBox.critical(parent, title, message)
+
+
+def resume_test_message(parent, serial_number, direction, valve_position, saved_at):
+    title = "Resume Valve Test"
+    message = (
+        f"The valve test of {serial_number} was interrupted at {valve_position:.2f} "
+        f"turns ({direction} sweep, saved {saved_at}).\n\n"
+        "Resume the test from where it stopped?"
+    )
+    answer = QMessageBox.question(parent, title, message)
+    return answer == QMessageBox.StandardButton.Yes
+
+
+def confirm_valve_closed_message(parent, reported_turns, expected_turns):
+    title = "Motor Position Unknown"
+    message = (
+        f"The motor controller reports {reported_turns:.2f} turns, not the "
+        f"{expected_turns:.2f} turns the test stopped at. It may have lost its "
+        "position, e.g. after a power cycle.\n\n"
+        "Close the valve fully by hand, then press Yes to zero the motor and "
+        "resume the test. Press No to discard the interrupted test."
+    )
+    answer = QMessageBox.question(parent, title, message)
+    return answer == QMessageBox.StandardButton.Yes
+
+
+def confirm_zero_message(parent):
+    title = "Motor Position Unknown"
+    message = (
+        "The motor lost its position while the link was down.\n\n"
+        "Is the valve fully closed? Press Yes to set zero here, or No to "
+        "close it first."
+    )
+    answer = QMessageBox.question(parent, title, message)
+    return answer == QMessageBox.StandardButton.Yes
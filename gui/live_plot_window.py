@@ -2,6 +2,8 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from PySide6.QtWidgets import QDialog, QVBoxLayout
 
+from helpers.units import CANONICAL_UNIT
+
 
 class LivePlotWindow(QDialog):
     """Secondary window to display and continuously update the plot."""
@@ -27,7 +29,7 @@ class LivePlotWindow(QDialog):
         self.ax = self.fig.add_subplot(1, 1, 1)
         self.ax.set_title(f"VAT Valve #{self.serial_number}({self.rework_letter})")
         self.ax.set_xlabel("Leak Valve Turns", fontsize=7)
-        self.ax.set_ylabel("Pressure (mBar)", fontsize=7)
+        self.ax.set_ylabel(f"Pressure ({CANONICAL_UNIT})", fontsize=7)
         self.ax.grid()
         self.canvas = FigureCanvas(self.fig)
 
@@ -82,6 +84,6 @@ class LivePlotWindow(QDialog):
         self.ax.grid()
         self.ax.set_title(f"VAT Valve #{self.serial_number}({self.rework_letter})")
         self.ax.set_xlabel("Leak Valve Turns", fontsize=7)
-        self.ax.set_ylabel("Pressure (mBar)", fontsize=7)
+        self.ax.set_ylabel(f"Pressure ({CANONICAL_UNIT})", fontsize=7)
         self.ax.legend(fontsize=5)
         self.canvas.draw()
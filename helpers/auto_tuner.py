@@ -0,0 +1,319 @@
+"""Offline tuning of the stepping and stability parameters of the valve test.
+
+Every candidate parameter set is replayed against every trace, or run against
+simulated test stands, on a virtual clock in a pool of worker processes. A
+candidate is scored on the total virtual test time and on curve fidelity: the
+RMS difference, in turns, between the curves the candidate produced and the
+reference curves, compared on a log10 pressure grid. The reference of a trace
+is the recorded test, compared on the grid of curve_analysis; that of a
+simulated stand is its noise free settled curve, compared over the AOI of the
+INI file only, because near base pressure the settled curve is flat and turns
+cannot be resolved from pressure there. The candidates that no other candidate
+beats on both scores form the Pareto front, and the fastest one on the front
+within the fidelity limit is recommended as an INI section.
+
+Usage:
+    python -m helpers.auto_tuner [TRACE_FILE_OR_FOLDER ...] [--simulate N]
+        [--max-error TURNS] [--workers N]
+
+Folders are searched for the "* trace.csv" files the valve test saves. Traces
+of tests that never turned around, e.g. stopped or tripped ones, are skipped.
+"""
+
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from helpers.constants import (
+    AOI_LOWER_BOUND,
+    AOI_UPPER_BOUND,
+    DRIFT_TOLERANCE,
+    HOLD_TIME,
+    MICROSTEPS_PER_REV,
+    RESULTS_DIR,
+    VALVE_STEP_SIZE,
+)
+from helpers.curve_analysis import log_pressure_grid
+from helpers.golden_curve import resample_curves
+from helpers.replay import replay_trace, simulate_test, trace_problem
+from helpers.replay_devices import load_trace
+
+TUNING_DIR: Path = RESULTS_DIR / "tuning"
+
+# Values tried for each parameter. AOI_MARGINS scale the AOI outwards (> 1)
+# or inwards (< 1) by that factor on both ends.
+HOLD_TIMES: tuple[int, ...] = (2, 3, 4, 5)
+DRIFT_TOLERANCES: tuple[float, ...] = (1.0, 2.0, 5.0, 10.0)
+VALVE_STEP_SIZES: tuple[float, ...] = (0.02, 0.05, 0.1)
+AOI_MARGINS: tuple[float, ...] = (0.5, 1.0, 2.0)
+
+# Default fidelity limit of the recommended candidate, RMS turns
+MAX_ERROR: float = 0.05
+# Default limit when every source is simulated. The noise free reference
+# leaves no measurement noise in the error, so the limit is tighter.
+SIMULATED_MAX_ERROR: float = 0.01
+
+# A candidate whose curves cover less than this fraction of the reference
+# grid points has lost part of the curve and is scored as infinitely wrong
+MIN_COVERAGE: float = 0.5
+
+
+def candidate_grid() -> list[dict[str, float]]:
+    """
+    Return every combination of the tried values, plus the current INI
+    settings so they always appear in the results.
+    """
+    candidates: list[dict[str, float]] = [
+        {
+            "hold_time": HOLD_TIME,
+            "drift_tolerance": DRIFT_TOLERANCE,
+            "valve_step_size": VALVE_STEP_SIZE,
+            "aoi_margin": 1.0,
+        }
+    ]
+    for hold_time, drift_tolerance, valve_step_size, aoi_margin in itertools.product(
+        HOLD_TIMES, DRIFT_TOLERANCES, VALVE_STEP_SIZES, AOI_MARGINS
+    ):
+        candidate: dict[str, float] = {
+            "hold_time": hold_time,
+            "drift_tolerance": drift_tolerance,
+            "valve_step_size": valve_step_size,
+            "aoi_margin": aoi_margin,
+        }
+        if candidate != candidates[0]:
+            candidates.append(candidate)
+    return candidates
+
+
+def valve_test_parameters(candidate: dict[str, float]) -> dict[str, float]:
+    """Translate a candidate into the ValveTest attributes it overrides."""
+    return {
+        "hold_time": int(candidate["hold_time"]),
+        "drift_tolerance": candidate["drift_tolerance"],
+        "motor_step_size": int(candidate["valve_step_size"] * MICROSTEPS_PER_REV),
+        "aoi_lower_bound": AOI_LOWER_BOUND / candidate["aoi_margin"],
+        "aoi_upper_bound": AOI_UPPER_BOUND * candidate["aoi_margin"],
+    }
+
+
+def trace_curves(
+    trace: list[tuple[float, float, int, float, str]],
+) -> tuple[list[float], list[float], list[float], list[float]]:
+    """
+    Return the opening and closing branches of a recorded trace in the
+    (turns_up, pressure_up, turns_down, pressure_down) form of test csv files.
+    """
+    curves: tuple[list[float], list[float], list[float], list[float]] = (
+        [],
+        [],
+        [],
+        [],
+    )
+    for _, _, motor_position, pressure, direction in trace:
+        offset: int = 0 if direction == "up" else 2
+        curves[offset].append(motor_position / MICROSTEPS_PER_REV)
+        curves[offset + 1].append(pressure)
+    return curves
+
+
+def curve_error(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """
+    RMS difference in turns between two resampled curves of shape (2, G),
+    over the grid points both cover.
+    """
+    covered: np.ndarray = np.isfinite(reference)
+    shared: np.ndarray = covered & np.isfinite(candidate)
+    if not np.any(shared) or np.count_nonzero(shared) < MIN_COVERAGE * np.count_nonzero(
+        covered
+    ):
+        return float("inf")
+    return float(np.sqrt(np.mean((candidate[shared] - reference[shared]) ** 2)))
+
+
+def replay_candidate(job: tuple[Path | int, dict[str, float]]) -> dict[str, float]:
+    """
+    Replay one trace, or simulate the stand with one seed, under one
+    candidate. Runs in a worker process.
+
+    :return: the candidate with the virtual test duration and curve error
+    """
+    source, candidate = job
+    parameters: dict[str, float] = valve_test_parameters(candidate)
+    if isinstance(source, Path):
+        metadata, trace = load_trace(source)
+        valve_test, _ = replay_trace(trace, metadata, parameters=parameters)
+        reference_curves = trace_curves(trace)
+        grid: np.ndarray = log_pressure_grid()
+    else:
+        valve_test, gauge, _ = simulate_test(source, parameters=parameters)
+        reference_curves = gauge.system.steady_state_curves(
+            max(valve_test.turns_up_log, default=0.0)
+        )
+        grid = log_pressure_grid(AOI_LOWER_BOUND, AOI_UPPER_BOUND)
+    reference, replayed = resample_curves(
+        grid,
+        [
+            reference_curves,
+            (
+                valve_test.turns_up_log,
+                valve_test.pressure_up_log,
+                valve_test.turns_down_log,
+                valve_test.pressure_down_log,
+            ),
+        ],
+    )
+    return {
+        **candidate,
+        "duration_s": valve_test.clock.now() - valve_test.start_time,
+        "error_turns": curve_error(reference, replayed),
+    }
+
+
+def score_candidates(
+    sources: list[Path | int],
+    candidates: list[dict[str, float]],
+    workers: int | None = None,
+) -> list[dict[str, float]]:
+    """
+    Run every candidate against every source, a trace file or the seed of a
+    simulated stand.
+
+    :return: per candidate, the total duration over all sources and the RMS
+        of the per-source curve errors
+    """
+    jobs: list[tuple[Path | int, dict[str, float]]] = [
+        (source, candidate) for candidate in candidates for source in sources
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results: list[dict[str, float]] = list(
+            executor.map(
+                replay_candidate,
+                jobs,
+                chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1))),
+            )
+        )
+    scores: list[dict[str, float]] = []
+    for i, candidate in enumerate(candidates):
+        runs: list[dict[str, float]] = results[
+            i * len(sources) : (i + 1) * len(sources)
+        ]
+        errors: np.ndarray = np.array([run["error_turns"] for run in runs])
+        scores.append(
+            {
+                **candidate,
+                "duration_s": sum(run["duration_s"] for run in runs),
+                "error_turns": float(np.sqrt(np.mean(errors**2))),
+            }
+        )
+    return scores
+
+
+def pareto_front(scores: list[dict[str, float]]) -> list[dict[str, float]]:
+    """
+    Return the candidates that no other candidate beats on both duration and
+    error, sorted from fastest to most faithful.
+    """
+    front: list[dict[str, float]] = []
+    for score in sorted(scores, key=lambda s: (s["duration_s"], s["error_turns"])):
+        if not front or score["error_turns"] < front[-1]["error_turns"]:
+            front.append(score)
+    return front
+
+
+def recommend(
+    front: list[dict[str, float]], max_error: float = MAX_ERROR
+) -> dict[str, float] | None:
+    """Return the fastest candidate on the front within max_error."""
+    for score in front:
+        if score["error_turns"] <= max_error:
+            return score
+    return None
+
+
+def ini_section(candidate: dict[str, float]) -> str:
+    """Format a candidate in the layout of valve_test.ini."""
+    settings: dict[str, str] = {
+        "VALVE_STEP_SIZE": f"{candidate['valve_step_size']:g}",
+        "HOLD_TIME": f"{int(candidate['hold_time'])}",
+        "DRIFT_TOLERANCE": f"{candidate['drift_tolerance']:g}",
+        "AOI_LOWER_BOUND": f"{AOI_LOWER_BOUND / candidate['aoi_margin']:.3g}",
+        "AOI_UPPER_BOUND": f"{AOI_UPPER_BOUND * candidate['aoi_margin']:.3g}",
+    }
+    return "\n\n".join(f"[{key}]\n{key} = {value}" for key, value in settings.items())
+
+
+def write_scores(file_path: Path, scores: list[dict[str, float]]) -> None:
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(scores[0]))
+        writer.writeheader()
+        writer.writerows(scores)
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    max_error: float | None = None
+    workers: int | None = None
+    sources: list[Path | int] = []
+    while args:
+        arg: str = args.pop(0)
+        if arg == "--max-error" and args:
+            max_error = float(args.pop(0))
+        elif arg == "--workers" and args:
+            workers = int(args.pop(0))
+        elif arg == "--simulate" and args:
+            sources.extend(range(int(args.pop(0))))
+        else:
+            path: Path = Path(arg)
+            traces: list[Path] = (
+                sorted(path.rglob("* trace.csv")) if path.is_dir() else [path]
+            )
+            for trace_path in traces:
+                problem: str | None = trace_problem(load_trace(trace_path)[1])
+                if problem is None:
+                    sources.append(trace_path)
+                else:
+                    print(f"Skipping {trace_path}: {problem}.")
+    if not sources:
+        print(__doc__)
+        return
+
+    if max_error is None:
+        simulated: bool = all(isinstance(source, int) for source in sources)
+        max_error = SIMULATED_MAX_ERROR if simulated else MAX_ERROR
+
+    candidates: list[dict[str, float]] = candidate_grid()
+    print(f"Running {len(sources)} tests under {len(candidates)} candidates.")
+    scores: list[dict[str, float]] = score_candidates(sources, candidates, workers)
+    file_path: Path = TUNING_DIR / "tuning_scores.csv"
+    write_scores(file_path, scores)
+    print(f"Scores saved to {file_path}\n")
+
+    front: list[dict[str, float]] = pareto_front(scores)
+    print("Pareto front:")
+    for score in front:
+        print(
+            f"  {score['duration_s']:9.0f} s  {score['error_turns']:.4f} turns  "
+            f"hold {score['hold_time']:g}, drift {score['drift_tolerance']:g} %, "
+            f"step {score['valve_step_size']:g}, AOI x{score['aoi_margin']:g}"
+        )
+    current: dict[str, float] = scores[0]
+    print(
+        f"\nCurrent settings: {current['duration_s']:.0f} s, "
+        f"{current['error_turns']:.4f} turns"
+    )
+    best: dict[str, float] | None = recommend(front, max_error)
+    if best is None:
+        print(f"No candidate is within {max_error} turns of the reference curves.")
+        return
+    print(f"\nRecommended settings ({best['duration_s']:.0f} s):\n")
+    print(ini_section(best))
+
+
+if __name__ == "__main__":
+    main()
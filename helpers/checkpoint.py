@@ -0,0 +1,46 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+try:
+    from helpers.constants import RESULTS_DIR
+except Exception:
+    from constants import RESULTS_DIR
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH: Path = RESULTS_DIR / "checkpoints" / "valve_test.json"
+
+
+def save_checkpoint(state: dict, file_path: Path = CHECKPOINT_PATH) -> None:
+    """
+    Write the test state to a temporary file and replace the checkpoint with
+    it, so a crash while writing never leaves a half written checkpoint.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path: Path = file_path.with_suffix(".tmp")
+    with open(temp_path, mode="w") as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+
+def load_checkpoint(file_path: Path = CHECKPOINT_PATH) -> dict | None:
+    """Return the saved test state, or None if there is no usable checkpoint."""
+    try:
+        with open(file_path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read the test checkpoint %s: %s", file_path, e)
+        return None
+
+
+def clear_checkpoint(file_path: Path = CHECKPOINT_PATH) -> None:
+    try:
+        file_path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning("Could not remove the test checkpoint %s: %s", file_path, e)
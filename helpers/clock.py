@@ -0,0 +1,40 @@
+import time
+
+from PySide6.QtCore import QEventLoop, QTimer
+
+
+class QtClock:
+    """
+    Real time clock. Waits run a nested Qt event loop so the GUI keeps
+    responding while the valve test waits.
+    """
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def pause(seconds: float) -> None:
+        loop = QEventLoop()
+        QTimer.singleShot(int(seconds * 1000), loop.quit)
+        loop.exec()
+
+
+class VirtualClock:
+    """
+    Clock that only advances when something waits on it, so a test that takes
+    an hour in real time runs as fast as the code allows.
+    """
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.time: float = start
+
+    def now(self) -> float:
+        return self.time
+
+    def pause(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        if seconds > 0:
+            self.time += seconds
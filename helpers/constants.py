@@ -1,9 +1,12 @@
 from configparser import ConfigParser
+from pathlib import Path
 
 try:
-    from helpers.ini_reader import find_selection, get_ini_filepath, load_ini
+    from helpers.ini_reader import find_flag, find_selection, get_ini_filepath, load_ini
+    from helpers.units import parse_pressure
 except Exception:
-    from ini_reader import find_selection, get_ini_filepath, load_ini
+    from ini_reader import find_flag, find_selection, get_ini_filepath, load_ini
+    from units import parse_pressure
 
 
 VERSION: str = "1.1.2"
@@ -12,11 +15,19 @@ ini_path: str = get_ini_filepath()
 
 config_data: ConfigParser = load_ini(ini_path)
 
+# Results folders
+RESULTS_DIR: Path = Path("results")
+REMOTE_DATA_DIR: Path = Path(
+    r"\\opdata2\Company\PRODUCTION FOLDER\VAT Leak Valve Test Data\VAT Data by SN"
+)
+
 # Motor control constants
 STEPS_PER_REV: int = 200  # Set by motor design. DO NOT CHANGE!!!
 MICROSTEPS_PER_STEP: int = 1  # acceptable values are: 1, 2, 4, 8, 16, 32, 64, 128, 256 (motor velocity must be set slower, the smaller the microsteps are)
 MICROSTEPS_PER_REV: int = STEPS_PER_REV * MICROSTEPS_PER_STEP
 MAX_VALVE_TURNS: int = 22
+MOTOR_VELOCITY: int = 300  # microsteps per second
+MOTOR_ACCELERATION: int = 50  # microsteps per second squared
 
 # Valve test constants
 VALVE_STEP_SIZE: float = float(
@@ -39,20 +50,22 @@ DRIFT_TOLERANCE: float = float(
     )
 )
 
+# Pressures may be given with a unit, e.g. "5e-6 Torr". Bare numbers are mbar.
+
 # Window that determines if program will wait for stability set by DRIFT_TOLERANCE
-AOI_LOWER_BOUND: float = float(
+AOI_LOWER_BOUND: float = parse_pressure(
     find_selection(
         config_data=config_data, header="AOI_LOWER_BOUND", selection="AOI_LOWER_BOUND"
     )
 )  # Pressure Area Of Interest Lower Bound
-AOI_UPPER_BOUND: float = float(
+AOI_UPPER_BOUND: float = parse_pressure(
     find_selection(
         config_data=config_data, header="AOI_UPPER_BOUND", selection="AOI_UPPER_BOUND"
     )
 )  # Pressure Area Of Interest Upper Bound
 
 # Pressure at which the valve should start closing
-PRESSURE_TURN_POINT: float = float(
+PRESSURE_TURN_POINT: float = parse_pressure(
     find_selection(
         config_data=config_data,
         header="PRESSURE_TURN_POINT",
@@ -60,6 +73,175 @@ PRESSURE_TURN_POINT: float = float(
     )
 )
 
+# Sweep mode: turn the motor continuously outside of the AOI instead of stepping
+SWEEP_MODE: bool = find_flag(
+    config_data=config_data, header="SWEEP_MODE", selection="SWEEP_MODE"
+)
+
+# Motor velocity while sweeping (microsteps per second)
+SWEEP_VELOCITY: int = int(
+    find_selection(
+        config_data=config_data,
+        header="SWEEP_VELOCITY",
+        selection="SWEEP_VELOCITY",
+        fallback="2",
+    )
+)
+
+# The number of seconds between samples while sweeping
+SWEEP_SAMPLE_INTERVAL: float = float(
+    find_selection(
+        config_data=config_data,
+        header="SWEEP_SAMPLE_INTERVAL",
+        selection="SWEEP_SAMPLE_INTERVAL",
+        fallback="1",
+    )
+)
+
+# Coarse pre-scan: locate the AOI with large steps before the fine scan
+COARSE_SCAN: bool = find_flag(
+    config_data=config_data, header="COARSE_SCAN", selection="COARSE_SCAN"
+)
+
+# Valve turns per step during the coarse pre-scan
+COARSE_STEP_SIZE: float = float(
+    find_selection(
+        config_data=config_data,
+        header="COARSE_STEP_SIZE",
+        selection="COARSE_STEP_SIZE",
+        fallback="0.5",
+    )
+)
+
+COARSE_MOTOR_STEP_SIZE: int = int(COARSE_STEP_SIZE * MICROSTEPS_PER_REV)
+
+# The number of seconds to hold after each coarse step
+COARSE_HOLD_TIME: float = float(
+    find_selection(
+        config_data=config_data,
+        header="COARSE_HOLD_TIME",
+        selection="COARSE_HOLD_TIME",
+        fallback="2",
+    )
+)
+
+# Valve turns before the AOI entry at which the fine scan starts
+FINE_SCAN_MARGIN: float = float(
+    find_selection(
+        config_data=config_data,
+        header="FINE_SCAN_MARGIN",
+        selection="FINE_SCAN_MARGIN",
+        fallback="0.5",
+    )
+)
+
+# Valve model used to pick the golden curve envelope
+VALVE_MODEL: str = find_selection(
+    config_data=config_data,
+    header="VALVE_MODEL",
+    selection="VALVE_MODEL",
+    fallback="default",
+)
+
+# Allowed turns deviation from the golden curve(s)
+GOLDEN_CURVE_TOLERANCE: float = float(
+    find_selection(
+        config_data=config_data,
+        header="GOLDEN_CURVE_TOLERANCE",
+        selection="GOLDEN_CURVE_TOLERANCE",
+        fallback="0.25",
+    )
+)
+
+# Record serial command latencies and errors
+SERIAL_METRICS: bool = find_flag(
+    config_data=config_data,
+    header="SERIAL_METRICS",
+    selection="SERIAL_METRICS",
+    fallback=True,
+)
+
+SERIAL_CAPTURE: bool = find_flag(
+    config_data=config_data,
+    header="SERIAL_CAPTURE",
+    selection="SERIAL_CAPTURE",
+    fallback=False,
+)
+
+# Serial link speeds. With NEGOTIATE_BAUD_RATE the link setup moves both
+# devices to their fastest stable rate at startup and updates these
+NEGOTIATE_BAUD_RATE: bool = find_flag(
+    config_data=config_data,
+    header="NEGOTIATE_BAUD_RATE",
+    selection="NEGOTIATE_BAUD_RATE",
+    fallback=False,
+)
+MOTOR_BAUD_RATE: int = int(
+    find_selection(
+        config_data=config_data,
+        header="MOTOR_BAUD_RATE",
+        selection="MOTOR_BAUD_RATE",
+        fallback="9600",
+    )
+)
+GAUGE_BAUD_RATE: int = int(
+    find_selection(
+        config_data=config_data,
+        header="GAUGE_BAUD_RATE",
+        selection="GAUGE_BAUD_RATE",
+        fallback="9600",
+    )
+)
+
+# Reopen the motor and gauge ports when they are lost, e.g. by a USB-serial
+# adapter reset, and let a running test wait for them instead of failing
+HOT_RECONNECT: bool = find_flag(
+    config_data=config_data,
+    header="HOT_RECONNECT",
+    selection="HOT_RECONNECT",
+    fallback=True,
+)
+
+# Safety monitor: samples the gauge at full rate during moves and closes the valve
+# when the pressure exceeds SAFETY_PRESSURE_LIMIT or rises faster than
+# SAFETY_MAX_RISE decades per second
+SAFETY_MONITOR: bool = find_flag(
+    config_data=config_data,
+    header="SAFETY_MONITOR",
+    selection="SAFETY_MONITOR",
+    fallback=True,
+)
+SAFETY_PRESSURE_LIMIT: float = parse_pressure(
+    find_selection(
+        config_data=config_data,
+        header="SAFETY_PRESSURE_LIMIT",
+        selection="SAFETY_PRESSURE_LIMIT",
+        fallback=str(PRESSURE_TURN_POINT * 10),
+    )
+)
+SAFETY_MAX_RISE: float = float(
+    find_selection(
+        config_data=config_data,
+        header="SAFETY_MAX_RISE",
+        selection="SAFETY_MAX_RISE",
+        fallback="1.0",
+    )
+)
+
+# Logging: level of all modules, and per module levels as lines such as
+# "helpers.valve_test = DEBUG" under a [LOG_LEVELS] header
+LOG_LEVEL: str = find_selection(
+    config_data=config_data,
+    header="LOG_LEVEL",
+    selection="LOG_LEVEL",
+    fallback="INFO",
+).upper()
+LOG_LEVELS: dict[str, str] = (
+    {module: level.upper() for module, level in config_data.items("LOG_LEVELS")}
+    if config_data.has_section("LOG_LEVELS")
+    else {}
+)
+
 if __name__ == "__main__":
 
     def print_all_ini_constants():
@@ -69,5 +251,25 @@ if __name__ == "__main__":
         print(f"{AOI_LOWER_BOUND = }")
         print(f"{AOI_UPPER_BOUND = }")
         print(f"{PRESSURE_TURN_POINT = }")
+        print(f"{SWEEP_MODE = }")
+        print(f"{SWEEP_VELOCITY = }")
+        print(f"{SWEEP_SAMPLE_INTERVAL = }")
+        print(f"{COARSE_SCAN = }")
+        print(f"{COARSE_STEP_SIZE = }")
+        print(f"{COARSE_HOLD_TIME = }")
+        print(f"{FINE_SCAN_MARGIN = }")
+        print(f"{VALVE_MODEL = }")
+        print(f"{GOLDEN_CURVE_TOLERANCE = }")
+        print(f"{SERIAL_METRICS = }")
+        print(f"{SERIAL_CAPTURE = }")
+        print(f"{NEGOTIATE_BAUD_RATE = }")
+        print(f"{MOTOR_BAUD_RATE = }")
+        print(f"{GAUGE_BAUD_RATE = }")
+        print(f"{HOT_RECONNECT = }")
+        print(f"{SAFETY_MONITOR = }")
+        print(f"{SAFETY_PRESSURE_LIMIT = }")
+        print(f"{SAFETY_MAX_RISE = }")
+        print(f"{LOG_LEVEL = }")
+        print(f"{LOG_LEVELS = }")
 
     print_all_ini_constants()
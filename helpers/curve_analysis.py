@@ -0,0 +1,243 @@
+import csv
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from helpers.constants import AOI_LOWER_BOUND, AOI_UPPER_BOUND, RESULTS_DIR
+    from helpers.test_history import load_test_csv
+except Exception:
+    from constants import AOI_LOWER_BOUND, AOI_UPPER_BOUND, RESULTS_DIR
+    from test_history import load_test_csv
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+RESULTS_INDEX_PATH: Path = RESULTS_DIR / "results_index.csv"
+
+# Log10 pressure grid that both branches are resampled onto
+GRID_POINTS: int = 200
+GRID_LOWER_BOUND: float = AOI_LOWER_BOUND / 10
+GRID_UPPER_BOUND: float = AOI_UPPER_BOUND * 10
+
+# A pressure drop larger than this (in decades) while opening is non-monotonic
+MONOTONIC_TOLERANCE: float = 0.02
+
+
+def log_pressure_grid(
+    lower: float = GRID_LOWER_BOUND,
+    upper: float = GRID_UPPER_BOUND,
+    points: int = GRID_POINTS,
+) -> np.ndarray:
+    return np.linspace(np.log10(lower), np.log10(upper), points)
+
+
+def settled_branch(turns, pressure) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a branch to one reading per valve position, sorted by turns. The
+    last reading taken at a position is kept because it is the settled one.
+
+    :return: (turns, log10_pressure)
+    :rtype: tuple
+    """
+    turns = np.asarray(turns, dtype=float)
+    pressure = np.asarray(pressure, dtype=float)
+    valid = np.isfinite(turns) & np.isfinite(pressure) & (pressure > 0)
+    turns = turns[valid][::-1]
+    pressure = pressure[valid][::-1]
+    unique_turns, first_index = np.unique(turns, return_index=True)
+    return unique_turns, np.log10(pressure[first_index])
+
+
+def resample_branch(turns, pressure, grid: np.ndarray) -> np.ndarray:
+    """
+    Resample a branch to valve turns as a function of log10 pressure.
+
+    :param grid: log10 pressure grid
+    :return: turns at each grid point, NaN outside of the measured range
+    """
+    unique_turns, log_pressure = settled_branch(turns, pressure)
+    if unique_turns.size < 2:
+        return np.full(grid.shape, np.nan)
+    # Pressure must increase with turns to be inverted, so use its running
+    # maximum and keep the first turn at which each level was reached
+    log_pressure = np.maximum.accumulate(log_pressure)
+    levels, first_index = np.unique(log_pressure, return_index=True)
+    if levels.size < 2:
+        return np.full(grid.shape, np.nan)
+    return np.interp(grid, levels, unique_turns[first_index], left=np.nan, right=np.nan)
+
+
+def hysteresis_area(
+    grid: np.ndarray, resampled_up: np.ndarray, resampled_down: np.ndarray
+) -> float:
+    """Area between the opening and closing curves in turns x decades."""
+    gap = np.abs(resampled_down - resampled_up)
+    overlap = np.isfinite(gap)
+    if np.count_nonzero(overlap) < 2:
+        return float("nan")
+    return float(np.trapezoid(gap[overlap], grid[overlap]))
+
+
+def turns_at_pressure(grid: np.ndarray, resampled: np.ndarray, pressures) -> np.ndarray:
+    """Valve turns at which a resampled branch reaches each pressure."""
+    valid = np.isfinite(resampled)
+    if np.count_nonzero(valid) < 2:
+        return np.full(np.shape(pressures), np.nan)
+    return np.interp(
+        np.log10(pressures),
+        grid[valid],
+        resampled[valid],
+        left=np.nan,
+        right=np.nan,
+    )
+
+
+def max_reversal(turns, pressure) -> float:
+    """
+    Largest pressure drop, in decades, while the valve is opened further. A
+    monotonic branch returns 0.
+    """
+    _, log_pressure = settled_branch(turns, pressure)
+    if log_pressure.size < 2:
+        return 0.0
+    drops = np.maximum.accumulate(log_pressure) - log_pressure
+    return float(drops.max())
+
+
+def aoi_log_slope(turns, pressure) -> float:
+    """Slope of log10 pressure against turns inside the AOI, in decades per turn."""
+    unique_turns, log_pressure = settled_branch(turns, pressure)
+    in_aoi = (log_pressure > np.log10(AOI_LOWER_BOUND)) & (
+        log_pressure < np.log10(AOI_UPPER_BOUND)
+    )
+    if np.count_nonzero(in_aoi) < 2:
+        return float("nan")
+    slope, _ = np.polyfit(unique_turns[in_aoi], log_pressure[in_aoi], 1)
+    return float(slope)
+
+
+def analyze_test(
+    turns_up,
+    pressure_up,
+    turns_down,
+    pressure_down,
+    offset_pressures: tuple[float, ...] = (AOI_LOWER_BOUND, AOI_UPPER_BOUND),
+) -> dict[str, float | bool]:
+    """
+    Compute the curve metrics of a completed test.
+
+    :param offset_pressures: pressures at which the closing minus opening turn
+        offset is reported
+    :return: metric name to value
+    """
+    grid: np.ndarray = log_pressure_grid()
+    resampled_up: np.ndarray = resample_branch(turns_up, pressure_up, grid)
+    resampled_down: np.ndarray = resample_branch(turns_down, pressure_down, grid)
+    aoi_turns_up = turns_at_pressure(
+        grid, resampled_up, (AOI_LOWER_BOUND, AOI_UPPER_BOUND)
+    )
+    aoi_turns_down = turns_at_pressure(
+        grid, resampled_down, (AOI_LOWER_BOUND, AOI_UPPER_BOUND)
+    )
+    offsets = turns_at_pressure(
+        grid, resampled_down, offset_pressures
+    ) - turns_at_pressure(grid, resampled_up, offset_pressures)
+    reversal_up: float = max_reversal(turns_up, pressure_up)
+    reversal_down: float = max_reversal(turns_down, pressure_down)
+
+    metrics: dict[str, float | bool] = {
+        "hysteresis_area": hysteresis_area(grid, resampled_up, resampled_down),
+        "aoi_entry_turns_up": float(aoi_turns_up[0]),
+        "aoi_exit_turns_up": float(aoi_turns_up[1]),
+        "aoi_entry_turns_down": float(aoi_turns_down[0]),
+        "aoi_exit_turns_down": float(aoi_turns_down[1]),
+        "aoi_log_slope_up": aoi_log_slope(turns_up, pressure_up),
+        "aoi_log_slope_down": aoi_log_slope(turns_down, pressure_down),
+        "max_reversal_up": reversal_up,
+        "max_reversal_down": reversal_down,
+        "monotonic": bool(
+            reversal_up <= MONOTONIC_TOLERANCE and reversal_down <= MONOTONIC_TOLERANCE
+        ),
+    }
+    for pressure, offset in zip(offset_pressures, offsets):
+        metrics[f"turn_offset_at_{pressure:.0e}"] = float(offset)
+    return metrics
+
+
+def analyze_csv(file_path: Path) -> dict[str, float | bool | str]:
+    turns_up, pressure_up, turns_down, pressure_down = load_test_csv(file_path)
+    row: dict[str, float | bool | str] = {
+        "file": file_path.name,
+        "serial_number": file_path.parent.name,
+    }
+    row.update(analyze_test(turns_up, pressure_up, turns_down, pressure_down))
+    return row
+
+
+def write_results_index(
+    rows: list[dict], index_path: Path = RESULTS_INDEX_PATH, append: bool = False
+) -> None:
+    """
+    Write rows to the results index, or append them to it. Rows may have
+    different columns, e.g. golden-curve verdicts only once a golden curve
+    exists, or offsets at a changed AOI; when appended rows bring new
+    columns, the index is rewritten under the combined header.
+    """
+    if not rows:
+        return
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    fieldnames: list[str] = []
+    existing_rows: list[dict] = []
+    if append and index_path.exists():
+        with open(index_path, newline="") as file:
+            reader = csv.DictReader(file)
+            fieldnames = list(reader.fieldnames or [])
+            existing_rows = list(reader)
+    header: list[str] = list(fieldnames)
+    for row in rows:
+        header.extend(key for key in row if key not in header)
+    if append and header == fieldnames:
+        with open(index_path, mode="a", newline="") as file:
+            csv.DictWriter(file, fieldnames=header, restval="").writerows(rows)
+        return
+    with open(index_path, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=header, restval="")
+        writer.writeheader()
+        writer.writerows(existing_rows + rows)
+
+
+def analyze_archive(paths: list[Path]) -> list[dict]:
+    """
+    Analyze every csv file in the given files and folders (searched
+    recursively).
+    """
+    csv_files: list[Path] = []
+    for path in paths:
+        if path.is_dir():
+            csv_files.extend(sorted(path.rglob("*.csv")))
+        else:
+            csv_files.append(path)
+    rows: list[dict] = []
+    for file_path in csv_files:
+        if file_path.resolve() == RESULTS_INDEX_PATH.resolve():
+            continue
+        try:
+            rows.append(analyze_csv(file_path))
+        except (OSError, ValueError) as e:
+            logger.warning("Could not analyze %s: %s", file_path, e)
+    return rows
+
+
+def main() -> None:
+    paths: list[Path] = [Path(arg) for arg in sys.argv[1:]] or [
+        RESULTS_DIR / "csv_files"
+    ]
+    rows: list[dict] = analyze_archive(paths)
+    write_results_index(rows)
+    print(f"Analyzed {len(rows)} tests. Results index saved to {RESULTS_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import logging
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from helpers.constants import (
+        AOI_LOWER_BOUND,
+        AOI_UPPER_BOUND,
+        GOLDEN_CURVE_TOLERANCE,
+        RESULTS_DIR,
+    )
+    from helpers.curve_analysis import log_pressure_grid, resample_branch
+    from helpers.test_history import load_test_csv
+except Exception:
+    from constants import (
+        AOI_LOWER_BOUND,
+        AOI_UPPER_BOUND,
+        GOLDEN_CURVE_TOLERANCE,
+        RESULTS_DIR,
+    )
+    from curve_analysis import log_pressure_grid, resample_branch
+    from test_history import load_test_csv
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Kept with the results; the folder of the INI file is temporary in the EXE
+GOLDEN_CURVES_DIR: Path = RESULTS_DIR / "golden_curves"
+
+# Region name to the largest fraction of its grid points allowed outside the envelope
+REGIONS: dict[str, float] = {
+    "below_AOI": 0.1,
+    "AOI": 0.0,
+    "above_AOI": 0.1,
+}
+# Smallest fraction of the grid points the envelope covers in a region that a
+# test must also cover; an aborted test that never reached a region fails it
+MIN_REGION_COVERAGE: float = 0.5
+
+
+class GoldenEnvelope:
+    """
+    Tolerance envelope of the opening and closing curves of a valve model on a
+    log10 pressure grid. Each branch has a centre curve and lower and upper
+    turns limits.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        grid: np.ndarray,
+        centre: np.ndarray,
+        lower: np.ndarray,
+        upper: np.ndarray,
+    ) -> None:
+        """
+        :param grid: log10 pressure grid, shape (G,)
+        :param centre: centre turns, shape (2, G) for the opening and closing branch
+        :param lower: lower turns limit, shape (2, G)
+        :param upper: upper turns limit, shape (2, G)
+        """
+        self.model: str = model
+        self.grid: np.ndarray = grid
+        self.centre: np.ndarray = centre
+        self.lower: np.ndarray = lower
+        self.upper: np.ndarray = upper
+
+        log_lower: float = np.log10(AOI_LOWER_BOUND)
+        log_upper: float = np.log10(AOI_UPPER_BOUND)
+        self.region_masks: dict[str, np.ndarray] = {
+            "below_AOI": grid <= log_lower,
+            "AOI": (grid > log_lower) & (grid < log_upper),
+            "above_AOI": grid >= log_upper,
+        }
+
+    @classmethod
+    def from_curves(
+        cls,
+        model: str,
+        curves: list[tuple[list[float], list[float], list[float], list[float]]],
+        tolerance: float = GOLDEN_CURVE_TOLERANCE,
+    ) -> "GoldenEnvelope":
+        """
+        Build an envelope from one reference curve or from many good tests.
+        The envelope spans every curve, widened by tolerance turns.
+
+        :param curves: (turns_up, pressure_up, turns_down, pressure_down) per test
+        """
+        grid: np.ndarray = log_pressure_grid()
+        resampled: np.ndarray = resample_curves(grid, curves)
+        with warnings.catch_warnings():
+            # Grid points that no curve reaches stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            centre: np.ndarray = np.nanmedian(resampled, axis=0)
+            lower: np.ndarray = np.nanmin(resampled, axis=0) - tolerance
+            upper: np.ndarray = np.nanmax(resampled, axis=0) + tolerance
+        return cls(model, grid, centre, lower, upper)
+
+    @classmethod
+    def load(cls, model: str, folder: Path = GOLDEN_CURVES_DIR) -> "GoldenEnvelope":
+        with np.load(folder / f"{model}.npz") as data:
+            return cls(
+                model, data["grid"], data["centre"], data["lower"], data["upper"]
+            )
+
+    def save(self, folder: Path = GOLDEN_CURVES_DIR) -> Path:
+        folder.mkdir(parents=True, exist_ok=True)
+        file_path: Path = folder / f"{self.model}.npz"
+        np.savez(
+            file_path,
+            grid=self.grid,
+            centre=self.centre,
+            lower=self.lower,
+            upper=self.upper,
+        )
+        return file_path
+
+    def judge(self, resampled: np.ndarray) -> list[dict[str, float | bool]]:
+        """
+        Judge resampled tests against the envelope.
+
+        :param resampled: turns on the envelope grid, shape (N, 2, G)
+        :return: one verdict per test with the per-region deviations
+        """
+        with np.errstate(invalid="ignore"):
+            deviation: np.ndarray = resampled - self.centre
+            outside: np.ndarray = (resampled < self.lower) | (resampled > self.upper)
+        measured: np.ndarray = np.isfinite(deviation)
+        defined: np.ndarray = np.isfinite(self.centre)
+        verdicts: list[dict[str, float | bool]] = [
+            {"passed": True} for _ in range(resampled.shape[0])
+        ]
+        for region, allowed_fraction in REGIONS.items():
+            mask: np.ndarray = self.region_masks[region]
+            region_measured: np.ndarray = measured[:, :, mask].sum(axis=(1, 2))
+            region_outside: np.ndarray = outside[:, :, mask].sum(axis=(1, 2))
+            region_defined: int = int(defined[:, mask].sum())
+            abs_deviation: np.ndarray = np.where(
+                measured[:, :, mask], np.abs(deviation[:, :, mask]), 0.0
+            )
+            max_deviation: np.ndarray = abs_deviation.max(axis=(1, 2), initial=0.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraction_outside: np.ndarray = region_outside / region_measured
+                coverage: np.ndarray = region_measured / region_defined
+            for verdict, fraction, region_coverage, deviation_max in zip(
+                verdicts, fraction_outside, coverage, max_deviation
+            ):
+                verdict[f"{region}_max_deviation"] = float(deviation_max)
+                verdict[f"{region}_fraction_outside"] = float(fraction)
+                verdict[f"{region}_coverage"] = float(region_coverage)
+                # NaN compares False, so a region without readings must fail here
+                if region_defined and not (
+                    region_coverage >= MIN_REGION_COVERAGE
+                    and fraction <= allowed_fraction
+                ):
+                    verdict["passed"] = False
+        return verdicts
+
+    def compare(
+        self,
+        turns_up: list[float],
+        pressure_up: list[float],
+        turns_down: list[float],
+        pressure_down: list[float],
+    ) -> dict[str, float | bool]:
+        """Judge a single live or finished test against the envelope."""
+        resampled: np.ndarray = resample_curves(
+            self.grid, [(turns_up, pressure_up, turns_down, pressure_down)]
+        )
+        return self.judge(resampled)[0]
+
+
+def resample_curves(
+    grid: np.ndarray,
+    curves: list[tuple[list[float], list[float], list[float], list[float]]],
+) -> np.ndarray:
+    """
+    Resample the opening and closing branches of each test onto grid.
+
+    :return: turns, shape (N, 2, G)
+    """
+    resampled: np.ndarray = np.full((len(curves), 2, grid.size), np.nan)
+    for i, (turns_up, pressure_up, turns_down, pressure_down) in enumerate(curves):
+        resampled[i, 0] = resample_branch(turns_up, pressure_up, grid)
+        resampled[i, 1] = resample_branch(turns_down, pressure_down, grid)
+    return resampled
+
+
+def judge_archive(envelope: GoldenEnvelope, csv_files: list[Path]) -> list[dict]:
+    """Re-judge saved tests in one batch, e.g. after the envelope has changed."""
+    curves: list = []
+    names: list[str] = []
+    for file_path in csv_files:
+        try:
+            curves.append(load_test_csv(file_path))
+            names.append(file_path.name)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load %s: %s", file_path, e)
+    verdicts: list[dict] = envelope.judge(resample_curves(envelope.grid, curves))
+    return [{"file": name, **verdict} for name, verdict in zip(names, verdicts)]
+
+
+def main() -> None:
+    """
+    Usage:
+        python golden_curve.py build MODEL CSV_FILE [CSV_FILE ...]
+        python golden_curve.py judge MODEL [FOLDER]
+    """
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "judge"):
+        print(main.__doc__)
+        return
+    command, model = sys.argv[1], sys.argv[2]
+    if command == "build":
+        curves = [load_test_csv(Path(arg)) for arg in sys.argv[3:]]
+        file_path: Path = GoldenEnvelope.from_curves(model, curves).save()
+        print(f"Golden curve envelope saved to {file_path}")
+    else:
+        folder: Path = (
+            Path(sys.argv[3]) if len(sys.argv) > 3 else RESULTS_DIR / "csv_files"
+        )
+        envelope: GoldenEnvelope = GoldenEnvelope.load(model)
+        for verdict in judge_archive(envelope, sorted(folder.rglob("*.csv"))):
+            result: str = "PASS" if verdict["passed"] else "FAIL"
+            print(f"{result}  {verdict['file']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
+import re
 import sys
 from configparser import ConfigParser
 
 
+def ini_is_writable() -> bool:
+    """A PyInstaller EXE reads its INI from a temporary folder."""
+    return not hasattr(sys, "frozen")
+
+
 def get_ini_filepath() -> str:
     if hasattr(sys, "frozen"):  # Check if running as a PyInstaller EXE
         return sys._MEIPASS + "/configuration/valve_test.ini"  # type:ignore
@@ -19,5 +25,57 @@ def find_comport(config_data: ConfigParser, header: str) -> str:
     return config_data.get(header, "com_port")
 
 
-def find_selection(config_data: ConfigParser, header: str, selection: str) -> str:
-    return config_data.get(header, f"{selection}")
+def find_selection(
+    config_data: ConfigParser, header: str, selection: str, fallback: str | None = None
+) -> str:
+    if fallback is None:
+        return config_data.get(header, f"{selection}")
+    return config_data.get(header, f"{selection}", fallback=fallback)
+
+
+def find_flag(
+    config_data: ConfigParser, header: str, selection: str, fallback: bool = False
+) -> bool:
+    return config_data.getboolean(header, f"{selection}", fallback=fallback)
+
+
+def save_selection(ini_file: str, header: str, selection: str, value: str) -> None:
+    """
+    Set one selection in the INI file. Only its line changes, so comments
+    and the case of the keys stay as the operator wrote them; a missing
+    selection or header is added.
+    """
+    with open(ini_file, newline="") as file:
+        lines: list[str] = file.readlines()
+    newline: str = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+    key = re.compile(rf"^(\s*{re.escape(selection)}\s*[=:]\s*)", re.IGNORECASE)
+    # Index after the last non-blank line of the section, None if not found
+    section_end: int | None = None
+    in_section: bool = False
+    match: re.Match | None = None
+    for i, line in enumerate(lines):
+        stripped: str = line.strip()
+        if stripped.startswith("[") and stripped.endswith("]"):
+            if in_section:
+                break
+            in_section = stripped[1:-1].strip() == header
+            if in_section:
+                section_end = i + 1
+            continue
+        if not in_section:
+            continue
+        match = key.match(line)
+        if match:
+            ending: str = line[len(line.rstrip("\r\n")) :] or newline
+            lines[i] = f"{match.group(1)}{value}{ending}"
+            break
+        if stripped:
+            section_end = i + 1
+    if match is None and section_end is not None:
+        lines.insert(section_end, f"{selection} = {value}{newline}")
+    elif match is None:
+        if lines and not lines[-1].endswith(("\n", "\r")):
+            lines[-1] += newline
+        lines.append(f"{newline}[{header}]{newline}{selection} = {value}{newline}")
+    with open(ini_file, "w", newline="") as file:
+        file.writelines(lines)
@@ -0,0 +1,106 @@
+"""Serial link speed negotiation for the motor and gauge controllers.
+
+Each driver offers BAUD_RATES, set_baud_rate(), which switches the device and
+then the port, and check_link(), a short round trip that returns False instead
+of raising. The link is moved to the highest rate that passes LINK_CHECKS
+checks in a row, and falls back to the last good rate otherwise.
+"""
+
+import logging
+
+try:
+    from helpers.ini_reader import get_ini_filepath, ini_is_writable, save_selection
+except Exception:
+    from ini_reader import get_ini_filepath, ini_is_writable, save_selection
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+LINK_CHECKS: int = 5
+
+
+def probe_baud_rate(device) -> int | None:
+    """
+    Find the rate the device is talking at, trying the port's current rate
+    first.
+
+    :return: the baud rate, or None if the device does not answer at any rate
+    """
+    current: int = device.serial.baudrate
+    for baudrate in (current, *sorted(device.BAUD_RATES, reverse=True)):
+        device.serial.baudrate = baudrate
+        if device.check_link():
+            return baudrate
+    device.serial.baudrate = current
+    return None
+
+
+def link_is_stable(device, checks: int = LINK_CHECKS) -> bool:
+    return all(device.check_link() for _ in range(checks))
+
+
+def _fall_back(device, name: str, baudrate: int) -> int:
+    """Return the device to a known good rate after a failed switch."""
+    try:
+        device.set_baud_rate(baudrate)
+    except (IOError, ValueError):
+        pass
+    if device.check_link():
+        return baudrate
+    found: int | None = probe_baud_rate(device)
+    if found is None:
+        raise IOError(f"Lost contact with the {name} while changing baud rate")
+    return found
+
+
+def negotiate_baud_rate(device, name: str, checks: int = LINK_CHECKS) -> int:
+    """
+    Move the device to the highest baud rate with a stable link.
+
+    :param device: MotorController, TPG26x or AGC100
+    :param name: device name for messages
+    :return: the baud rate the link ends up at
+    """
+    current: int | None = probe_baud_rate(device)
+    if current is None:
+        raise IOError(f"The {name} does not answer at any of {device.BAUD_RATES}")
+    for baudrate in sorted(device.BAUD_RATES, reverse=True):
+        if baudrate <= current:
+            break
+        try:
+            device.set_baud_rate(baudrate)
+        except (IOError, ValueError) as e:
+            logger.warning("Could not switch the %s to %s baud: %s", name, baudrate, e)
+            current = _fall_back(device, name, current)
+            continue
+        if link_is_stable(device, checks):
+            current = baudrate
+            break
+        logger.warning("The %s link is not stable at %s baud.", name, baudrate)
+        current = _fall_back(device, name, current)
+    logger.info("%s link at %s baud", name, current)
+    return current
+
+
+def setup_link(device, name: str, ini_header: str, saved_baud_rate: int) -> int:
+    """
+    Negotiate the link speed and save it to the INI file when it changed, so
+    the next start opens the port at the right rate. The INI of an EXE is in
+    a temporary folder, so there the rate is only logged for the operator.
+    """
+    baudrate: int = negotiate_baud_rate(device, name)
+    if baudrate != saved_baud_rate and not ini_is_writable():
+        logger.warning(
+            "The %s link runs at %s baud. Set [%s] %s = %s in the INI file to "
+            "open it at that rate.",
+            name,
+            baudrate,
+            ini_header,
+            ini_header,
+            baudrate,
+        )
+    elif baudrate != saved_baud_rate:
+        try:
+            save_selection(get_ini_filepath(), ini_header, ini_header, str(baudrate))
+        except OSError as e:
+            logger.error("Could not save %s to the INI file: %s", ini_header, e)
+    return baudrate
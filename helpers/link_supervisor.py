@@ -0,0 +1,232 @@
+"""Hot reconnect of the motor and gauge controllers.
+
+A SupervisedDevice forwards every call to its driver. When the port is lost,
+e.g. because a USB-serial adapter reset, the call raises LinkLost instead of
+the raw serial error, and later calls, or restore(), reopen the port with an
+exponential backoff. After reopening, the link speed is probed again, the
+device configuration is replayed and the device is verified before it is
+marked connected. A gauge that was in continuous mode is returned to it.
+SupervisedMotor also tracks where the motor should be, so a
+controller that lost its position while the link was down is detected.
+"""
+
+import logging
+import threading
+import time
+
+import serial
+
+from api.transport import reopen_transport
+from helpers.link_setup import probe_baud_rate
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Seconds before the first reconnect attempt, doubled after each failure
+BACKOFF_START: float = 0.5
+BACKOFF_MAX: float = 30.0
+# Seconds to wait for a move that was under way when the link dropped
+SETTLE_TIMEOUT: float = 120.0
+
+
+class LinkLost(serial.SerialException):
+    """The port of a supervised device is lost and not yet restored."""
+
+    def __init__(self, device: "SupervisedDevice", message: str) -> None:
+        super().__init__(message)
+        self.device: SupervisedDevice = device
+
+
+class SupervisedDevice:
+    """
+    Proxy of a driver that restores its link when the port is lost.
+
+    :param device: MotorController, TPG26x, AGC100 or any driver with a
+        serial attribute and check_link()
+    :param name: device name for messages
+    :param configure: called with the driver after the port is reopened, to
+        replay its settings
+    """
+
+    def __init__(self, device, name: str, configure=None) -> None:
+        self.device = device
+        self.name: str = name
+        self.configure = configure
+        self.connected: bool = True
+        self.reconnects: int = 0
+        self.on_change: list = []
+        self._backoff: float = BACKOFF_START
+        self._next_attempt: float = 0.0
+        self._restore_lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.device, name)
+        if not callable(attribute):
+            return attribute
+
+        def supervised(*args, **kwargs):
+            return self.call(name, attribute, args, kwargs)
+
+        return supervised
+
+    def call(self, name: str, method, args: tuple, kwargs: dict):
+        if not self.connected and not self.restore():
+            raise LinkLost(self, f"The {self.name} link is down")
+        try:
+            return method(*args, **kwargs)
+        except serial.SerialException as e:
+            self._lost(e)
+            raise LinkLost(self, f"Lost the {self.name} link: {e}") from e
+
+    def _lost(self, error: Exception) -> None:
+        if not self.connected:
+            return
+        self.connected = False
+        self._backoff = BACKOFF_START
+        self._next_attempt = time.monotonic() + self._backoff
+        logger.warning("Lost the %s link: %s. Reconnecting.", self.name, error)
+        self._notify()
+
+    def _notify(self) -> None:
+        for callback in self.on_change:
+            callback(self.name, self.connected)
+
+    def restore(self) -> bool:
+        """
+        Try to reopen the port if the backoff delay has passed. Returns at
+        once when another thread is already reconnecting.
+
+        :return: True if the device is connected
+        """
+        if self.connected:
+            return True
+        if not self._restore_lock.acquire(blocking=False):
+            return False
+        try:
+            if self.connected:
+                return True
+            if time.monotonic() < self._next_attempt:
+                return False
+            try:
+                self._reconnect()
+            except (IOError, ValueError) as e:
+                self._backoff = min(2 * self._backoff, BACKOFF_MAX)
+                self._next_attempt = time.monotonic() + self._backoff
+                logger.warning(
+                    "Could not reconnect the %s: %s. Retrying in %g s.",
+                    self.name,
+                    e,
+                    self._backoff,
+                )
+                return False
+            self.connected = True
+            self.reconnects += 1
+            logger.info("Reconnected the %s.", self.name)
+            self._notify()
+            return True
+        finally:
+            self._restore_lock.release()
+
+    def _reconnect(self) -> None:
+        """
+        :raises IOError: if the device cannot be reached or configured
+        """
+        with self.device.lock:
+            reopen_transport(self.device.serial)
+            # A controller that was power cycled has left continuous mode, one
+            # whose adapter reset is still in it; start over from request mode
+            streaming: bool = getattr(self.device, "streaming", False)
+            if streaming:
+                self.device.stop_streaming()
+            # A controller that was power cycled is back at its default rate
+            if not self.device.check_link() and probe_baud_rate(self.device) is None:
+                raise IOError(f"The {self.name} does not answer")
+        # Outside the lock: waiting may run a nested event loop on the GUI
+        # thread. Calls through the proxy fail with LinkLost meanwhile.
+        self._prepare()
+        with self.device.lock:
+            if self.configure is not None:
+                self.configure(self.device)
+            if streaming:
+                self.device.start_streaming()
+            self._verify()
+
+    def _prepare(self) -> None:
+        """Bring the device to a state in which it can be configured."""
+
+    def _verify(self) -> None:
+        if not self.device.check_link():
+            raise IOError(f"The {self.name} does not answer after reconnecting")
+
+
+class SupervisedMotor(SupervisedDevice):
+    """
+    SupervisedDevice of a MotorController that follows the position the motor
+    should end up at. After a reconnect the motor must report either that
+    position or the target of the command the link dropped during; anything
+    else means the controller lost its position, and position_verified stays
+    False until the motor is zeroed. Homing does not help: the controller
+    would return to a zero it no longer knows, so only a set_zero issued once
+    the operator has confirmed the valve is closed restores the position.
+    """
+
+    def __init__(self, device, name: str = "motor", configure=None) -> None:
+        super().__init__(device, name, configure)
+        # Position the motor is at or moving to, None until known
+        self.expected_position: int | None = None
+        # Target of the move in progress when the link dropped
+        self.pending_position: int | None = None
+        self.position_verified: bool = True
+
+    def call(self, name: str, method, args: tuple, kwargs: dict):
+        target: int | None = self._target(name, args)
+        if target is not None:
+            self.pending_position = target
+        result = super().call(name, method, args, kwargs)
+        if target is not None and self.device.last_error:
+            # The controller refused the command
+            self.pending_position = None
+        elif target is not None:
+            self.expected_position = target
+            self.pending_position = None
+            if name == "set_zero":
+                self.position_verified = True
+        elif name == "query_position" and result != "" and not self.device.busy:
+            self.expected_position = int(result)
+        elif name == "stop":
+            # The motor stops wherever it is; the next query tells where
+            self.expected_position = None
+        return result
+
+    def _target(self, name: str, args: tuple) -> int | None:
+        if name in ("home_motor", "set_zero"):
+            return 0
+        if name == "move_absolute":
+            return int(args[0])
+        if name == "move_relative" and self.expected_position is not None:
+            return self.expected_position + int(args[0])
+        return None
+
+    def _prepare(self) -> None:
+        # Let a move that was under way when the link dropped finish
+        deadline: float = time.monotonic() + SETTLE_TIMEOUT
+        while self.device.is_busy():
+            if time.monotonic() > deadline:
+                raise IOError(f"The {self.name} did not finish its move")
+            self.device.pause(0.25)
+
+    def _verify(self) -> None:
+        position: str = self.device.query_position()
+        if position == "":
+            raise IOError(f"The {self.name} does not report its position")
+        allowed: set[int | None] = {self.expected_position, self.pending_position}
+        if self.expected_position is not None and int(position) not in allowed:
+            self.position_verified = False
+            logger.error(
+                "The %s reports position %s instead of %s. "
+                "Close the valve and set zero before continuing.",
+                self.name,
+                position,
+                self.expected_position,
+            )
+        self.expected_position = int(position)
+        self.pending_position = None
@@ -0,0 +1,137 @@
+"""Logging of the application through a queue and a background writer.
+
+Every module logs to ``logging.getLogger(__name__)``. setup_logging puts a
+QueueHandler on the root logger, so a log call in the acquisition loop only
+formats its message and appends it to an unbounded queue; a QueueListener
+thread writes the records to the console and to rotating JSON lines files
+under results/logs, one object per record. Levels are set for all modules by
+LOG_LEVEL and per module by the [LOG_LEVELS] section of the INI file; a
+disabled call costs a level check.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from helpers.constants import LOG_LEVEL, LOG_LEVELS, RESULTS_DIR
+except Exception:
+    from constants import LOG_LEVEL, LOG_LEVELS, RESULTS_DIR
+
+LOG_DIR: Path = RESULTS_DIR / "logs"
+LOG_FILE_NAME: str = "valve_test.jsonl"
+# Size of one log file and number of older files kept
+LOG_MAX_BYTES: int = 5_000_000
+LOG_BACKUP_COUNT: int = 5
+
+CONSOLE_FORMAT: str = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Attributes every LogRecord has; any other attribute came from extra={...}
+_RECORD_ATTRIBUTES: frozenset[str] = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None)).keys()
+) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a record as one JSON object: time, level, logger, thread, message,
+    the fields passed with extra={...} and the exception traceback, if any.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the extra fields of a record as attributes for
+    the JSON formatter, instead of flattening the record into console text.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames that must not outlive the caller
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _stop_listener(listener: logging.handlers.QueueListener) -> None:
+    # QueueListener.stop fails when called a second time
+    if listener._thread is not None:
+        listener.stop()
+
+
+def setup_logging(
+    log_dir: Path = LOG_DIR,
+    level: str = LOG_LEVEL,
+    module_levels: dict[str, str] | None = None,
+    console: bool = True,
+) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue to a background writer. The writer is
+    stopped, and the queue flushed, when the interpreter exits.
+
+    :param module_levels: logger name -> level, LOG_LEVELS by default
+    :return: the started listener
+    """
+    handlers: list[logging.Handler] = []
+    try:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_dir / LOG_FILE_NAME,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        print(f"Could not open the log file in {log_dir}: {e}", file=sys.stderr)
+    # Frozen windowed builds have no console
+    if console and sys.stdout is not None:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    root: logging.Logger = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(StructuredQueueHandler(log_queue))
+    root.setLevel(level)
+    for name, module_level in (
+        LOG_LEVELS if module_levels is None else module_levels
+    ).items():
+        logging.getLogger(name).setLevel(module_level)
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
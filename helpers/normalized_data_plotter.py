@@ -1,7 +1,15 @@
 try:
-    from helpers.constants import AOI_LOWER_BOUND, AOI_UPPER_BOUND
+    from helpers.constants import (
+        AOI_LOWER_BOUND,
+        AOI_UPPER_BOUND,
+        REMOTE_DATA_DIR,
+        RESULTS_DIR,
+    )
+    from helpers.units import CANONICAL_UNIT, parse_pressure
 except Exception:
-    from constants import AOI_LOWER_BOUND, AOI_UPPER_BOUND
+    from constants import AOI_LOWER_BOUND, AOI_UPPER_BOUND, REMOTE_DATA_DIR, RESULTS_DIR
+    from units import CANONICAL_UNIT, parse_pressure
+import logging
 from datetime import datetime
 from pathlib import Path
 
@@ -9,6 +17,72 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.figure import Figure
 
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Figure and axes style shared by the plot window and the valve reports
+FIGURE_OPTIONS: dict = {
+    "dpi": 200,
+    "frameon": True,
+    "edgecolor": "k",
+    "linewidth": 2,
+    "figsize": (11 * 0.6, 8 * 0.5),
+}
+OPENING_COLOR: str = "tab:blue"
+CLOSING_COLOR: str = "lightskyblue"
+
+
+def style_axes(ax, title: str) -> None:
+    """Apply the normalized pressure vs turns layout, with the AOI shaded."""
+    ax.set_title(title, fontsize=10)
+    ax.set_xlabel("Valve Turns", fontsize=7)
+    ax.set_ylabel(f"Normalized Pressure ({CANONICAL_UNIT})", fontsize=7)
+    ax.set_yscale("log")
+    ax.set_xlim(-0.5, 12.5)
+    ax.set_ylim(1e-9, 1e-3)
+    ax.grid(True)
+    ax.fill_betweenx(
+        [AOI_LOWER_BOUND, AOI_UPPER_BOUND],
+        [-0.5],
+        [12.5],
+        alpha=0.25,
+        color="silver",
+    )
+    ax.tick_params(axis="both", labelsize=8)
+    ax.set_xticks(range(0, 13))
+
+
+def plot_branches(
+    ax,
+    x_up,
+    normalized_y_up,
+    x_down,
+    normalized_y_down,
+    opening_color: str = OPENING_COLOR,
+    closing_color: str = CLOSING_COLOR,
+    label: str = "",
+) -> None:
+    """
+    Plot the opening and closing curves of a test. With a label, the closing
+    curve is dashed so several tests can share one axes.
+    """
+    ax.plot(
+        x_up,
+        normalized_y_up,
+        label=f"{label} Opening".strip(),
+        color=opening_color,
+        marker="o",
+        markersize=2,
+    )
+    ax.plot(
+        x_down,
+        normalized_y_down,
+        label=f"{label} Closing".strip(),
+        color=closing_color,
+        marker="o",
+        markersize=2,
+        linestyle="--" if label else "-",
+    )
+
 
 class NormalizedPlot:
     def __init__(
@@ -16,34 +90,11 @@ class NormalizedPlot:
     ) -> None:
         self.serial_number: str = valve_serial_number
         self.rework_letter: str = rework_letter
-        self.base_pressure: float = float(base_pressure)
-
-        self.fig = plt.figure(
-            dpi=200,
-            frameon=True,
-            edgecolor="k",
-            linewidth=2,
-            figsize=(11 * 0.6, 8 * 0.5),
-        )
+        self.base_pressure: float = parse_pressure(base_pressure)
+
+        self.fig = plt.figure(**FIGURE_OPTIONS)
         self.ax = self.fig.add_subplot(1, 1, 1)
-        self.ax.set_title(
-            f"VAT Valve: {self.serial_number}({self.rework_letter})", fontsize=10
-        )
-        self.ax.set_xlabel("Valve Turns", fontsize=7)
-        self.ax.set_ylabel("Normalized Pressure (mBar)", fontsize=7)
-        self.ax.set_yscale("log")
-        self.ax.set_xlim(-0.5, 12.5)
-        self.ax.set_ylim(1e-9, 1e-3)
-        self.ax.grid(True)
-        self.ax.fill_betweenx(
-            [AOI_LOWER_BOUND, AOI_UPPER_BOUND],
-            [-0.5],
-            [12.5],
-            alpha=0.25,
-            color="silver",
-        )
-        self.ax.tick_params(axis="both", labelsize=8)
-        self.ax.set_xticks(range(0, 13))
+        style_axes(self.ax, f"VAT Valve: {self.serial_number}({self.rework_letter})")
 
     def plot(
         self,
@@ -59,21 +110,12 @@ class NormalizedPlot:
         self.normalized_y_up = self.y_up - self.base_pressure
         self.normalized_y_down = self.y_down - self.base_pressure
 
-        self.ax.plot(
+        plot_branches(
+            self.ax,
             self.x_up,
             self.normalized_y_up,
-            label="Opening",
-            color="tab:blue",
-            marker="o",
-            markersize=2,
-        )
-        self.ax.plot(
             self.x_down,
             self.normalized_y_down,
-            label="Closing",
-            color="lightskyblue",
-            marker="o",
-            markersize=2,
         )
         self.ax.legend(fontsize=5)
         self.fig.tight_layout()
@@ -84,7 +126,7 @@ class NormalizedPlot:
     def save_figure_locally(self) -> None:
         date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
         file_name: str = f"{date_time} {self.serial_number}{self.rework_letter} Normalized Pressure vs Turns.jpg"
-        results_dir: Path = Path("results")
+        results_dir: Path = RESULTS_DIR
         plot_figures_dir: str = "plot_figures"
         valve_dir: str = f"{self.serial_number}"
         folder_path: Path = results_dir / plot_figures_dir / valve_dir
@@ -93,20 +135,18 @@ class NormalizedPlot:
             file_path: Path = folder_path / file_name
             self.fig.savefig(file_path)
         else:
-            print(f"Could not save figure. {folder_path} does not exist.")
+            logger.error("Could not save figure. %s does not exist.", folder_path)
 
     def save_figure_remotely(self) -> None:
         date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
         file_name: str = f"{date_time} {self.serial_number}{self.rework_letter} Normalized Pressure vs Turns.jpg"
-        VAT_data_by_SN_dir: Path = Path(
-            r"\\opdata2\Company\PRODUCTION FOLDER\VAT Leak Valve Test Data\VAT Data by SN"
-        )
+        VAT_data_by_SN_dir: Path = REMOTE_DATA_DIR
         valve_dir: str = f"{self.serial_number}"
         folder_path: Path = VAT_data_by_SN_dir / valve_dir
         try:
             folder_path.mkdir(parents=True, exist_ok=True)
         except Exception:
-            print(
+            logger.warning(
                 "Could not save figure to company drive. Attempting to save locally..."
             )
             self.save_figure_locally()
@@ -0,0 +1,88 @@
+import csv
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class PhaseProfiler:
+    """
+    Timestamps the entry and exit of each phase of a valve test. Phases can be
+    nested; the summary uses the time spent in a phase itself, excluding the
+    phases nested in it, so the phase totals add up to the profiled time.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock: Callable[[], float] = clock
+        self.start_time: float = clock()
+        # (phase, depth, start, end, self_time), in order of exit
+        self.timeline: list[tuple[str, int, float, float, float]] = []
+        # [phase, start, time spent in nested phases]
+        self._stack: list[list] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        entry: list = [name, self.clock(), 0.0]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            end: float = self.clock()
+            self._stack.pop()
+            duration: float = end - entry[1]
+            if self._stack:
+                self._stack[-1][2] += duration
+            self.timeline.append(
+                (
+                    name,
+                    len(self._stack),
+                    entry[1] - self.start_time,
+                    end - self.start_time,
+                    duration - entry[2],
+                )
+            )
+
+    def totals(self) -> dict[str, tuple[int, float]]:
+        """Return phase name to (count, total self time)."""
+        totals: dict[str, tuple[int, float]] = {}
+        for name, _, _, _, self_time in self.timeline:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + self_time)
+        return totals
+
+    def summary(self) -> str:
+        """Return a table of the phases, longest total first."""
+        elapsed: float = self.clock() - self.start_time
+        totals: dict[str, tuple[int, float]] = self.totals()
+        lines: list[str] = [
+            f"{'phase':<16} {'count':>6} {'total s':>9} {'mean s':>8} {'% of test':>9}"
+        ]
+        for name, (count, total) in sorted(
+            totals.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            percent: float = total / elapsed * 100 if elapsed > 0 else 0.0
+            lines.append(
+                f"{name:<16} {count:>6} {total:>9.1f} {total / count:>8.2f} {percent:>9.1f}"
+            )
+        unprofiled: float = elapsed - sum(total for _, total in totals.values())
+        lines.append(f"{'(other)':<16} {'':>6} {unprofiled:>9.1f}")
+        lines.append(f"{'total':<16} {'':>6} {elapsed:>9.1f}")
+        return "\n".join(lines)
+
+    def write_timeline(self, file_path: Path) -> None:
+        """Write every phase with its start and end time to a csv file."""
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Phase", "Depth", "Start (s)", "End (s)", "Self Time (s)"])
+            for name, depth, start, end, self_time in sorted(
+                self.timeline, key=lambda event: event[2]
+            ):
+                writer.writerow(
+                    [name, depth, f"{start:.3f}", f"{end:.3f}", f"{self_time:.3f}"]
+                )
+
+    def write_summary(self, file_path: Path) -> None:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, mode="w") as file:
+            file.write(self.summary() + "\n")
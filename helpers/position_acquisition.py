@@ -1,22 +1,55 @@
+import logging
 import threading
-import time
-import traceback
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal
 
 from api.motor import MotorController
 from helpers.constants import MICROSTEPS_PER_REV
+from helpers.link_supervisor import LinkLost
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class PositionAcquisition(QObject):
+    """
+    Polls the motor position in a background thread and delivers it to
+    update_callback on the GUI thread.
+
+    The position is polled every fast_interval while the motor is moving and
+    every idle_interval otherwise. Positions cross to the GUI thread through a
+    queued signal and only the latest one is handed to update_callback, at most
+    refresh_rate times per second.
+    """
 
+    position_changed = Signal(float)
 
-class PositionAcquisition:
     def __init__(
-        self, motor: MotorController, update_callback, interval: float | int = 1
+        self,
+        motor: MotorController,
+        update_callback,
+        fast_interval: float = 0.1,
+        idle_interval: float = 1,
+        refresh_rate: int = 60,
     ) -> None:
         super().__init__()
         self.motor: MotorController = motor
         self.update_callback = update_callback
-        self.interval: float | int = interval
+        self.fast_interval: float = fast_interval
+        self.idle_interval: float = idle_interval
         self.running: bool = False
+        self.paused: bool = False
 
         self.acq_thread: threading.Thread | None = None
+        self._wake_event = threading.Event()
+        self._last_motor_position: int | None = None
+
+        self._latest_valve_position: float | None = None
+        self.position_changed.connect(
+            self._store_position, Qt.ConnectionType.QueuedConnection
+        )
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(max(1, 1000 // refresh_rate))
+        self.refresh_timer.timeout.connect(self._refresh)
 
     def start(self) -> None:
         """
@@ -24,38 +57,83 @@ class PositionAcquisition:
         """
         if not self.running:
             self.running = True
-            self.acq_thread = threading.Thread(target=self._run)
+            self.acq_thread = threading.Thread(target=self._run, daemon=True)
             self.acq_thread.start()
-            print("Started threading.\n")
+            self.refresh_timer.start()
+            logger.debug("Started threading.")
 
     def stop(self) -> None:
         """
         Stop the position acquisition process
         """
         self.running = False
+        self._wake_event.set()
+        self.refresh_timer.stop()
         if self.acq_thread is not None:
             self.acq_thread.join()
-            print("Stopped threading.\n")
+            self.acq_thread = None
+            logger.debug("Stopped threading.")
+
+    def pause(self) -> None:
+        """
+        Stop polling while something else, such as a valve test, drives the
+        motor and updates the position label.
+        """
+        self.paused = True
+
+    def resume(self) -> None:
+        self.paused = False
+        self.wake()
+
+    def wake(self) -> None:
+        """
+        Poll now and at the fast rate, e.g. right after a move command.
+        """
+        self._last_motor_position = None
+        self._wake_event.set()
 
     def _run(self) -> None:
         """
         Run the data acquisition loop in the background.
         """
         while self.running:
-            self._fetch_data()
-            time.sleep(self.interval)
+            moving: bool = False
+            if not self.paused:
+                moving = self._fetch_data()
+            self._wake_event.wait(self.fast_interval if moving else self.idle_interval)
+            self._wake_event.clear()
 
-    def _fetch_data(self) -> None:
+    def _fetch_data(self) -> bool:
         """
-        Fetch data from the motor and update the position
+        Fetch data from the motor and emit the position
+
+        :return: True if the motor is moving
         """
         if not self.motor:
-            return
+            return False
 
         try:
-            motor_position: str = self.motor.query_position()
-            valve_position: float = int(motor_position) / MICROSTEPS_PER_REV
-            self.update_callback(valve_position)
-        except Exception as e:
-            traceback.print_exc()
-            print(f"\nError while fetching data: {e}\n")
+            with self.motor.lock:
+                motor_position: int = int(self.motor.query_position())
+                busy: bool = self.motor.busy
+        except LinkLost:
+            # The supervisor reports the outage; polling drives the reconnect
+            return False
+        except Exception:
+            logger.exception("Error while fetching data")
+            return False
+        moving: bool = busy or motor_position != self._last_motor_position
+        if motor_position != self._last_motor_position:
+            self.position_changed.emit(motor_position / MICROSTEPS_PER_REV)
+        self._last_motor_position = motor_position
+        return moving
+
+    def _store_position(self, valve_position: float) -> None:
+        self._latest_valve_position = valve_position
+
+    def _refresh(self) -> None:
+        if self._latest_valve_position is None:
+            return
+        valve_position: float = self._latest_valve_position
+        self._latest_valve_position = None
+        self.update_callback(valve_position)
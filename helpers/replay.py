@@ -0,0 +1,218 @@
+"""Replay a recorded test trace through ValveTest on a virtual clock.
+
+Usage:
+    python -m helpers.replay TRACE_FILE [--plot]
+    python -m helpers.replay --simulate [SEED] [--plot]
+
+The trace is played back through ReplayMotor and ReplayGauge, so the current
+stepping, stability and stop logic decides what to do with the recorded
+pressures. The report tells whether it made the same step and stop decisions
+as the recorded test.
+
+With --simulate the test runs against the simulated test stand of
+api.simulator instead, and the report gives its duration and step count.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from PySide6.QtWidgets import QApplication, QLabel
+
+from api.simulator import SimulatedGauge, create_simulation
+from gui.live_plot_window import LivePlotWindow
+from helpers.clock import VirtualClock
+from helpers.constants import MAX_VALVE_TURNS, MICROSTEPS_PER_REV
+from helpers.replay_devices import ReplayGauge, ReplayMotor, load_trace
+from helpers.valve_test import ValveTest
+
+# A replay stops after this many times the duration of the recorded test, in
+# case the current logic never meets a stop condition on the recording
+REPLAY_TIME_FACTOR: float = 20.0
+
+
+class NullPlotWindow:
+    """Stand-in for LivePlotWindow when the replay runs without plotting."""
+
+    def update_plot(self, *args) -> None:
+        pass
+
+
+class NullLabel:
+    """Stand-in for the valve position QLabel."""
+
+    def setText(self, text: str) -> None:
+        pass
+
+
+def step_decisions(
+    trace: list[tuple[float, float, int, float, str]],
+) -> list[tuple[str, int]]:
+    """Return the (direction, motor position) of each step in a trace."""
+    decisions: list[tuple[str, int]] = []
+    for _, _, motor_position, _, direction in trace:
+        if not decisions or decisions[-1] != (direction, motor_position):
+            decisions.append((direction, motor_position))
+    return decisions
+
+
+def trace_problem(trace: list[tuple[float, float, int, float, str]]) -> str | None:
+    """Return why a trace cannot be replayed, or None if it can."""
+    if not trace:
+        return "it holds no readings"
+    if not any(direction == "down" for *_, direction in trace):
+        # Stopped, tripped and aborted tests never reach PRESSURE_TURN_POINT,
+        # so a replay would open the valve on the last recorded pressure
+        return "the test never turned around"
+    return None
+
+
+def compare_decisions(
+    recorded: list[tuple[float, float, int, float, str]],
+    replayed: list[tuple[float, float, int, float, str]],
+) -> dict:
+    recorded_steps: list[tuple[str, int]] = step_decisions(recorded)
+    replayed_steps: list[tuple[str, int]] = step_decisions(replayed)
+    first_divergence: int | None = None
+    for i, (recorded_step, replayed_step) in enumerate(
+        zip(recorded_steps, replayed_steps)
+    ):
+        if recorded_step != replayed_step:
+            first_divergence = i
+            break
+    if first_divergence is None and len(recorded_steps) != len(replayed_steps):
+        first_divergence = min(len(recorded_steps), len(replayed_steps))
+    recorded_stop: float = recorded_steps[-1][1] / MICROSTEPS_PER_REV
+    replayed_stop: float = (
+        replayed_steps[-1][1] / MICROSTEPS_PER_REV if replayed_steps else float("nan")
+    )
+    return {
+        "same_steps": first_divergence is None,
+        "same_stop": recorded_stop == replayed_stop,
+        "first_divergence": first_divergence,
+        "recorded_steps": len(recorded_steps),
+        "replayed_steps": len(replayed_steps),
+        "recorded_stop_turns": recorded_stop,
+        "replayed_stop_turns": replayed_stop,
+        "recorded_duration_s": recorded[-1][0],
+        "replayed_duration_s": replayed[-1][0] if replayed else 0.0,
+    }
+
+
+def replay_trace(
+    trace: list[tuple[float, float, int, float, str]],
+    metadata: dict[str, str],
+    live_plot_window: LivePlotWindow | NullPlotWindow | None = None,
+    valve_position_label: QLabel | NullLabel | None = None,
+    parameters: dict[str, float] | None = None,
+) -> tuple[ValveTest, dict]:
+    """
+    Run ValveTest against a recorded trace.
+
+    :param parameters: ValveTest attributes to override, e.g. {"hold_time": 3}
+    :return: (the finished valve test, the decision report)
+    :rtype: tuple
+    :raises ValueError: if the trace cannot be replayed, see trace_problem
+    """
+    problem: str | None = trace_problem(trace)
+    if problem is not None:
+        raise ValueError(f"Cannot replay the trace: {problem}")
+    clock = VirtualClock()
+    motor = ReplayMotor(clock)
+    gauge = ReplayGauge(clock, motor, trace)
+    valve_test = ValveTest(
+        motor,  # type: ignore
+        gauge,
+        metadata.get("serial_number", "replay"),
+        metadata.get("rework_letter", ""),
+        metadata.get("base_pressure", str(trace[0][3])),
+        valve_position_label or NullLabel(),  # type: ignore
+        live_plot_window or NullPlotWindow(),  # type: ignore
+        clock=clock,
+        save_results=False,
+    )
+    valve_test.time_limit = REPLAY_TIME_FACTOR * trace[-1][0]
+    # Leave room for the extra turn the valve opens at turn-around
+    valve_test.turn_around_limit = MAX_VALVE_TURNS - 1
+    for name, value in (parameters or {}).items():
+        setattr(valve_test, name, value)
+    wall_start: float = time.perf_counter()
+    valve_test.run()
+    report: dict = compare_decisions(trace, valve_test.trace)
+    report["turn_around_saved_s"] = valve_test.turn_around_time_saved
+    report["wall_time_s"] = time.perf_counter() - wall_start
+    return valve_test, report
+
+
+def simulate_test(
+    seed: int | None = None,
+    live_plot_window: LivePlotWindow | NullPlotWindow | None = None,
+    parameters: dict[str, float] | None = None,
+    **system_parameters,
+) -> tuple[ValveTest, SimulatedGauge, dict]:
+    """
+    Run ValveTest against the simulated test stand.
+
+    :param system_parameters: keyword arguments of api.simulator.VacuumSystem
+    :return: (the finished valve test, the simulated gauge, the report)
+    :rtype: tuple
+    """
+    clock, motor, gauge = create_simulation(seed=seed, **system_parameters)
+    valve_test = ValveTest(
+        motor,  # type: ignore
+        gauge,
+        "simulated",
+        "",
+        f"{gauge.system.base_pressure:.2e}",
+        NullLabel(),  # type: ignore
+        live_plot_window or NullPlotWindow(),  # type: ignore
+        clock=clock,
+        save_results=False,
+    )
+    for name, value in (parameters or {}).items():
+        setattr(valve_test, name, value)
+    wall_start: float = time.perf_counter()
+    valve_test.run()
+    report: dict = {
+        "steps": len(step_decisions(valve_test.trace)),
+        "duration_s": clock.now() - valve_test.start_time,
+        "turn_around_saved_s": valve_test.turn_around_time_saved,
+        "wall_time_s": time.perf_counter() - wall_start,
+    }
+    return valve_test, gauge, report
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    simulate: bool = sys.argv[1] == "--simulate"
+    metadata: dict[str, str] = {"serial_number": "simulated"}
+    trace: list[tuple[float, float, int, float, str]] = []
+    if not simulate:
+        metadata, trace = load_trace(Path(sys.argv[1]))
+        problem: str | None = trace_problem(trace)
+        if problem is not None:
+            print(f"Cannot replay {sys.argv[1]}: {problem}.")
+            return
+    live_plot_window: LivePlotWindow | None = None
+    if "--plot" in sys.argv:
+        QApplication.instance() or QApplication([])
+        live_plot_window = LivePlotWindow(
+            metadata.get("serial_number", "replay"),
+            metadata.get("rework_letter", ""),
+            metadata.get("base_pressure", ""),
+        )
+    if simulate:
+        seed: int | None = (
+            int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else None
+        )
+        _, _, report = simulate_test(seed, live_plot_window)
+    else:
+        _, report = replay_trace(trace, metadata, live_plot_window)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import csv
+from pathlib import Path
+
+import numpy as np
+
+from api.pressure_gauge import GaugeCapabilities
+
+try:
+    from helpers.clock import VirtualClock
+    from helpers.constants import MOTOR_VELOCITY
+    from helpers.units import CANONICAL_UNIT
+except Exception:
+    from clock import VirtualClock
+    from constants import MOTOR_VELOCITY
+    from units import CANONICAL_UNIT
+
+TRACE_HEADER: list[str] = [
+    "Time (s)",
+    "Time Since Move (s)",
+    "Motor Position",
+    "Pressure",
+    "Direction",
+]
+
+
+def write_trace(
+    file_path: Path,
+    trace: list[tuple[float, float, int, float, str]],
+    metadata: dict[str, str],
+) -> None:
+    """
+    Write the timestamped pressure samples of a test. The first line holds the
+    test metadata as a comment.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, mode="w", newline="") as file:
+        file.write("# " + ",".join(f"{key}={value}" for key, value in metadata.items()))
+        file.write("\n")
+        writer = csv.writer(file)
+        writer.writerow(TRACE_HEADER)
+        for time_s, since_move, motor_position, pressure, direction in trace:
+            writer.writerow(
+                [
+                    f"{time_s:.3f}",
+                    f"{since_move:.3f}",
+                    motor_position,
+                    pressure,
+                    direction,
+                ]
+            )
+
+
+def load_trace(
+    file_path: Path,
+) -> tuple[dict[str, str], list[tuple[float, float, int, float, str]]]:
+    """
+    Load a trace written by write_trace.
+
+    :return: (metadata, trace rows)
+    :rtype: tuple
+    """
+    metadata: dict[str, str] = {}
+    trace: list[tuple[float, float, int, float, str]] = []
+    with open(file_path, newline="") as file:
+        first_line: str = file.readline()
+        if first_line.startswith("#"):
+            for item in first_line[1:].strip().split(","):
+                key, _, value = item.partition("=")
+                metadata[key.strip()] = value.strip()
+        else:
+            file.seek(0)
+        reader = csv.reader(file)
+        next(reader, None)  # header
+        for row in reader:
+            if len(row) < 5:
+                continue
+            trace.append(
+                (float(row[0]), float(row[1]), int(row[2]), float(row[3]), row[4])
+            )
+    return metadata, trace
+
+
+class ReplayMotor:
+    """
+    Stand-in for MotorController that moves at the commanded velocity on a
+    virtual clock. Every command takes command_time seconds of virtual time,
+    like the serial round trip of the real controller.
+    """
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        initial_position: int = 0,
+        command_time: float = 0.1,
+    ) -> None:
+        self.clock: VirtualClock = clock
+        self.command_time: float = command_time
+        self.velocity: int = MOTOR_VELOCITY
+        self.start_position: int = initial_position
+        self.target_position: int = initial_position
+        self.move_start_time: float = clock.now()
+        self.last_direction: str = "up"
+
+    def _command(self) -> None:
+        self.clock.advance(self.command_time)
+
+    def position(self) -> int:
+        """Return the motor position at the current virtual time."""
+        distance: int = self.target_position - self.start_position
+        travelled: float = self.velocity * (self.clock.now() - self.move_start_time)
+        if travelled >= abs(distance):
+            return self.target_position
+        return self.start_position + int(np.sign(distance) * travelled)
+
+    def is_moving(self) -> bool:
+        return self.position() != self.target_position
+
+    def _start_move(self, target_position: int) -> None:
+        self.start_position = self.position()
+        self.target_position = target_position
+        self.move_start_time = self.clock.now()
+        if target_position != self.start_position:
+            self.last_direction = (
+                "up" if target_position > self.start_position else "down"
+            )
+
+    def move_relative(self, steps: int) -> None:
+        self._command()
+        self._start_move(self.position() + steps)
+
+    def move_absolute(self, position: int) -> None:
+        self._command()
+        self._start_move(position)
+
+    def home_motor(self) -> None:
+        self.move_absolute(0)
+
+    def stop(self) -> None:
+        self._command()
+        self._start_move(self.position())
+
+    def query_position(self) -> str:
+        self._command()
+        return str(self.position())
+
+    def set_velocity_and_acceleration(self, velocity: int, acceleration: int) -> None:
+        self._command()
+        self._command()
+        self._start_move(self.target_position)
+        self.velocity = velocity
+
+    def set_zero(self) -> None:
+        self._command()
+        self.start_position = self.target_position = 0
+
+    def close_port(self) -> None:
+        pass
+
+
+class ReplayGauge:
+    """
+    Stand-in for a pressure gauge that plays back a recorded trace. The
+    pressure returned is the one recorded at the nearest valve position, in the
+    same direction of travel, at the same time since the last move.
+    """
+
+    capabilities: GaugeCapabilities = GaugeCapabilities()
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        motor: ReplayMotor,
+        trace: list[tuple[float, float, int, float, str]],
+        command_time: float = 0.05,
+    ) -> None:
+        self.clock: VirtualClock = clock
+        self.motor: ReplayMotor = motor
+        self.command_time: float = command_time
+        # Traces are recorded in the canonical unit
+        self.unit: str = CANONICAL_UNIT
+
+        # direction -> (sorted positions, per position (times since move, pressures))
+        self.samples: dict[str, tuple[np.ndarray, list[tuple[np.ndarray, np.ndarray]]]]
+        self.samples = {}
+        for direction in ("up", "down"):
+            grouped: dict[int, list[tuple[float, float]]] = {}
+            for _, since_move, motor_position, pressure, row_direction in trace:
+                if row_direction == direction:
+                    grouped.setdefault(motor_position, []).append(
+                        (since_move, pressure)
+                    )
+            if not grouped:
+                continue
+            positions: np.ndarray = np.array(sorted(grouped))
+            per_position: list[tuple[np.ndarray, np.ndarray]] = []
+            for position in positions:
+                samples: np.ndarray = np.array(sorted(grouped[int(position)]))
+                per_position.append((samples[:, 0], samples[:, 1]))
+            self.samples[direction] = (positions, per_position)
+
+    def _lookup(self, direction: str, position: int, since_move: float) -> float:
+        if direction not in self.samples:
+            direction = "up" if direction == "down" else "down"
+        positions, per_position = self.samples[direction]
+        index: int = int(np.abs(positions - position).argmin())
+        times, pressures = per_position[index]
+        sample: int = max(int(np.searchsorted(times, since_move, side="right")) - 1, 0)
+        return float(pressures[sample])
+
+    def pressure_gauge(self, gauge: int = 1) -> tuple[float, tuple[int, str]]:
+        self.clock.advance(self.command_time)
+        since_move: float = self.clock.now() - self.motor.move_start_time
+        pressure: float = self._lookup(
+            self.motor.last_direction, self.motor.position(), since_move
+        )
+        return pressure, (0, "Measurement data okay")
+
+    def close_port(self) -> None:
+        pass
@@ -0,0 +1,156 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+try:
+    from helpers.constants import (
+        MOTOR_ACCELERATION,
+        MOTOR_VELOCITY,
+        SAFETY_MAX_RISE,
+        SAFETY_PRESSURE_LIMIT,
+    )
+    from helpers.units import to_canonical
+except Exception:
+    from constants import (
+        MOTOR_ACCELERATION,
+        MOTOR_VELOCITY,
+        SAFETY_MAX_RISE,
+        SAFETY_PRESSURE_LIMIT,
+    )
+    from units import to_canonical
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Measurement status of the gauge controllers that means the pressure is above
+# the gauge range
+OVERRANGE: int = 2
+# Seconds to keep watching after a move should have finished
+ARM_TIME: int = 5
+# Shortest time in seconds the rise rate is measured over. Back to back
+# readings come faster than the gauge updates, so the rate between two of
+# them is mostly noise and repeated values.
+RISE_WINDOW: float = 0.5
+
+
+class SafetyMonitor:
+    """
+    Samples the pressure gauge back to back in its own thread while a move is
+    armed, and stops the motor and closes the valve as soon as the pressure
+    exceeds pressure_limit or rises faster than max_rise decades per second.
+    The rise rate is taken from the readings of the last rise_window seconds,
+    at least RISE_WINDOW and two gauge updates long.
+
+    The monitor never waits on the GUI thread, so plotting and file I/O cannot
+    delay it. Its reaction time to the pressure limit is bounded by one gauge
+    reading, plus one more if the valve test holds the gauge lock, plus the
+    motor stop command; a fast rise is caught within rise_window more.
+    """
+
+    def __init__(
+        self,
+        motor,
+        gauge,
+        pressure_limit: float = SAFETY_PRESSURE_LIMIT,
+        max_rise: float = SAFETY_MAX_RISE,
+    ) -> None:
+        self.motor = motor
+        self.gauge = gauge
+        self.pressure_limit: float = pressure_limit
+        self.max_rise: float = max_rise
+        self.rise_window: float = max(
+            RISE_WINDOW, 2 / gauge.capabilities.max_sample_rate
+        )
+        self.tripped: bool = False
+        self.trip_reason: str = ""
+        self.on_trip: list = []
+        self.max_sample_gap: float = 0.0
+        self.running: bool = False
+
+        self._armed_until: float = 0.0
+        self._wake_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if not self.running:
+            self.running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def arm(self, seconds: float) -> None:
+        """Sample at full rate for at least the next number of seconds."""
+        self._armed_until = max(self._armed_until, time.monotonic() + seconds)
+        self._wake_event.set()
+
+    def disarm(self) -> None:
+        self._armed_until = 0.0
+
+    def reset(self) -> None:
+        self.tripped = False
+        self.trip_reason = ""
+        self.max_sample_gap = 0.0
+
+    def _run(self) -> None:
+        # (time, pressure) of the readings in the rise window, plus the newest
+        # one before it as the reference the rate is taken from
+        samples: deque[tuple[float, float]] = deque()
+        while self.running:
+            if time.monotonic() >= self._armed_until:
+                samples.clear()
+                self._wake_event.wait()
+                self._wake_event.clear()
+                continue
+            try:
+                reading, (status_code, _) = self.gauge.pressure_gauge()
+                pressure: float = to_canonical(reading, self.gauge.unit)
+            except Exception as e:
+                logger.warning("Safety monitor could not read the gauge: %s", e)
+                samples.clear()
+                self._wake_event.wait(0.1)
+                continue
+            now: float = time.monotonic()
+            if samples:
+                self.max_sample_gap = max(self.max_sample_gap, now - samples[-1][0])
+            if status_code == OVERRANGE:
+                self._trip("Pressure gauge overrange")
+            elif pressure > self.pressure_limit:
+                self._trip(f"Pressure {pressure:.2E} above {self.pressure_limit:.2E}")
+            elif pressure <= 0:
+                samples.clear()
+                continue
+            samples.append((now, pressure))
+            while len(samples) > 2 and now - samples[1][0] >= self.rise_window:
+                samples.popleft()
+            start, reference = samples[0]
+            if now - start >= self.rise_window:
+                rise: float = math.log10(pressure / reference) / (now - start)
+                if rise > self.max_rise:
+                    self._trip(
+                        f"Pressure rising {rise:.2f} decades/s, above {self.max_rise}"
+                    )
+
+    def _trip(self, reason: str) -> None:
+        if self.tripped:
+            return
+        self.tripped = True
+        self.trip_reason = reason
+        logger.critical(
+            "SAFETY MONITOR TRIPPED: %s. Stopping and closing the valve.", reason
+        )
+        try:
+            self.motor.stop()
+            # A sweep may have left the motor at SWEEP_VELOCITY
+            self.motor.set_velocity_and_acceleration(MOTOR_VELOCITY, MOTOR_ACCELERATION)
+            self.motor.home_motor()
+        except Exception as e:
+            logger.error("Safety monitor could not stop the motor: %s", e)
+        for callback in self.on_trip:
+            callback(reason)
@@ -0,0 +1,58 @@
+import numpy as np
+
+try:
+    from helpers.constants import MICROSTEPS_PER_REV
+except Exception:
+    from constants import MICROSTEPS_PER_REV
+
+
+class SweepSampler:
+    """
+    Collects timestamped pressure and motor position samples taken while the
+    motor is turning and gives each pressure sample the valve position
+    interpolated from its timestamp.
+    """
+
+    def __init__(self) -> None:
+        self.position_times: list[float] = []
+        self.motor_positions: list[int] = []
+        self.pressure_times: list[float] = []
+        self.pressures: list[float] = []
+
+    def add_position(self, timestamp: float, motor_position: int) -> None:
+        self.position_times.append(timestamp)
+        self.motor_positions.append(motor_position)
+
+    def add_pressure(self, timestamp: float, pressure: float) -> None:
+        self.pressure_times.append(timestamp)
+        self.pressures.append(pressure)
+
+    def pop_aligned(self) -> tuple[list[float], list[float]]:
+        """
+        Return the pressure samples that are bracketed by position samples,
+        together with their interpolated valve positions, and remove them from
+        the sampler.
+
+        :return: (valve_positions, pressures)
+        :rtype: tuple
+        """
+        if not self.position_times:
+            return [], []
+        ready: int = int(
+            np.searchsorted(self.pressure_times, self.position_times[-1], side="right")
+        )
+        if ready == 0:
+            return [], []
+        motor_positions: np.ndarray = np.interp(
+            self.pressure_times[:ready], self.position_times, self.motor_positions
+        )
+        valve_positions: list[float] = np.round(
+            motor_positions / MICROSTEPS_PER_REV, 2
+        ).tolist()
+        pressures: list[float] = self.pressures[:ready]
+        del self.pressure_times[:ready]
+        del self.pressures[:ready]
+        # Only the last position sample is needed to bracket the next pressures
+        del self.position_times[:-1]
+        del self.motor_positions[:-1]
+        return valve_positions, pressures
@@ -0,0 +1,76 @@
+import csv
+from pathlib import Path
+
+try:
+    from helpers.constants import AOI_LOWER_BOUND, REMOTE_DATA_DIR, RESULTS_DIR
+except Exception:
+    from constants import AOI_LOWER_BOUND, REMOTE_DATA_DIR, RESULTS_DIR
+
+
+def find_test_csvs(serial_number: str) -> list[Path]:
+    """
+    Find the saved csv files of every test of a valve, on the company drive
+    and locally. Files saved in both places are only returned once.
+
+    :param serial_number: Valve serial number
+    :return: csv file paths, oldest test first
+    """
+    folders: list[Path] = [
+        REMOTE_DATA_DIR / serial_number,
+        RESULTS_DIR / "csv_files" / serial_number,
+    ]
+    csv_files: dict[str, Path] = {}
+    for folder in folders:
+        try:
+            if not folder.exists():
+                continue
+            for file_path in folder.glob("*.csv"):
+                csv_files.setdefault(file_path.name, file_path)
+        except OSError:
+            continue
+    # File names start with the date and time of the test
+    return [csv_files[name] for name in sorted(csv_files)]
+
+
+def load_test_csv(
+    file_path: Path,
+) -> tuple[list[float], list[float], list[float], list[float]]:
+    """
+    Load a csv file written by ValveTest.
+
+    :return: (turns_up, pressure_up, turns_down, pressure_down)
+    :rtype: tuple
+    """
+    turns_up: list[float] = []
+    pressure_up: list[float] = []
+    turns_down: list[float] = []
+    pressure_down: list[float] = []
+    with open(file_path, newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)  # header
+        for row in reader:
+            if len(row) < 4:
+                continue
+            if row[0] and row[1]:
+                turns_up.append(float(row[0]))
+                pressure_up.append(float(row[1]))
+            if row[2] and row[3]:
+                turns_down.append(float(row[2]))
+                pressure_down.append(float(row[3]))
+    return turns_up, pressure_up, turns_down, pressure_down
+
+
+def previous_aoi_entry_turns(serial_number: str) -> float | None:
+    """
+    Return the valve turns at which the pressure entered the AOI while opening
+    during the most recent test of a valve, or None if there is no usable test.
+    """
+    for file_path in reversed(find_test_csvs(serial_number)):
+        try:
+            turns_up, pressure_up, _, _ = load_test_csv(file_path)
+        except (OSError, ValueError):
+            continue
+        for turns, pressure in zip(turns_up, pressure_up):
+            if pressure > AOI_LOWER_BOUND:
+                return turns
+    return None
@@ -0,0 +1,192 @@
+"""Per-step settling transients of valve tests.
+
+A transient file holds every pressure reading of a test grouped by the move
+that preceded it. The readings of all steps are stored back to back in one
+(N, 3) array of time since move, pressure and valve position, and
+step_offsets[i]:step_offsets[i + 1] are the rows of step i, so a file loads
+with a single read and splits into per-step views without copying.
+
+Usage:
+    python -m helpers.transients FOLDER
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from helpers.constants import MICROSTEPS_PER_REV, RESULTS_DIR
+except Exception:
+    from constants import MICROSTEPS_PER_REV, RESULTS_DIR
+
+TRANSIENTS_DIR: Path = RESULTS_DIR / "transients"
+
+# Columns of the samples array
+TIME_SINCE_MOVE: int = 0
+PRESSURE: int = 1
+VALVE_POSITION: int = 2
+
+# Seconds within which two readings belong to the same move
+MOVE_TIME_RESOLUTION: float = 0.01
+
+# Values of the directions array
+UP: int = 1
+DOWN: int = -1
+
+
+def transients_from_trace(
+    trace: list[tuple[float, float, int, float, str]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split a test trace into steps. A new step starts wherever the time of the
+    last move, the reading time less the time since the move, changes.
+
+    :return: (samples (N, 3), step_offsets (S + 1,), directions (S,),
+        step_start_times (S,))
+    :rtype: tuple
+    """
+    if not trace:
+        empty: np.ndarray = np.zeros(0)
+        return np.zeros((0, 3)), np.zeros(1, dtype=np.int64), empty, empty
+    times, since_move, motor_positions, pressures, directions = zip(*trace)
+    since_move_array: np.ndarray = np.asarray(since_move, dtype=float)
+    samples: np.ndarray = np.column_stack(
+        (
+            since_move_array,
+            np.asarray(pressures, dtype=float),
+            np.asarray(motor_positions, dtype=float) / MICROSTEPS_PER_REV,
+        )
+    )
+    move_times: np.ndarray = np.asarray(times, dtype=float) - since_move_array
+    # Moves are at least one command round trip apart, far more than rounding
+    starts: np.ndarray = (
+        np.flatnonzero(np.abs(np.diff(move_times)) > MOVE_TIME_RESOLUTION) + 1
+    )
+    step_offsets: np.ndarray = np.concatenate(([0], starts, [len(trace)])).astype(
+        np.int64
+    )
+    first_rows: np.ndarray = step_offsets[:-1]
+    step_directions: np.ndarray = np.where(
+        np.asarray(directions)[first_rows] == "up", UP, DOWN
+    ).astype(np.int8)
+    return samples, step_offsets, step_directions, move_times[first_rows]
+
+
+def write_transients(
+    file_path: Path,
+    trace: list[tuple[float, float, int, float, str]],
+    metadata: dict[str, str],
+) -> None:
+    samples, step_offsets, directions, step_start_times = transients_from_trace(trace)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        file_path,
+        samples=samples,
+        step_offsets=step_offsets,
+        directions=directions,
+        step_start_times=step_start_times,
+        **{key: np.asarray(value) for key, value in metadata.items()},
+    )
+
+
+def load_transients(file_path: Path) -> tuple[list[np.ndarray], np.ndarray]:
+    """
+    Load a transient file.
+
+    :return: (one (n, 3) array per step, direction of each step)
+    :rtype: tuple
+    """
+    with np.load(file_path) as data:
+        samples: np.ndarray = data["samples"]
+        step_offsets: np.ndarray = data["step_offsets"]
+        directions: np.ndarray = data["directions"]
+    return np.split(samples, step_offsets[1:-1]), directions
+
+
+def load_transient_archive(
+    paths: list[Path],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Concatenate the transient files in the given files and folders (searched
+    recursively) for mining across tests.
+
+    :return: (samples (N, 3), step_offsets (S + 1,), directions (S,),
+        file index of each step (S,))
+    :rtype: tuple
+    """
+    files: list[Path] = []
+    for path in paths:
+        files.extend(sorted(path.rglob("*.npz")) if path.is_dir() else [path])
+    all_samples: list[np.ndarray] = []
+    all_offsets: list[np.ndarray] = [np.zeros(1, dtype=np.int64)]
+    all_directions: list[np.ndarray] = []
+    file_indices: list[np.ndarray] = []
+    rows: int = 0
+    for index, file_path in enumerate(files):
+        with np.load(file_path) as data:
+            samples: np.ndarray = data["samples"]
+            step_offsets: np.ndarray = data["step_offsets"]
+            directions: np.ndarray = data["directions"]
+        all_samples.append(samples)
+        all_offsets.append(step_offsets[1:] + rows)
+        all_directions.append(directions)
+        file_indices.append(np.full(len(directions), index))
+        rows += len(samples)
+    if not all_samples:
+        return np.zeros((0, 3)), all_offsets[0], np.zeros(0), np.zeros(0)
+    return (
+        np.concatenate(all_samples),
+        np.concatenate(all_offsets),
+        np.concatenate(all_directions),
+        np.concatenate(file_indices),
+    )
+
+
+def settling_times(
+    samples: np.ndarray, step_offsets: np.ndarray, tolerance: float
+) -> np.ndarray:
+    """
+    Return, for every step, the time since the move after which all later
+    readings of the step stay within tolerance percent of its last reading.
+    """
+    step_ids: np.ndarray = np.repeat(
+        np.arange(len(step_offsets) - 1), np.diff(step_offsets)
+    )
+    last_rows: np.ndarray = step_offsets[1:] - 1
+    final_pressures: np.ndarray = samples[last_rows, PRESSURE][step_ids]
+    outside: np.ndarray = (
+        np.abs(samples[:, PRESSURE] - final_pressures) / final_pressures * 100
+        > tolerance
+    )
+    # Time of the last reading outside the tolerance band of each step
+    times: np.ndarray = np.where(outside, samples[:, TIME_SINCE_MOVE], 0.0)
+    result: np.ndarray = np.zeros(len(step_offsets) - 1)
+    np.maximum.at(result, step_ids, times)
+    return result
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    samples, step_offsets, directions, file_indices = load_transient_archive(
+        [Path(arg) for arg in sys.argv[1:]]
+    )
+    steps: int = len(directions)
+    print(
+        f"{len(np.unique(file_indices))} tests, {steps} steps, {len(samples)} readings"
+    )
+    if steps:
+        times: np.ndarray = settling_times(samples, step_offsets, tolerance=1.0)
+        for name, value in (("up", UP), ("down", DOWN)):
+            selected: np.ndarray = times[directions == value]
+            if len(selected):
+                print(
+                    f"{name}: median settling {np.median(selected):.1f} s, "
+                    f"95th percentile {np.percentile(selected, 95):.1f} s"
+                )
+
+
+if __name__ == "__main__":
+    main()
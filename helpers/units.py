@@ -0,0 +1,53 @@
+import numpy as np
+
+# Every pressure inside the program is in this unit
+CANONICAL_UNIT: str = "mbar"
+
+# Conversion factors to the canonical unit
+TO_MBAR: dict[str, float] = {
+    "mbar": 1.0,
+    "Torr": 1.333223684,
+    "Pascal": 0.01,
+    "micron": 1.333223684e-3,
+}
+
+UNIT_ALIASES: dict[str, str] = {
+    "mbar": "mbar",
+    "millibar": "mbar",
+    "torr": "Torr",
+    "pa": "Pascal",
+    "pascal": "Pascal",
+    "micron": "micron",
+    "mtorr": "micron",
+}
+
+
+def normalize_unit(unit: str) -> str:
+    """Return the TO_MBAR key for a unit name such as 'mBar', 'Pa' or 'torr'."""
+    try:
+        return UNIT_ALIASES[unit.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown pressure unit: {unit!r}") from None
+
+
+def to_canonical(pressure, unit: str):
+    """
+    Convert a pressure, or an array of pressures, from unit to CANONICAL_UNIT.
+    """
+    factor: float = TO_MBAR[normalize_unit(unit)]
+    if np.ndim(pressure) == 0:
+        return float(pressure) * factor
+    return np.multiply(pressure, factor)
+
+
+def parse_pressure(text: str, default_unit: str = CANONICAL_UNIT) -> float:
+    """
+    Parse a pressure such as '5e-6', '5e-6 Torr' or '5e-4Pa' and return it in
+    CANONICAL_UNIT. A bare number is taken to be in default_unit.
+    """
+    text = text.strip()
+    number_end: int = len(text)
+    while number_end > 0 and text[number_end - 1].isalpha():
+        number_end -= 1
+    unit: str = text[number_end:] or default_unit
+    return to_canonical(float(text[:number_end]), unit)
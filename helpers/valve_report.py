@@ -0,0 +1,547 @@
+"""History reports of a valve, built from its stored tests.
+
+A report gathers every test of a valve serial number saved on the company
+drive and locally, and shows the curves of all tests overlaid, each test on
+its own in the style of the normalized plot window, the hysteresis metrics of
+every test and the rework history: the tests of each rework letter and how
+the hysteresis area changed from one rework to the next. It is written as
+HTML, and as PDF on request, to results/reports/<serial number>.
+
+Tests are analyzed and figures rendered in a pool of worker processes. Every
+result is cached under a key made of the csv file, the base pressure of the
+test and the AOI, so generating a report again after a new test only renders
+the new test, the overlay and the report itself.
+
+Usage:
+    python -m helpers.valve_report SERIAL_NUMBER [...] [--all] [--pdf]
+        [--workers N]
+"""
+
+import hashlib
+import html
+import json
+import logging
+import math
+import sys
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib.image
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from helpers.constants import (
+    AOI_LOWER_BOUND,
+    AOI_UPPER_BOUND,
+    REMOTE_DATA_DIR,
+    RESULTS_DIR,
+)
+from helpers.curve_analysis import analyze_test
+from helpers.normalized_data_plotter import FIGURE_OPTIONS, plot_branches, style_axes
+from helpers.test_history import find_test_csvs, load_test_csv
+from helpers.units import parse_pressure
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+REPORTS_DIR: Path = RESULTS_DIR / "reports"
+TRACES_DIR: Path = RESULTS_DIR / "traces"
+
+# Change when the figures or metrics change, so cached ones are rendered again
+RENDER_VERSION: str = "1"
+
+# Metrics of curve_analysis shown for every test, with their column titles
+REPORT_METRICS: dict[str, str] = {
+    "hysteresis_area": "Hysteresis area (turns x decades)",
+    "aoi_entry_turns_up": "AOI entry opening (turns)",
+    "aoi_entry_turns_down": "AOI entry closing (turns)",
+    f"turn_offset_at_{AOI_LOWER_BOUND:.0e}": "Closing offset at AOI entry (turns)",
+    f"turn_offset_at_{AOI_UPPER_BOUND:.0e}": "Closing offset at AOI exit (turns)",
+    "aoi_log_slope_up": "AOI slope opening (decades/turn)",
+    "monotonic": "Monotonic",
+}
+
+# Table rows on one PDF page
+PDF_TABLE_ROWS: int = 30
+
+
+def all_serial_numbers() -> list[str]:
+    """Return the serial numbers of every valve with saved tests."""
+    serial_numbers: set[str] = set()
+    for folder in (REMOTE_DATA_DIR, RESULTS_DIR / "csv_files"):
+        try:
+            if not folder.exists():
+                continue
+            serial_numbers.update(
+                path.name for path in folder.iterdir() if path.is_dir()
+            )
+        except OSError:
+            continue
+    return sorted(serial_numbers)
+
+
+def describe_test(file_path: Path, serial_number: str) -> dict[str, str]:
+    """
+    Read the date and rework letter of a test from its csv file name,
+    '<date> <time> <serial number><rework letter>.csv'.
+    """
+    date, _, rest = file_path.stem.partition(" ")
+    time, _, valve = rest.partition(" ")
+    rework_letter: str = (
+        valve[len(serial_number) :] if valve.startswith(serial_number) else ""
+    )
+    return {
+        "file": file_path.name,
+        "date": f"{date} {time.replace('_', ':')}",
+        "rework_letter": rework_letter,
+    }
+
+
+def trace_metadata(file_path: Path, serial_number: str) -> str:
+    """Return the metadata line of the trace saved with a test, if any."""
+    trace_path: Path = TRACES_DIR / serial_number / f"{file_path.stem} trace.csv"
+    try:
+        with open(trace_path) as file:
+            first_line: str = file.readline()
+    except OSError:
+        return ""
+    return first_line if first_line.startswith("#") else ""
+
+
+def base_pressure(metadata: str, pressure_up: list[float]) -> float:
+    """
+    Return the base pressure entered for a test. A test saved without a
+    trace is normalized to its first opening reading, as replay does.
+    """
+    for item in metadata[1:].strip().split(","):
+        key, _, value = item.partition("=")
+        if key.strip() == "base_pressure" and value.strip():
+            try:
+                return parse_pressure(value.strip())
+            except ValueError:
+                break
+    return pressure_up[0] if pressure_up else 0.0
+
+
+def cache_key(*parts: bytes | str) -> str:
+    digest = hashlib.sha256(
+        f"{RENDER_VERSION} {AOI_LOWER_BOUND} {AOI_UPPER_BOUND}".encode()
+    )
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(part if isinstance(part, bytes) else part.encode())
+    return digest.hexdigest()[:16]
+
+
+def csv_cache_key(file_path: Path, serial_number: str) -> str:
+    """
+    :raises OSError: if the csv file cannot be read
+    """
+    return cache_key(file_path.read_bytes(), trace_metadata(file_path, serial_number))
+
+
+def _normalized_curves(
+    file_path: Path, base: float
+) -> tuple[list[float], np.ndarray, list[float], np.ndarray]:
+    turns_up, pressure_up, turns_down, pressure_down = load_test_csv(file_path)
+    return (
+        turns_up,
+        np.array(pressure_up) - base,
+        turns_down,
+        np.array(pressure_down) - base,
+    )
+
+
+def render_test(job: tuple[Path, str, str, Path]) -> str | None:
+    """
+    Analyze one test and render its figure into the cache. Runs in a worker
+    process.
+
+    :param job: (csv file, serial number, cache key, cache folder)
+    :return: the error message if the test could not be read
+    """
+    file_path, serial_number, key, cache_dir = job
+    try:
+        turns_up, pressure_up, turns_down, pressure_down = load_test_csv(file_path)
+    except (OSError, ValueError) as e:
+        return str(e)
+    test: dict = describe_test(file_path, serial_number)
+    base: float = base_pressure(trace_metadata(file_path, serial_number), pressure_up)
+
+    fig = Figure(**FIGURE_OPTIONS)
+    ax = fig.add_subplot(1, 1, 1)
+    style_axes(
+        ax, f"VAT Valve: {serial_number}({test['rework_letter']})  {test['date']}"
+    )
+    plot_branches(
+        ax,
+        turns_up,
+        np.array(pressure_up) - base,
+        turns_down,
+        np.array(pressure_down) - base,
+    )
+    ax.legend(fontsize=5)
+    fig.tight_layout()
+    fig.savefig(cache_dir / f"{key}.png")
+
+    test.update(
+        key=key,
+        base_pressure=base,
+        **analyze_test(turns_up, pressure_up, turns_down, pressure_down),
+    )
+    # Written last: a cached json means the figure is there too
+    with open(cache_dir / f"{key}.json", mode="w") as file:
+        json.dump(test, file)
+    return None
+
+
+def render_overlay(job: tuple[str, list[dict], Path, str]) -> str | None:
+    """
+    Render the curves of all tests of a valve on one axes, oldest test
+    lightest. Runs in a worker process.
+
+    :param job: (serial number, tests, cache folder, cache key)
+    :return: the error message if a test could not be read
+    """
+    serial_number, tests, cache_dir, key = job
+    fig = Figure(**FIGURE_OPTIONS)
+    ax = fig.add_subplot(1, 1, 1)
+    style_axes(ax, f"VAT Valve: {serial_number}, {len(tests)} tests")
+    colors = colormaps["Blues"](np.linspace(0.35, 1.0, len(tests)))
+    for test, color in zip(tests, colors):
+        try:
+            curves = _normalized_curves(Path(test["path"]), test["base_pressure"])
+        except (OSError, ValueError) as e:
+            return str(e)
+        plot_branches(
+            ax,
+            *curves,
+            opening_color=color,
+            closing_color=color,
+            label=f"{serial_number}{test['rework_letter']} {test['date']}",
+        )
+    ax.legend(fontsize=4, ncol=2)
+    fig.tight_layout()
+    fig.savefig(cache_dir / f"{key}.png")
+    return None
+
+
+def rework_history(tests: list[dict]) -> list[dict]:
+    """
+    Summarize the tests of each rework letter, in the order the reworks were
+    done, with the change of hysteresis area of the last test from that of
+    the previous rework.
+    """
+    history: list[dict] = []
+    for test in tests:
+        if not history or history[-1]["rework_letter"] != test["rework_letter"]:
+            history.append(
+                {
+                    "rework_letter": test["rework_letter"],
+                    "first_test": test["date"],
+                    "tests": 0,
+                    "hysteresis_change": float("nan"),
+                }
+            )
+        entry: dict = history[-1]
+        entry["tests"] += 1
+        entry["last_test"] = test["date"]
+        entry["hysteresis_area"] = test["hysteresis_area"]
+    for previous, entry in zip(history, history[1:]):
+        entry["hysteresis_change"] = (
+            entry["hysteresis_area"] - previous["hysteresis_area"]
+        )
+    return history
+
+
+def _format(value) -> str:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        return "" if math.isnan(value) else f"{value:.3f}"
+    return str(value)
+
+
+def metrics_table(tests: list[dict]) -> tuple[list[str], list[list[str]]]:
+    headers: list[str] = ["Test", "Rework", "Base pressure", *REPORT_METRICS.values()]
+    rows: list[list[str]] = [
+        [
+            test["date"],
+            test["rework_letter"] or "-",
+            f"{test['base_pressure']:.2e}",
+            *(_format(test.get(metric, float("nan"))) for metric in REPORT_METRICS),
+        ]
+        for test in tests
+    ]
+    return headers, rows
+
+
+def history_table(history: list[dict]) -> tuple[list[str], list[list[str]]]:
+    headers: list[str] = [
+        "Rework",
+        "First test",
+        "Last test",
+        "Tests",
+        "Hysteresis area",
+        "Change from previous rework",
+    ]
+    rows: list[list[str]] = [
+        [
+            entry["rework_letter"] or "-",
+            entry["first_test"],
+            entry["last_test"],
+            str(entry["tests"]),
+            _format(entry["hysteresis_area"]),
+            _format(entry["hysteresis_change"]),
+        ]
+        for entry in history
+    ]
+    return headers, rows
+
+
+def _html_table(headers: list[str], rows: list[list[str]]) -> str:
+    head: str = "".join(f"<th>{html.escape(header)}</th>" for header in headers)
+    body: str = "\n".join(
+        "<tr>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in row) + "</tr>"
+        for row in rows
+    )
+    return f"<table>\n<tr>{head}</tr>\n{body}\n</table>"
+
+
+def write_html(
+    file_path: Path, serial_number: str, tests: list[dict], overlay_key: str
+) -> None:
+    """Write the report with the figures linked from the cache folder."""
+    title: str = f"VAT Valve {html.escape(serial_number)} history"
+    figures: str = "\n".join(
+        f"<h3>{html.escape(test['date'])} ({html.escape(test['rework_letter'] or '-')})"
+        f'</h3>\n<img src="cache/{test["key"]}.png" alt="{html.escape(test["file"])}">'
+        for test in tests
+    )
+    file_path.write_text(
+        f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #999; padding: 0.2em 0.6em; text-align: right; }}
+img {{ max-width: 100%; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{len(tests)} tests, AOI {AOI_LOWER_BOUND:.0e} to {AOI_UPPER_BOUND:.0e}</p>
+<h2>All tests</h2>
+<img src="cache/{overlay_key}.png" alt="All tests">
+<h2>Rework history</h2>
+{_html_table(*history_table(rework_history(tests)))}
+<h2>Hysteresis metrics</h2>
+{_html_table(*metrics_table(tests))}
+<h2>Tests</h2>
+{figures}
+</body>
+</html>
+""",
+        encoding="utf-8",
+    )
+
+
+def _image_page(image_path: Path) -> Figure:
+    fig = Figure(figsize=(11, 8.5))
+    ax = fig.add_axes((0.05, 0.05, 0.9, 0.9))
+    ax.imshow(matplotlib.image.imread(image_path))
+    ax.axis("off")
+    return fig
+
+
+def _table_pages(title: str, headers: list[str], rows: list[list[str]]) -> list[Figure]:
+    pages: list[Figure] = []
+    for start in range(0, max(len(rows), 1), PDF_TABLE_ROWS):
+        fig = Figure(figsize=(11, 8.5))
+        ax = fig.add_axes((0.05, 0.05, 0.9, 0.85))
+        ax.axis("off")
+        fig.suptitle(title, fontsize=12)
+        table = ax.table(
+            cellText=rows[start : start + PDF_TABLE_ROWS] or [[""] * len(headers)],
+            colLabels=[textwrap.fill(header, 16) for header in headers],
+            loc="upper center",
+        )
+        table.auto_set_font_size(False)
+        table.set_fontsize(6)
+        table.scale(1, 1.4)
+        for column in range(len(headers)):
+            cell = table[0, column]
+            cell.set_height(3 * cell.get_height())
+        pages.append(fig)
+    return pages
+
+
+def write_pdf(
+    file_path: Path,
+    serial_number: str,
+    tests: list[dict],
+    cache_dir: Path,
+    overlay_key: str,
+) -> None:
+    """Write the report with the cached figures as one page each."""
+    with PdfPages(file_path) as pdf:
+        pdf.savefig(_image_page(cache_dir / f"{overlay_key}.png"))
+        for page in _table_pages(
+            f"VAT Valve {serial_number} rework history",
+            *history_table(rework_history(tests)),
+        ) + _table_pages(
+            f"VAT Valve {serial_number} hysteresis metrics", *metrics_table(tests)
+        ):
+            pdf.savefig(page)
+        for test in tests:
+            pdf.savefig(_image_page(cache_dir / f"{test['key']}.png"))
+
+
+def compile_report(job: tuple[str, list[dict], Path, str, bool]) -> list[Path]:
+    """
+    Write the HTML report, and the PDF report if asked, of a valve. Runs in a
+    worker process.
+
+    :param job: (serial number, tests, report folder, overlay cache key, pdf)
+    :return: the report files
+    """
+    serial_number, tests, report_dir, overlay_key, pdf = job
+    files: list[Path] = [report_dir / f"{serial_number} history.html"]
+    write_html(files[0], serial_number, tests, overlay_key)
+    if pdf:
+        files.append(report_dir / f"{serial_number} history.pdf")
+        write_pdf(files[1], serial_number, tests, report_dir / "cache", overlay_key)
+    return files
+
+
+def _prune_cache(cache_dir: Path, keys: set[str]) -> None:
+    """Remove the cached results of tests that changed or were removed."""
+    for path in cache_dir.iterdir():
+        if path.suffix in (".png", ".json") and path.stem not in keys:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def generate_reports(
+    serial_numbers: list[str], pdf: bool = False, workers: int | None = None
+) -> dict[str, list[Path]]:
+    """
+    Generate the report of each valve, rendering only what is not cached.
+
+    :param workers: worker processes, one per CPU by default
+    :return: serial number -> report files, for the valves with tests
+    """
+    keys: dict[str, list[tuple[Path, str]]] = {}
+    render_jobs: list[tuple[Path, str, str, Path]] = []
+    for serial_number in serial_numbers:
+        cache_dir: Path = REPORTS_DIR / serial_number / "cache"
+        keys[serial_number] = []
+        csv_files: list[Path] = find_test_csvs(serial_number)
+        if csv_files:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        for file_path in csv_files:
+            try:
+                key: str = csv_cache_key(file_path, serial_number)
+            except OSError as e:
+                logger.warning("Could not read %s: %s", file_path, e)
+                continue
+            keys[serial_number].append((file_path, key))
+            if not (cache_dir / f"{key}.json").exists():
+                render_jobs.append((file_path, serial_number, key, cache_dir))
+
+    reports: dict[str, list[Path]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for job, error in zip(render_jobs, executor.map(render_test, render_jobs)):
+            if error is not None:
+                logger.warning("Could not analyze %s: %s", job[0], error)
+
+        overlay_jobs: list[tuple[str, list[dict], Path, str]] = []
+        report_jobs: list[tuple[str, list[dict], Path, str, bool]] = []
+        report_keys: dict[str, str] = {}
+        for serial_number, valve_keys in keys.items():
+            report_dir: Path = REPORTS_DIR / serial_number
+            cache_dir = report_dir / "cache"
+            valve_tests: list[dict] = []
+            for file_path, key in valve_keys:
+                try:
+                    with open(cache_dir / f"{key}.json") as file:
+                        test: dict = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                test["path"] = str(file_path)
+                valve_tests.append(test)
+            if not valve_tests:
+                logger.warning("No tests found for valve %s", serial_number)
+                continue
+            _prune_cache(cache_dir, {test["key"] for test in valve_tests})
+            overlay_key: str = cache_key(
+                "overlay", *(test["key"] for test in valve_tests)
+            )
+            if not (cache_dir / f"{overlay_key}.png").exists():
+                overlay_jobs.append(
+                    (serial_number, valve_tests, cache_dir, overlay_key)
+                )
+            report_keys[serial_number] = cache_key("report", overlay_key, str(pdf))
+            files: list[Path] = [report_dir / f"{serial_number} history.html"]
+            if pdf:
+                files.append(report_dir / f"{serial_number} history.pdf")
+            key_path: Path = cache_dir / "report.key"
+            if (
+                key_path.exists()
+                and key_path.read_text() == report_keys[serial_number]
+                and all(file_path.exists() for file_path in files)
+            ):
+                reports[serial_number] = files
+                continue
+            report_jobs.append(
+                (serial_number, valve_tests, report_dir, overlay_key, pdf)
+            )
+
+        for job, error in zip(overlay_jobs, executor.map(render_overlay, overlay_jobs)):
+            if error is not None:
+                logger.warning("Could not render the tests of %s: %s", job[0], error)
+                report_jobs = [report for report in report_jobs if report[0] != job[0]]
+        for job, files in zip(report_jobs, executor.map(compile_report, report_jobs)):
+            serial_number, _, report_dir, _, _ = job
+            (report_dir / "cache" / "report.key").write_text(report_keys[serial_number])
+            reports[serial_number] = files
+    return reports
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    pdf: bool = False
+    workers: int | None = None
+    serial_numbers: list[str] = []
+    while args:
+        arg: str = args.pop(0)
+        if arg == "--pdf":
+            pdf = True
+        elif arg == "--workers" and args:
+            workers = int(args.pop(0))
+        elif arg == "--all":
+            serial_numbers.extend(all_serial_numbers())
+        else:
+            serial_numbers.append(arg)
+    if not serial_numbers:
+        print(__doc__)
+        return
+
+    reports: dict[str, list[Path]] = generate_reports(serial_numbers, pdf, workers)
+    for serial_number in serial_numbers:
+        if serial_number not in reports:
+            print(f"No tests found for valve {serial_number}.")
+            continue
+        for file_path in reports[serial_number]:
+            print(f"Valve {serial_number} report saved to {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,167 @@
 import csv
+import logging
+import zipfile
 from datetime import datetime
 from pathlib import Path
 
 from matplotlib.figure import Figure
-from PySide6.QtCore import QEventLoop, QTimer
 from PySide6.QtWidgets import QLabel
 
-from api.agc100 import AGC100
 from api.motor import MotorController
-from api.pfeiffer_tpg26x import TPG261
+from api.pressure_gauge import PressureSource
+from api.serial_metrics import METRICS
 from gui.live_plot_window import LivePlotWindow
+from helpers.checkpoint import CHECKPOINT_PATH, clear_checkpoint, save_checkpoint
+from helpers.clock import QtClock, VirtualClock
 from helpers.constants import (
     AOI_LOWER_BOUND,
     AOI_UPPER_BOUND,
+    COARSE_HOLD_TIME,
+    COARSE_MOTOR_STEP_SIZE,
+    COARSE_SCAN,
     DRIFT_TOLERANCE,
+    FINE_SCAN_MARGIN,
     HOLD_TIME,
+    MAX_VALVE_TURNS,
     MICROSTEPS_PER_REV,
+    MOTOR_ACCELERATION,
     MOTOR_STEP_SIZE,
+    MOTOR_VELOCITY,
     PRESSURE_TURN_POINT,
+    REMOTE_DATA_DIR,
+    RESULTS_DIR,
+    SWEEP_MODE,
+    SWEEP_SAMPLE_INTERVAL,
+    SWEEP_VELOCITY,
+    VALVE_MODEL,
 )
+from helpers.curve_analysis import analyze_test, write_results_index
+from helpers.golden_curve import GOLDEN_CURVES_DIR, GoldenEnvelope
+from helpers.link_supervisor import LinkLost
 from helpers.normalized_data_plotter import NormalizedPlot
+from helpers.phase_profiler import PhaseProfiler
+from helpers.replay_devices import write_trace
+from helpers.safety_monitor import ARM_TIME, SafetyMonitor
+from helpers.sweep_sampler import SweepSampler
+from helpers.test_history import previous_aoi_entry_turns
+from helpers.transients import TRANSIENTS_DIR, write_transients
+from helpers.units import parse_pressure, to_canonical
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Upper bounds of the waits after opening and closing the valve at turn-around
+TURN_AROUND_OPEN_WAIT: int = 5
+TURN_AROUND_CLOSE_WAIT: int = 30
+# Number of one second readings that must agree before the pressure is settled
+SETTLE_READINGS: int = 3
+# Seconds between reconnect attempts while the test waits for a lost device
+LINK_RETRY_INTERVAL: float = 1.0
 
 
 class ValveTest:
     def __init__(
         self,
         motor: MotorController,
-        pressure_gauge: TPG261 | AGC100,
+        pressure_gauge: PressureSource,
         serial_number: str,
         rework_letter: str,
         base_pressure: str,
         valve_position_label: QLabel,
         live_plot_window: LivePlotWindow,
+        clock: QtClock | VirtualClock | None = None,
+        save_results: bool = True,
+        safety_monitor: SafetyMonitor | None = None,
     ) -> None:
         self.motor: MotorController = motor
-        if type(pressure_gauge) is TPG261:
-            self.gauge = pressure_gauge
-        elif type(pressure_gauge) is AGC100:
-            self.gauge = pressure_gauge
+        self.gauge: PressureSource = pressure_gauge
         self.serial_number: str = serial_number
         self.rework_letter: str = rework_letter
         self.base_pressure: str = base_pressure
         self.actual_position_label: QLabel = valve_position_label
         self.live_plot_window: LivePlotWindow = live_plot_window
+        self.clock: QtClock | VirtualClock = clock if clock is not None else QtClock()
+        self.save_results: bool = save_results
+
+        # Test parameters, from the INI file unless a tuner overrides them
+        self.hold_time: int = HOLD_TIME
+        self.drift_tolerance: float = DRIFT_TOLERANCE
+        self.motor_step_size: int = MOTOR_STEP_SIZE
+        self.aoi_lower_bound: float = AOI_LOWER_BOUND
+        self.aoi_upper_bound: float = AOI_UPPER_BOUND
+        # Seconds of test time after which the test stops unfinished, set by
+        # replays of traces the current logic may never finish
+        self.time_limit: float = float("inf")
+        # Valve position at which step mode turns around even below
+        # PRESSURE_TURN_POINT, set by replays to stay within the recording
+        self.turn_around_limit: float = float("inf")
+        # Sweeps sample no faster than the gauge produces new readings
+        self.sweep_sample_interval: float = max(
+            SWEEP_SAMPLE_INTERVAL, 1 / self.gauge.capabilities.max_sample_rate
+        )
 
         self.running: bool = False
+        self.completed: bool = False
         self.direction: str = "up"
-        self.pressure: float = float(self.base_pressure)
-        self.valve_position: float = (
-            int(self.motor.query_position()) / MICROSTEPS_PER_REV
-        )
+        self.base_pressure_value: float = parse_pressure(self.base_pressure)
+        self.pressure: float = self.base_pressure_value
+        self.motor_position: int = int(self.motor.query_position())
+        self.valve_position: float = self.motor_position / MICROSTEPS_PER_REV
+        self.start_time: float = self.clock.now()
+        self.move_time: float = self.start_time
 
         self.pressure_up_log: list[float] = list()
         self.pressure_down_log: list[float] = list()
         self.turns_up_log: list[float] = list()
         self.turns_down_log: list[float] = list()
+        self.coarse_turns_log: list[float] = list()
+        self.coarse_pressure_log: list[float] = list()
+        self.csv_file_path: Path | None = None
+        self.profiler = PhaseProfiler(self.clock.now)
+        # (time, time since move, motor position, pressure, direction) per reading
+        self.trace: list[tuple[float, float, int, float, str]] = list()
+        self.checkpoint_path: Path = CHECKPOINT_PATH
+        self.turn_around_time_saved: float = 0.0
+        self.safety_monitor: SafetyMonitor | None = safety_monitor
+        # Log lengths and position before the current step, to redo the step
+        # after a lost device link is restored
+        self.step_mark: tuple | None = None
 
     def _update_valve_position_label(self, valve_position: float) -> None:
         valve_position_str: str = f"{valve_position:.2f}"
         self.actual_position_label.setText(valve_position_str)
 
+    def _update_live_plot(self) -> None:
+        with self.profiler.phase("plot"):
+            self.live_plot_window.update_plot(
+                self.turns_up_log,
+                self.pressure_up_log,
+                self.turns_down_log,
+                self.pressure_down_log,
+            )
+
     def _get_pressure(self) -> float:
-        pressure, (status_code, status_string) = self.gauge.pressure_gauge()
+        with self.profiler.phase("serial I/O"):
+            reading, (status_code, status_string) = self.gauge.pressure_gauge()
+        pressure: float = to_canonical(reading, self.gauge.unit)
+        now: float = self.clock.now()
+        self.trace.append(
+            (
+                now - self.start_time,
+                now - self.move_time,
+                self.motor_position,
+                pressure,
+                self.direction,
+            )
+        )
         if status_code != 0:
             raise ValueError(f"Pressure gauge error: {status_string}")
         return pressure
 
     def _get_motor_position(self) -> int:
-        position: str = self.motor.query_position()
-        return int(position)
+        with self.profiler.phase("serial I/O"):
+            position: str = self.motor.query_position()
+        self.motor_position = int(position)
+        return self.motor_position
 
     def _get_valve_position(self) -> float:
         motor_position: int = self._get_motor_position()
@@ -76,20 +169,43 @@ class ValveTest:
         self._update_valve_position_label(valve_position)
         return round(valve_position, 2)
 
+    def _arm_safety_monitor(self, motor_steps: int) -> None:
+        if self.safety_monitor is not None:
+            self.safety_monitor.arm(abs(motor_steps) / MOTOR_VELOCITY + ARM_TIME)
+
+    def _safety_trip(self, reason: str) -> None:
+        # Called from the safety monitor thread, which has already stopped the
+        # motor and closed the valve
+        logger.error("Valve test aborted: %s", reason)
+        self.running = False
+
     def _open_valve(self, amount: int) -> None:
-        self.motor.move_relative(amount)
+        self._arm_safety_monitor(amount)
+        with self.profiler.phase("move"):
+            self.motor.move_relative(amount)
+        self.move_time = self.clock.now()
 
     def _close_valve(self, amount: int) -> None:
-        self.motor.move_relative(-amount)
+        self._arm_safety_monitor(amount)
+        with self.profiler.phase("move"):
+            self.motor.move_relative(-amount)
+        self.move_time = self.clock.now()
+
+    def _fixed_wait(self, seconds: float) -> None:
+        with self.profiler.phase("fixed wait"):
+            self.pause(seconds)
 
     def _pressure_is_above_PRESSURE_TURN_POINT(self) -> bool:
         return self.pressure > PRESSURE_TURN_POINT
 
     def _pressure_is_below_base_pressure(self) -> bool:
-        return self.pressure < float(self.base_pressure)
+        return self.pressure < self.base_pressure_value
 
     def _pressure_is_within_AOI_bounds(self) -> bool:
-        return self.pressure > AOI_LOWER_BOUND and self.pressure < AOI_UPPER_BOUND
+        return (
+            self.pressure > self.aoi_lower_bound
+            and self.pressure < self.aoi_upper_bound
+        )
 
     def _log_turns_and_pressure(self, valve_position: float, pressure: float) -> None:
         if self.direction == "up":
@@ -103,85 +219,258 @@ class ValveTest:
         if len(checklist) < 2:
             return False
         percent_change = self._percent_change(checklist[0], checklist[-1])
-        return percent_change < DRIFT_TOLERANCE
+        return percent_change < self.drift_tolerance
 
     def _wait_for_stability(self, valve_position: float) -> None:
         checklist: list[float] = []
-        while not self._pressure_stable(checklist):
-            for _ in range(HOLD_TIME):
-                self.pressure = self._get_pressure()
-                checklist.append(self.pressure)
-                print(f"{checklist = }")
-                self._log_turns_and_pressure(valve_position, self.pressure)
-                self.live_plot_window.update_plot(
-                    self.turns_up_log,
-                    self.pressure_up_log,
-                    self.turns_down_log,
-                    self.pressure_down_log,
-                )
-                if not self._pressure_stable(checklist) and len(checklist) >= 2:
-                    print("Pressure not stable.\n")
-                    checklist.clear()
-                    self.pause(1)
-                    break
-                self.pause(1)
-            if self._pressure_stable(checklist):
+        attempt: int = 0
+        while self.running and not self._pressure_stable(checklist):
+            with self.profiler.phase("retry" if attempt else "stability wait"):
+                self._stability_attempt(valve_position, checklist)
+            attempt += 1
+
+    def _stability_attempt(self, valve_position: float, checklist: list[float]) -> None:
+        for _ in range(self.hold_time):
+            self.pressure = self._get_pressure()
+            checklist.append(self.pressure)
+            logger.debug(
+                "Stability reading %d: %.4E",
+                len(checklist),
+                self.pressure,
+                extra={"valve_position": valve_position, "pressure": self.pressure},
+            )
+            self._log_turns_and_pressure(valve_position, self.pressure)
+            self._update_live_plot()
+            if not self._pressure_stable(checklist) and len(checklist) >= 2:
+                logger.debug("Pressure not stable.")
+                checklist.clear()
                 self.pause(1)
+                break
+            self.pause(1)
+        if self._pressure_stable(checklist):
+            self.pause(1)
 
     def _check_if_valve_has_reached_turn_around_point(self) -> None:
-        if self._pressure_is_above_PRESSURE_TURN_POINT() and self.direction == "up":
-            self._open_valve(MICROSTEPS_PER_REV)  # open valve one full turn
-            self.pause(5)
-            self.valve_position = self._get_valve_position()
-            self.pressure = self._get_pressure()
-            self._log_turns_and_pressure(self.valve_position, self.pressure)
-            self.direction = "down"
-            self._log_turns_and_pressure(self.valve_position, self.pressure)
-            self.live_plot_window.update_plot(
-                self.turns_up_log,
-                self.pressure_up_log,
-                self.turns_down_log,
-                self.pressure_down_log,
-            )
-            self._close_valve(MICROSTEPS_PER_REV)  # close valve one full turn
-            self.pause(30)
-            self.valve_position = self._get_valve_position()
-            self.pressure = self._get_pressure()
-            self._log_turns_and_pressure(self.valve_position, self.pressure)
-            self.live_plot_window.update_plot(
-                self.turns_up_log,
-                self.pressure_up_log,
-                self.turns_down_log,
-                self.pressure_down_log,
-            )
+        if self.direction == "up" and (
+            self._pressure_is_above_PRESSURE_TURN_POINT()
+            or self.valve_position >= self.turn_around_limit
+        ):
+            with self.profiler.phase("turn-around"):
+                self._turn_around()
+
+    def _wait_until_settled(self, max_wait: float, rising: bool) -> None:
+        """
+        Sample the pressure every second until it has passed its peak (or its
+        trough when not rising) and then stopped moving by the DRIFT_TOLERANCE
+        criterion over the last SETTLE_READINGS readings, or until max_wait
+        seconds have passed. Waiting for the turn keeps a few equal readings
+        taken before the pressure responds to the move from ending the wait.
+        """
+        with self.profiler.phase("settle"):
+            start: float = self.clock.now()
+            readings: list[float] = []
+            while self.running and self.clock.now() - start < max_wait:
+                self.pause(min(1, max_wait - (self.clock.now() - start)))
+                readings.append(self._get_pressure())
+                extreme: float = max(readings) if rising else min(readings)
+                turned: bool = readings.index(extreme) < len(readings) - 1
+                if (
+                    turned
+                    and len(readings) >= SETTLE_READINGS
+                    and self._pressure_stable(readings[-SETTLE_READINGS:])
+                ):
+                    break
+            waited: float = self.clock.now() - start
+        self.turn_around_time_saved += max(max_wait - waited, 0)
+        logger.info("Pressure settled after %.1f s of %s s.", waited, max_wait)
+
+    def _turn_around(self) -> None:
+        self._open_valve(MICROSTEPS_PER_REV)  # open valve one full turn
+        self._wait_until_settled(TURN_AROUND_OPEN_WAIT, rising=True)
+        self.valve_position = self._get_valve_position()
+        self.pressure = self._get_pressure()
+        self._log_turns_and_pressure(self.valve_position, self.pressure)
+        self.direction = "down"
+        self._log_turns_and_pressure(self.valve_position, self.pressure)
+        self._update_live_plot()
+        self._close_valve(MICROSTEPS_PER_REV)  # close valve one full turn
+        self._wait_until_settled(TURN_AROUND_CLOSE_WAIT, rising=False)
+        self.valve_position = self._get_valve_position()
+        self.pressure = self._get_pressure()
+        self._log_turns_and_pressure(self.valve_position, self.pressure)
+        self._update_live_plot()
 
     def _move_by_STEP_SIZE_and_wait_for_stability(self) -> None:
         if self.direction == "up":
-            self._open_valve(MOTOR_STEP_SIZE)
+            self._open_valve(self.motor_step_size)
         else:
-            self._close_valve(MOTOR_STEP_SIZE)
-        self.pause(1)
+            self._close_valve(self.motor_step_size)
+        self._fixed_wait(1)
         self.valve_position = self._get_valve_position()
-        self.pause(HOLD_TIME - 1)
+        self._fixed_wait(self.hold_time - 1)
         self.pressure = self._get_pressure()
         if not self._pressure_is_within_AOI_bounds():
             self._log_turns_and_pressure(self.valve_position, self.pressure)
-            self.live_plot_window.update_plot(
-                self.turns_up_log,
-                self.pressure_up_log,
-                self.turns_down_log,
-                self.pressure_down_log,
-            )
+            self._update_live_plot()
             return
         self._wait_for_stability(self.valve_position)
 
+    def _sample_motor_position(self, sweep: SweepSampler) -> int:
+        start: float = self.clock.now()
+        motor_position: int = self._get_motor_position()
+        sweep.add_position((start + self.clock.now()) / 2, motor_position)
+        self._update_valve_position_label(motor_position / MICROSTEPS_PER_REV)
+        return motor_position
+
+    def _sample_pressure(self, sweep: SweepSampler) -> float:
+        start: float = self.clock.now()
+        pressure: float = self._get_pressure()
+        sweep.add_pressure((start + self.clock.now()) / 2, pressure)
+        return pressure
+
+    def _log_sweep_samples(self, sweep: SweepSampler) -> None:
+        valve_positions, pressures = sweep.pop_aligned()
+        if not pressures:
+            return
+        for valve_position, pressure in zip(valve_positions, pressures):
+            self._log_turns_and_pressure(valve_position, pressure)
+        self._update_live_plot()
+
+    def _sweep_is_finished(self, motor_position: int) -> bool:
+        if self._pressure_is_within_AOI_bounds():
+            return True
+        if self.direction == "up":
+            return (
+                self._pressure_is_above_PRESSURE_TURN_POINT()
+                or motor_position >= MAX_VALVE_TURNS * MICROSTEPS_PER_REV
+            )
+        return self._pressure_is_below_base_pressure() or motor_position <= 0
+
+    def _sweep_outside_AOI(self) -> None:
+        """
+        Turn the motor at SWEEP_VELOCITY while sampling the motor position and
+        the pressure until the pressure enters the AOI or the end of the
+        current sweep direction is reached. Each pressure sample is logged with
+        the valve position interpolated from its timestamp.
+        """
+        sweep = SweepSampler()
+        if self.direction == "up":
+            target_position: int = MAX_VALVE_TURNS * MICROSTEPS_PER_REV
+        else:
+            target_position = 0
+        self.motor.set_velocity_and_acceleration(SWEEP_VELOCITY, MOTOR_ACCELERATION)
+        if self.safety_monitor is not None:
+            self.safety_monitor.arm(float("inf"))
+        self.motor.move_absolute(target_position)
+        self.move_time = self.clock.now()
+        try:
+            while self.running:
+                motor_position: int = self._sample_motor_position(sweep)
+                self._log_sweep_samples(sweep)
+                self.pressure = self._sample_pressure(sweep)
+                if self._sweep_is_finished(motor_position):
+                    break
+                self.pause(self.sweep_sample_interval)
+        finally:
+            if self.running:
+                self.motor.stop()
+                self.motor.set_velocity_and_acceleration(
+                    MOTOR_VELOCITY, MOTOR_ACCELERATION
+                )
+            if self.safety_monitor is not None:
+                self.safety_monitor.disarm()
+                self._arm_safety_monitor(0)
+        self._sample_motor_position(sweep)
+        self._log_sweep_samples(sweep)
+        self.valve_position = self._get_valve_position()
+
+    def _move_to_valve_position(self, valve_position: float) -> None:
+        motor_stop_point: int = round(valve_position * MICROSTEPS_PER_REV)
+        self._arm_safety_monitor(motor_stop_point - self.motor_position)
+        self.motor.move_absolute(motor_stop_point)
+        self.move_time = self.clock.now()
+        while self.running and self._get_motor_position() != motor_stop_point:
+            self.pause(0.25)
+        self.valve_position = self._get_valve_position()
+
+    def _wait_until_pressure_is_below_AOI(self, max_wait: int = 60) -> None:
+        for _ in range(max_wait):
+            self.pressure = self._get_pressure()
+            if self.pressure < self.aoi_lower_bound or not self.running:
+                return
+            self.pause(1)
+
+    def _coarse_scan(self) -> float | None:
+        """
+        Open the valve in COARSE_STEP_SIZE steps with COARSE_HOLD_TIME holds
+        until the pressure reaches PRESSURE_TURN_POINT.
+
+        :return: valve turns at which the pressure entered the AOI, or None
+        """
+        aoi_entry_turns: float | None = None
+        while self.running:
+            self._open_valve(COARSE_MOTOR_STEP_SIZE)
+            self._fixed_wait(COARSE_HOLD_TIME)
+            self.valve_position = self._get_valve_position()
+            self.pressure = self._get_pressure()
+            self.coarse_turns_log.append(self.valve_position)
+            self.coarse_pressure_log.append(self.pressure)
+            if aoi_entry_turns is None and self.pressure > self.aoi_lower_bound:
+                aoi_entry_turns = self.valve_position
+            if (
+                self._pressure_is_above_PRESSURE_TURN_POINT()
+                or self.valve_position >= MAX_VALVE_TURNS
+            ):
+                logger.info(
+                    "Coarse scan: AOI entry at %s turns, turn point at %s turns.",
+                    aoi_entry_turns,
+                    self.valve_position,
+                )
+                break
+        return aoi_entry_turns
+
+    def _move_to_fine_scan_start(self) -> None:
+        """
+        Move the valve to FINE_SCAN_MARGIN turns before the AOI entry. The AOI
+        entry of the previous test of this valve is used when it is still
+        below the AOI, otherwise a coarse scan locates it.
+        """
+        prior: float | None = previous_aoi_entry_turns(self.serial_number)
+        if prior is not None:
+            self._move_to_valve_position(max(prior - FINE_SCAN_MARGIN, 0))
+            self.pressure = self._get_pressure()
+            if self.pressure < self.aoi_lower_bound:
+                logger.info("Starting fine scan at %s turns.", self.valve_position)
+                return
+            logger.info(
+                "Previous test AOI entry is inside the AOI. Running coarse scan."
+            )
+            self._move_to_valve_position(0)
+            self._wait_until_pressure_is_below_AOI()
+
+        aoi_entry_turns: float | None = self._coarse_scan()
+        if aoi_entry_turns is None:
+            aoi_entry_turns = FINE_SCAN_MARGIN
+        # Close fully, then open to the start so it is approached while opening
+        self._move_to_valve_position(0)
+        self._move_to_valve_position(max(aoi_entry_turns - FINE_SCAN_MARGIN, 0))
+        self._wait_until_pressure_is_below_AOI()
+        logger.info("Starting fine scan at %s turns.", self.valve_position)
+
     def _check_if_valve_test_needs_to_stop(self) -> None:
         if (
             self._pressure_is_below_base_pressure() or self.valve_position == 0
         ) and self.direction == "down":
+            self.completed = True
             self.stop()
-            print("Valve test complete.")
+            logger.info("Valve test complete.")
             # ADD: display a message window that says the valve test is complete.
+        elif self.clock.now() - self.start_time > self.time_limit:
+            logger.warning(
+                "Valve test stopped: it ran past its time limit of %.0f s.",
+                self.time_limit,
+            )
+            self.stop()
 
     def _create_csv(self, file_path: Path) -> None:
         with open(file_path, mode="w", newline="") as file:
@@ -230,12 +519,59 @@ class ValveTest:
             ):
                 writer.writerow(row)
 
-        print(f"CSV file saved to {file_path}")
+        self.csv_file_path = file_path
+        logger.info("CSV file saved to %s", file_path)
+
+    def save_metrics(self) -> None:
+        """
+        Analyze the opening and closing curves, compare them to the golden
+        curve of VALVE_MODEL when there is one and append the results to the
+        results index.
+        """
+        metrics: dict[str, float | bool] = analyze_test(
+            self.turns_up_log,
+            self.pressure_up_log,
+            self.turns_down_log,
+            self.pressure_down_log,
+        )
+        row: dict = {
+            "file": self.csv_file_path.name if self.csv_file_path else "",
+            "serial_number": self.serial_number,
+        }
+        row.update(metrics)
+        verdict: dict[str, float | bool] = {}
+        if (GOLDEN_CURVES_DIR / f"{VALVE_MODEL}.npz").exists():
+            try:
+                envelope: GoldenEnvelope = GoldenEnvelope.load(VALVE_MODEL)
+                verdict = envelope.compare(
+                    self.turns_up_log,
+                    self.pressure_up_log,
+                    self.turns_down_log,
+                    self.pressure_down_log,
+                )
+            except (KeyError, ValueError, OSError, zipfile.BadZipFile) as e:
+                # A corrupt or old format envelope must not stop the save
+                logger.error(
+                    "Could not compare to the %s golden curve: %s", VALVE_MODEL, e
+                )
+        if verdict:
+            result: str = "PASSED" if verdict["passed"] else "FAILED"
+            logger.info(
+                "Valve %s %s the %s golden curve.",
+                self.serial_number,
+                result,
+                VALVE_MODEL,
+            )
+            row.update(verdict)
+        try:
+            write_results_index([row], append=True)
+        except OSError as e:
+            logger.error("Could not save metrics to the results index: %s", e)
 
     def save_csv_locally(self) -> None:
         date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
         file_name: str = f"{date_time} {self.serial_number}{self.rework_letter}.csv"
-        results_dir: Path = Path("results")
+        results_dir: Path = RESULTS_DIR
         csv_files_dir: str = "csv_files"
         valve_dir: str = f"{self.serial_number}"
         folder_path: Path = results_dir / csv_files_dir / valve_dir
@@ -244,20 +580,18 @@ class ValveTest:
             file_path: Path = folder_path / file_name
             self._create_csv(file_path)
         else:
-            print(f"Could not save csv file. {folder_path} does not exist")
+            logger.error("Could not save csv file. %s does not exist", folder_path)
 
     def save_csv_remotely(self) -> None:
         date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
         file_name: str = f"{date_time} {self.serial_number}{self.rework_letter}.csv"
-        VAT_data_by_SN_dir: Path = Path(
-            r"\\opdata2\Company\PRODUCTION FOLDER\VAT Leak Valve Test Data\VAT Data by SN"
-        )
+        VAT_data_by_SN_dir: Path = REMOTE_DATA_DIR
         valve_dir: str = f"{self.serial_number}"
         folder_path: Path = VAT_data_by_SN_dir / valve_dir
         try:
             folder_path.mkdir(parents=True, exist_ok=True)
         except Exception:
-            print(
+            logger.warning(
                 "Could not save csv file to company drive. Attempting to save locally..."
             )
             self.save_csv_locally()
@@ -271,33 +605,280 @@ class ValveTest:
         percent_change: float = abs(difference) / starting_num * 100
         return percent_change
 
-    @staticmethod
-    def pause(seconds: float) -> None:
-        loop = QEventLoop()
-        QTimer.singleShot(int(seconds * 1000), loop.quit)
-        loop.exec()
+    def pause(self, seconds: float) -> None:
+        self.clock.pause(seconds)
 
     def plot_data(self) -> Figure:
-        normalized_plot = NormalizedPlot(
-            self.serial_number, self.rework_letter, self.base_pressure
+        with self.profiler.phase("plot"):
+            normalized_plot = NormalizedPlot(
+                self.serial_number, self.rework_letter, self.base_pressure
+            )
+            figure = normalized_plot.plot(
+                self.turns_up_log,
+                self.pressure_up_log,
+                self.turns_down_log,
+                self.pressure_down_log,
+            )
+        return figure
+
+    def save_profile(self) -> None:
+        """Log the phase summary and save the phase timeline and summary."""
+        logger.info("Test phases:\n%s", self.profiler.summary())
+        logger.info("Time saved at turn-around: %.1f s", self.turn_around_time_saved)
+        date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
+        file_name: str = f"{date_time} {self.serial_number}{self.rework_letter}"
+        folder_path: Path = RESULTS_DIR / "timelines" / f"{self.serial_number}"
+        try:
+            self.profiler.write_timeline(folder_path / f"{file_name} timeline.csv")
+            self.profiler.write_summary(folder_path / f"{file_name} phases.txt")
+        except OSError as e:
+            logger.error("Could not save the test timeline: %s", e)
+
+    def save_trace(self) -> None:
+        """Save every pressure reading with its time and valve position."""
+        date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
+        file_name: str = (
+            f"{date_time} {self.serial_number}{self.rework_letter} trace.csv"
+        )
+        folder_path: Path = RESULTS_DIR / "traces" / f"{self.serial_number}"
+        metadata: dict[str, str] = {
+            "serial_number": self.serial_number,
+            "rework_letter": self.rework_letter,
+            "base_pressure": self.base_pressure,
+        }
+        try:
+            write_trace(folder_path / file_name, self.trace, metadata)
+        except OSError as e:
+            logger.error("Could not save the test trace: %s", e)
+
+    def save_transients(self) -> None:
+        """Save the readings after every move, grouped by step, for offline tuning."""
+        date_time: str = datetime.now().strftime("%Y-%m-%d %H_%M")
+        file_name: str = (
+            f"{date_time} {self.serial_number}{self.rework_letter} transients.npz"
+        )
+        folder_path: Path = TRANSIENTS_DIR / f"{self.serial_number}"
+        metadata: dict[str, str] = {
+            "serial_number": self.serial_number,
+            "rework_letter": self.rework_letter,
+            "base_pressure": self.base_pressure,
+        }
+        try:
+            write_transients(folder_path / file_name, self.trace, metadata)
+        except OSError as e:
+            logger.error("Could not save the step transients: %s", e)
+
+    def save_serial_metrics(self) -> None:
+        """Log the serial command latency summary and save the metrics file."""
+        if not METRICS.enabled:
+            return
+        logger.info("Serial command latency:\n%s", METRICS.summary())
+        try:
+            METRICS.write_metrics_file(RESULTS_DIR / "metrics" / "serial_metrics.prom")
+        except OSError as e:
+            logger.error("Could not save the serial metrics file: %s", e)
+
+    def checkpoint_state(self) -> dict:
+        """Return everything needed to continue the test after the last step."""
+        return {
+            "serial_number": self.serial_number,
+            "rework_letter": self.rework_letter,
+            "base_pressure": self.base_pressure,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "elapsed_time": self.clock.now() - self.start_time,
+            "direction": self.direction,
+            "motor_position": self.motor_position,
+            "valve_position": self.valve_position,
+            "pressure": self.pressure,
+            "turns_up_log": self.turns_up_log,
+            "pressure_up_log": self.pressure_up_log,
+            "turns_down_log": self.turns_down_log,
+            "pressure_down_log": self.pressure_down_log,
+            "coarse_turns_log": self.coarse_turns_log,
+            "coarse_pressure_log": self.coarse_pressure_log,
+            "trace": self.trace,
+        }
+
+    def restore_checkpoint(self, state: dict) -> None:
+        """Load the state saved by checkpoint_state. Call run(resume=True) next."""
+        self.direction = state["direction"]
+        self.motor_position = state["motor_position"]
+        self.valve_position = state["valve_position"]
+        self.pressure = state["pressure"]
+        self.turns_up_log = state["turns_up_log"]
+        self.pressure_up_log = state["pressure_up_log"]
+        self.turns_down_log = state["turns_down_log"]
+        self.pressure_down_log = state["pressure_down_log"]
+        self.coarse_turns_log = state["coarse_turns_log"]
+        self.coarse_pressure_log = state["coarse_pressure_log"]
+        self.trace = [tuple(row) for row in state["trace"]]  # type: ignore
+        self.start_time = self.clock.now() - state["elapsed_time"]
+
+    def save_checkpoint(self) -> None:
+        with self.profiler.phase("checkpoint"):
+            try:
+                save_checkpoint(self.checkpoint_state(), self.checkpoint_path)
+            except (OSError, TypeError, ValueError) as e:
+                logger.error("Could not save the test checkpoint: %s", e)
+
+    def discard_checkpoint(self) -> None:
+        clear_checkpoint(self.checkpoint_path)
+
+    def _return_to_checkpoint_position(self) -> None:
+        """
+        Verify the motor is where the checkpoint left it and move it back if
+        not, approaching from the side the current sweep direction comes
+        from so stem backlash is taken up as it was during the test. The
+        controller's step counter is trusted here; main asks the operator to
+        close the valve and zeroes the motor first when it does not match.
+        """
+        motor_stop_point: int = self.motor_position
+        valve_position: float = self.valve_position
+        if self._get_motor_position() == motor_stop_point:
+            return
+        logger.info(
+            "Returning the valve to %s turns to resume the test.", valve_position
         )
-        figure = normalized_plot.plot(
+        if self.direction == "down":
+            self._move_to_valve_position(
+                min(valve_position + FINE_SCAN_MARGIN, MAX_VALVE_TURNS)
+            )
+        else:
+            self._move_to_valve_position(max(valve_position - FINE_SCAN_MARGIN, 0))
+        self._move_to_valve_position(valve_position)
+        self.pressure = self._get_pressure()
+
+    def _logs(self) -> list[list]:
+        return [
             self.turns_up_log,
             self.pressure_up_log,
             self.turns_down_log,
             self.pressure_down_log,
+            self.coarse_turns_log,
+            self.coarse_pressure_log,
+            self.trace,
+        ]
+
+    def _mark_step(self) -> None:
+        self.step_mark = (
+            [len(log) for log in self._logs()],
+            self.direction,
+            self.motor_position,
+            self.valve_position,
+            self.pressure,
         )
-        return figure
 
-    def run(self) -> None:
-        self.running = True
+    def _rewind_to_step_mark(self) -> None:
+        """Drop what the interrupted step logged and return to where it began."""
+        lengths, self.direction, self.motor_position, self.valve_position, pressure = (
+            self.step_mark  # type: ignore
+        )
+        for log, length in zip(self._logs(), lengths):
+            del log[length:]
+        self.pressure = pressure
+        self._update_live_plot()
+        self._return_to_checkpoint_position()
+
+    def _wait_for_link(self, error: LinkLost) -> None:
+        """Pause the test until the lost device is reconnected or the test stops."""
+        logger.warning("Valve test paused: %s", error)
+        with self.profiler.phase("link lost"):
+            while self.running and not error.device.restore():
+                self.pause(LINK_RETRY_INTERVAL)
+        if not getattr(self.motor, "position_verified", True):
+            logger.error(
+                "Valve test aborted: the motor position could not be verified."
+            )
+            self.running = False
+        elif self.running:
+            logger.info("Valve test continuing from the last step.")
+
+    def _run_step(self, step) -> None:
+        """
+        Run one step of the test. If a device link drops during it, wait for
+        the link to be restored, return to the state before the step and run
+        it again.
+        """
+        self._mark_step()
+        interrupted: bool = False
         while self.running:
-            self._check_if_valve_has_reached_turn_around_point()
+            try:
+                if interrupted:
+                    self._rewind_to_step_mark()
+                step()
+                return
+            except LinkLost as e:
+                interrupted = True
+                self._wait_for_link(e)
+
+    def _test_step(self) -> None:
+        self._check_if_valve_has_reached_turn_around_point()
+        if SWEEP_MODE and not self._pressure_is_within_AOI_bounds():
+            with self.profiler.phase("sweep"):
+                self._sweep_outside_AOI()
+        else:
             self._move_by_STEP_SIZE_and_wait_for_stability()
-            self._check_if_valve_test_needs_to_stop()
-        self.save_csv_remotely()
+        self._check_if_valve_test_needs_to_stop()
+
+    def run(self, resume: bool = False) -> None:
+        """
+        Run the valve test. With resume=True the test continues from the state
+        loaded with restore_checkpoint instead of starting over.
+        """
+        self.running = True
+        if not resume:
+            self.start_time = self.clock.now()
+        self.profiler = PhaseProfiler(self.clock.now)
+        METRICS.reset()
+        if self.safety_monitor is not None:
+            self.safety_monitor.reset()
+            self.safety_monitor.on_trip.append(self._safety_trip)
+        streaming: bool = False
+        try:
+            if resume:
+                self._run_step(self._return_to_checkpoint_position)
+            elif COARSE_SCAN:
+                with self.profiler.phase("coarse scan"):
+                    self._run_step(self._move_to_fine_scan_start)
+            # Streaming gauges push readings instead of answering a request each
+            streaming = self.gauge.capabilities.streaming
+            if streaming:
+                self.gauge.start_streaming()  # type: ignore
+            while self.running:
+                self._run_step(self._test_step)
+                if self.running and self.save_results:
+                    self.save_checkpoint()
+        finally:
+            if streaming:
+                try:
+                    self.gauge.stop_streaming()  # type: ignore
+                except LinkLost as e:
+                    logger.warning("Could not leave continuous mode: %s", e)
+            if self.safety_monitor is not None:
+                self.safety_monitor.on_trip.remove(self._safety_trip)
+                # A tripped test must not be offered for resuming
+                if self.safety_monitor.tripped and self.save_results:
+                    self.discard_checkpoint()
+        if not self.save_results:
+            return
+        with self.profiler.phase("save"):
+            self.save_csv_remotely()
+            self.save_trace()
+            self.save_transients()
+            self.save_metrics()
+            self.save_serial_metrics()
+        if self.completed:
+            self.discard_checkpoint()
 
     def stop(self) -> None:
         self.running = False
-        if int(self.motor.query_position()) != 0:
-            self.motor.home_motor()
+        try:
+            if SWEEP_MODE:
+                # A sweep may have left the motor at SWEEP_VELOCITY
+                self.motor.set_velocity_and_acceleration(
+                    MOTOR_VELOCITY, MOTOR_ACCELERATION
+                )
+            if int(self.motor.query_position()) != 0:
+                self.motor.home_motor()
+        except LinkLost as e:
+            logger.error("Could not close the valve: %s", e)
@@ -1,29 +1,54 @@
+import logging
 import sys
 import time
 import traceback
 
 from matplotlib.figure import Figure
+from PySide6.QtCore import QTimer
 
-from api.agc100 import AGC100
 from api.motor import MotorController
-from api.pfeiffer_tpg26x import TPG261
+from api.pressure_gauge import PressureSource, create_gauge
+from api.serial_capture import RecordingSerial
+from api.serial_metrics import METRICS
+from api.transport import is_network_port
 from gui.error_messages import (
+    confirm_valve_closed_message,
+    confirm_zero_message,
     failed_to_connect_to_motor,
     failed_to_connect_to_pressure_gauge,
     failed_to_start_message,
+    resume_test_message,
 )
 from gui.gui import MainWindow, QApplication
 from gui.live_plot_window import LivePlotWindow
 from gui.normalized_plot_window import NormalizedPlotWindow
+from helpers.checkpoint import clear_checkpoint, load_checkpoint
 from helpers.constants import (
+    GAUGE_BAUD_RATE,
+    HOT_RECONNECT,
     MAX_VALVE_TURNS,
     MICROSTEPS_PER_REV,
     MICROSTEPS_PER_STEP,
+    MOTOR_ACCELERATION,
+    MOTOR_BAUD_RATE,
+    MOTOR_VELOCITY,
+    NEGOTIATE_BAUD_RATE,
+    RESULTS_DIR,
+    SAFETY_MONITOR,
+    SERIAL_CAPTURE,
+    SERIAL_METRICS,
     VERSION,
 )
 from helpers.ini_reader import find_comport, find_selection, get_ini_filepath, load_ini
+from helpers.link_setup import setup_link
+from helpers.link_supervisor import SupervisedDevice, SupervisedMotor
+from helpers.logging_setup import setup_logging
+from helpers.position_acquisition import PositionAcquisition
+from helpers.safety_monitor import ARM_TIME, SafetyMonitor
 from helpers.valve_test import ValveTest
 
+logger: logging.Logger = logging.getLogger(__name__)
+
 
 class App:
     def __init__(
@@ -33,27 +58,33 @@ class App:
         pressure_gauge_controller: str,
     ) -> None:
         self.app = QApplication([])
+        METRICS.enabled = SERIAL_METRICS
         self.gui = MainWindow()
         self.gui.setWindowTitle(f"Automated Valve Test v{VERSION}")
 
         try:
             self.motor: MotorController = self.connect_to_motor(motor_com_port)
-            print("CONNECTED TO MOTOR")
+            logger.info("CONNECTED TO MOTOR")
         except Exception as e:
-            print(f"COULD NOT CONNECT TO MOTOR\nException: {e}")
+            logger.exception("COULD NOT CONNECT TO MOTOR")
             full_traceback = traceback.format_exc()
             failed_to_connect_to_motor(self.gui, e, full_traceback)
         try:
             self.pressure_gauge = self.connect_to_pressure_gauge_controller(
                 pressure_gauge_com_port, pressure_gauge_controller
             )
-            print("CONNECTED TO GAUGE\n")
+            logger.info("CONNECTED TO GAUGE")
         except Exception as e:
             self.pressure_gauge = None
-            print(f"COULD NOT CONNECT TO PRESSURE GAUGE\nException: {e}\n")
+            logger.exception("COULD NOT CONNECT TO PRESSURE GAUGE")
             full_traceback = traceback.format_exc()
             failed_to_connect_to_pressure_gauge(self.gui, e, full_traceback)
 
+        self.safety_monitor: SafetyMonitor | None = None
+        if SAFETY_MONITOR and self.pressure_gauge:
+            self.safety_monitor = SafetyMonitor(self.motor, self.pressure_gauge)
+            self.safety_monitor.start()
+
         initial_motor_position: int = int(self.motor.query_position())
         initial_valve_position: float = initial_motor_position / MICROSTEPS_PER_REV
         self.gui.actual_position_reading.setText(f"{initial_valve_position:.2f}")
@@ -75,6 +106,11 @@ class App:
 
         self.valve_test: ValveTest | None = None
 
+        self.position_acquisition = PositionAcquisition(
+            self.motor, self._show_valve_position
+        )
+        self.position_acquisition.start()
+
         self.gui.show()
 
     def open_normalized_plot_window(self, figure: Figure) -> None:
@@ -104,6 +140,9 @@ class App:
         self.gui.rework_letter_input.setDisabled(False)
         self.gui.base_pressure_input.setDisabled(False)
 
+    def _show_valve_position(self, valve_position: float) -> None:
+        self.gui.actual_position_reading.setText(f"{valve_position:.2f}")
+
     def _set_position_text(self) -> None:
         motor_position: str = self.motor.query_position()
         if motor_position != "":
@@ -114,55 +153,95 @@ class App:
         motor_stop_point: int = int(valve_set_point * MICROSTEPS_PER_REV)
         motor_position: int = int(self.motor.query_position())
         valve_position: float = motor_position / MICROSTEPS_PER_REV
-        while motor_position != motor_stop_point:
+        while motor_position != motor_stop_point and self.motor.busy:
             time.sleep(0.25)
             motor_position: int = int(self.motor.query_position())
             valve_position: float = motor_position / MICROSTEPS_PER_REV
         self.gui.actual_position_reading.setText(f"{valve_position:.2f}")
 
-    def connect_to_motor(self, com_port: str) -> MotorController:
+    @staticmethod
+    def configure_motor(motor: MotorController) -> None:
+        """Send the motor settings; replayed after a reconnect."""
         microstep: int = MICROSTEPS_PER_STEP
         running_current: int = 100
         holding_current: int = 2
-        velocity: int = 300
-        acceleration: int = 50
+        velocity: int = MOTOR_VELOCITY
+        acceleration: int = MOTOR_ACCELERATION
         rotation_direction: str = "normal"
 
-        motor: MotorController = MotorController(port=com_port)
         motor.set_microsteps_per_step(microstep)
         motor.set_current(running_current, holding_current)
         motor.set_velocity_and_acceleration(velocity, acceleration)
         motor.set_rotation_direction(rotation_direction)
 
+    def connect_to_motor(self, com_port: str) -> MotorController:
+        motor: MotorController = MotorController(
+            port=com_port, baud_rate=MOTOR_BAUD_RATE
+        )
+        if SERIAL_CAPTURE:
+            motor.serial = self.capture_serial(motor.serial, "motor")
+        # The serial side of a device server is set on the device server
+        if NEGOTIATE_BAUD_RATE and not is_network_port(com_port):
+            setup_link(motor, "motor", "MOTOR_BAUD_RATE", MOTOR_BAUD_RATE)
+        self.configure_motor(motor)
+        if HOT_RECONNECT:
+            return SupervisedMotor(motor, configure=self.configure_motor)  # type: ignore
+
         return motor
 
     def connect_to_pressure_gauge_controller(
         self, com_port: str, controller: str
-    ) -> TPG261 | AGC100:
-        if controller == "pfeiffer":
-            return TPG261(port=com_port)
-        elif controller == "AGC100":
-            return AGC100(port=com_port)
-        else:
-            raise ValueError(f"Unsupported controller type: {controller}")
+    ) -> PressureSource:
+        gauge: PressureSource = create_gauge(
+            controller, port=com_port, baudrate=GAUGE_BAUD_RATE
+        )
+        if SERIAL_CAPTURE:
+            gauge.serial = self.capture_serial(gauge.serial, controller)  # type: ignore
+        if NEGOTIATE_BAUD_RATE and not is_network_port(com_port):
+            setup_link(gauge, "pressure gauge", "GAUGE_BAUD_RATE", GAUGE_BAUD_RATE)
+        # Readings are converted from this unit to the canonical unit
+        logger.info("Pressure gauge unit: %s", gauge.pressure_unit())
+        if HOT_RECONNECT:
+            return SupervisedDevice(gauge, "pressure gauge")  # type: ignore
+        return gauge
+
+    @staticmethod
+    def capture_serial(port, device: str) -> RecordingSerial:
+        """Record the traffic of a serial port to results/captures."""
+        timestamp: str = time.strftime("%Y-%m-%d_%H-%M-%S")
+        capture_path = RESULTS_DIR / "captures" / f"{device} {timestamp}.cap"
+        logger.info("Recording %s serial traffic to %s", device, capture_path)
+        return RecordingSerial(port, capture_path)
 
     def home_button_handler(self) -> None:
         self.motor.home_motor()
+        self.position_acquisition.wake()
         self.update_valve_position_until(valve_set_point=0)
 
     def set_zero_button_handler(self) -> None:
+        if not getattr(self.motor, "position_verified", True):
+            if not confirm_zero_message(self.gui):
+                return
         self.motor.set_zero()
         self.gui.actual_position_reading.setText("0.00")
 
     def open_button_pressed_handler(self) -> None:
+        if self.safety_monitor:
+            self.safety_monitor.reset()
+            self.safety_monitor.arm(float("inf"))
         self.motor.move_relative(MAX_VALVE_TURNS * MICROSTEPS_PER_REV)
+        self.position_acquisition.wake()
 
     def open_button_released_handler(self) -> None:
         self.motor.stop()
+        if self.safety_monitor:
+            self.safety_monitor.disarm()
+            self.safety_monitor.arm(ARM_TIME)
         self._set_position_text()
 
     def close_button_pressed_handler(self) -> None:
         self.motor.home_motor()  # close until zero is reached
+        self.position_acquisition.wake()
 
     def close_button_released_handler(self) -> None:
         self.motor.stop()
@@ -173,7 +252,13 @@ class App:
             target_valve_position: float = float(self.gui.go_to_position_input.text())
             command_position: int = int(target_valve_position * MICROSTEPS_PER_REV)
             self.gui.go_to_position_input.clear()
+            if self.safety_monitor:
+                self.safety_monitor.reset()
+                self.safety_monitor.arm(
+                    MAX_VALVE_TURNS * MICROSTEPS_PER_REV / MOTOR_VELOCITY + ARM_TIME
+                )
             self.motor.move_absolute(command_position)
+            self.position_acquisition.wake()
             self.update_valve_position_until(valve_set_point=target_valve_position)
 
     def start_test_button_handler(self) -> None:
@@ -182,32 +267,89 @@ class App:
             serial_number = self.gui.serial_number_input.text()
             rework_letter = self.gui.rework_letter_input.text()
             base_pressure = self.gui.base_pressure_input.text()
-            if self.pressure_gauge:
-                self.live_plot_window: LivePlotWindow = LivePlotWindow(
-                    serial_number, rework_letter, base_pressure, parent=self.gui
-                )
-                self.valve_test = ValveTest(
-                    self.motor,
-                    self.pressure_gauge,
-                    serial_number,
-                    rework_letter,
-                    base_pressure,
-                    self.gui.actual_position_reading,
-                    self.live_plot_window,
-                )
-                self.disable_gui()
-                self.valve_test.run()
-                self.enable_gui()
-                self.valve_test_fig = self.valve_test.plot_data()
-                self.open_normalized_plot_window(self.valve_test_fig)
-                self.valve_test = None
+            self.run_valve_test(serial_number, rework_letter, base_pressure)
         else:
-            print("\nThere is already a valve test running.\n")
+            logger.info("There is already a valve test running.")
+
+    def offer_to_resume_test(self) -> None:
+        """
+        Offer to resume a valve test that was interrupted by a crash or by
+        closing the application.
+        """
+        checkpoint: dict | None = load_checkpoint()
+        if checkpoint is None or not self.pressure_gauge:
+            return
+        if not resume_test_message(
+            self.gui,
+            checkpoint["serial_number"],
+            checkpoint["direction"],
+            checkpoint["valve_position"],
+            checkpoint["saved_at"],
+        ):
+            clear_checkpoint()
+            return
+        # A power cycled controller counts from 0 wherever the valve is
+        reported_position: int = int(self.motor.query_position())
+        if reported_position != checkpoint["motor_position"]:
+            if not confirm_valve_closed_message(
+                self.gui,
+                reported_position / MICROSTEPS_PER_REV,
+                checkpoint["valve_position"],
+            ):
+                clear_checkpoint()
+                return
+            self.motor.set_zero()
+        self.gui.serial_number_input.setText(checkpoint["serial_number"])
+        self.gui.rework_letter_input.setText(checkpoint["rework_letter"])
+        self.gui.base_pressure_input.setText(checkpoint["base_pressure"])
+        self.run_valve_test(
+            checkpoint["serial_number"],
+            checkpoint["rework_letter"],
+            checkpoint["base_pressure"],
+            checkpoint,
+        )
+
+    def run_valve_test(
+        self,
+        serial_number: str,
+        rework_letter: str,
+        base_pressure: str,
+        checkpoint: dict | None = None,
+    ) -> None:
+        if not self.pressure_gauge:
+            return
+        self.live_plot_window: LivePlotWindow = LivePlotWindow(
+            serial_number, rework_letter, base_pressure, parent=self.gui
+        )
+        self.valve_test = ValveTest(
+            self.motor,
+            self.pressure_gauge,
+            serial_number,
+            rework_letter,
+            base_pressure,
+            self.gui.actual_position_reading,
+            self.live_plot_window,
+            safety_monitor=self.safety_monitor,
+        )
+        if checkpoint is not None:
+            self.valve_test.restore_checkpoint(checkpoint)
+        self.disable_gui()
+        self.position_acquisition.pause()
+        self.valve_test.run(resume=checkpoint is not None)
+        self.position_acquisition.resume()
+        self.enable_gui()
+        self.valve_test_fig = self.valve_test.plot_data()
+        self.valve_test.save_profile()
+        self.open_normalized_plot_window(self.valve_test_fig)
+        self.valve_test = None
 
     def stop_test_button_handler(self) -> None:
         if self.valve_test and self.valve_test.running:
             self.valve_test.stop()
+            self.valve_test.discard_checkpoint()
+            self.position_acquisition.resume()
             self.valve_test_fig = self.valve_test.plot_data()
+            self.valve_test.save_profile()
             self.enable_gui()
             self.open_normalized_plot_window(self.valve_test_fig)
             self.valve_test = None
@@ -216,6 +358,9 @@ class App:
         """
         Ensure the COM ports close and valve test is stopped when the application closes.
         """
+        self.position_acquisition.stop()
+        if self.safety_monitor:
+            self.safety_monitor.stop()
         if self.motor:
             self.motor.close_port()
         if self.pressure_gauge:
@@ -226,11 +371,13 @@ class App:
 
     def run(self) -> None:
         self.app.aboutToQuit.connect(self.cleanup)
+        QTimer.singleShot(0, self.offer_to_resume_test)
         exit_code: int = self.app.exec()
         sys.exit(exit_code)
 
 
 def main() -> None:
+    setup_logging()
     ini_filepath: str = get_ini_filepath()
     config_data = load_ini(ini_filepath)
     motor_com_port: str = find_comport(config_data, "Motor")
@@ -246,7 +393,7 @@ if __name__ == "__main__":
     try:
         main()
     except Exception as e:
+        logger.exception("Failed to start application")
         full_traceback = traceback.format_exc()
-        print(f"Error: {e}\n{full_traceback}\n")
         failed_to_start_message(None, e, full_traceback)
         sys.exit()